@@ -2,11 +2,11 @@ import argparse, json, os, sys, time
 from pathlib import Path
 from tqdm import tqdm
 
-from modules.parse_pdf import parse_pdf_to_pages
-from modules.normalize_content import normalize_pages
-from modules.structure_detect import detect_headings
-from modules.chunking import chunk_documents
-from modules.qc_checks import build_report
+from modules.parse_pdf import parse_pdf_to_pages, iter_pdf_pages, sample_pdf_pages
+from modules.normalize_content import normalize_pages, iter_normalize_pages
+from modules.structure_detect import detect_headings, iter_headings
+from modules.chunking import chunk_documents, iter_chunks
+from modules.qc_checks import build_report, report_from_counts
 
 # Optional components (guard imports)
 def _import_embeddings():
@@ -18,35 +18,929 @@ def _import_embeddings():
 
 def _import_bm25():
     try:
-        from modules.bm25_index import build_bm25, build_tfidf, save_sparse_index
-        return build_bm25, build_tfidf, save_sparse_index
+        from modules.bm25_index import build_bm25, build_tfidf
+        return build_bm25, build_tfidf
     except Exception as e:
-        return None, None, None
+        return None, None
+
+def _with_dups(rows, dup_of):
+    # mark mode: duplicate rows carry the chunk_id of the kept row they repeat
+    if dup_of is None:
+        return rows
+    return ({**r, "dup_of": int(d) if d >= 0 else None} for r, d in zip(rows, dup_of))
+
+def save_dataset(chunks, work_dir, dataset_cfg=None, dup_of=None):
+    from modules.dataset_writer import write_dataset
+    # jsonl + parquet row groups in one pass
+    write_dataset(_with_dups(chunks, dup_of), work_dir, dataset_cfg)
+    return str(Path(work_dir) / "chunks.jsonl")
+
+def _export_embeddings(cfg, rows, store, out_dir):
+    # chunks.parquet again, now with the embedding column, when dataset.embeddings is set
+    from modules.dataset_writer import dataset_options, export_with_embeddings
+    dcfg = dataset_options(cfg.get("dataset"))
+    if dcfg["parquet"] and dcfg["embeddings"]:
+        export_with_embeddings(rows, store, out_dir, dcfg)
+
+def iter_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _windows(items, size):
+    from itertools import islice
+    it = iter(items)
+    while True:
+        part = list(islice(it, size))
+        if not part:
+            return
+        yield part
+
+def iter_paragraphs(pages):
+    import regex as re
+    for p in pages:
+        for para in re.split(r"\n{2,}", p["text"]):
+            t = para.strip()
+            if t:
+                yield {"page": p["page_num"], "text": t}
+
+def _regex_sections(paras):
+    # fallback for a failed LLM batch: regex headings over the batch's paragraphs
+    return detect_headings([{"page_num": x["page"], "text": x["text"]} for x in paras])
+
+def _qa_done(qa_path, want):
+    """
+    Chunk ids already answered in qa_path for the current chunks (matching "key"). A torn last
+    line from an interrupted run and lines for changed or removed chunks are dropped by
+    rewriting the file once; otherwise it is left untouched so the run can append.
+    """
+    done, keep, dirty = set(), [], False
+    if not Path(qa_path).exists():
+        return done
+    with open(qa_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                dirty = True
+                continue
+            cid = row.get("chunk_id")
+            if not line.endswith("\n") or want.get(cid) != row.get("key") or cid in done:
+                dirty = True
+                continue
+            done.add(cid)
+            keep.append(line)
+    if dirty:
+        tmp = Path(str(qa_path) + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(keep)
+        os.replace(tmp, qa_path)
+    return done
+
+def _qa_requests(todo, pack_below, pack_chars, max_pack, **_):
+    # (chunks, packed) per request: short chunks are grouped in order, the rest go alone
+    pack, size = [], 0
+    for ch in todo:
+        if not (pack_below and len(ch["text"]) < pack_below):
+            yield [ch], False
+            continue
+        if pack and (size + len(ch["text"]) > pack_chars or len(pack) >= max_pack):
+            yield pack, True
+            pack, size = [], 0
+        pack.append(ch)
+        size += len(ch["text"])
+    if pack:
+        yield pack, True
+
+def write_qa(llm, cache, chunks_fn, qa_path, opts=None):
+    """
+    chunks_fn() returns a fresh iterable of chunks. qa.jsonl is append-only: each line carries
+    its chunk's content key, finished chunks are skipped on the next run, so an interrupted
+    run resumes where it stopped. Per window, cached answers (keyed on chunk text, prompt
+    version, model and sampling settings) are looked up in bulk and the misses go out concurrently, short chunks packed
+    several to a request when "pack_below" is set. Failed chunks are left for the next run.
+    """
+    from modules.extractive_qa import DEFAULT_QA, make_qa, make_qa_packed, qa_hash, qa_key
+    opts = {**DEFAULT_QA, **(opts or {})}
+
+    def key(ch):
+        return qa_key(ch, packed=bool(opts["pack_below"]) and len(ch["text"]) < opts["pack_below"], model=llm.model)
+
+    want = {ch["chunk_id"]: qa_hash(key(ch)) for ch in chunks_fn()}
+    done = _qa_done(qa_path, want)
+    st = {"chunks": len(want), "resumed": len(done), "cached": 0, "generated": 0, "failed": 0,
+          "requests": 0, "packed_requests": 0}
+
+    def run(req):
+        part, packed = req
+        return make_qa_packed(llm, cache, part) if packed else [make_qa(llm, cache, part[0], lookup=False)]
 
-def save_dataset(chunks, work_dir):
-    import pandas as pd
-    import json
+    with open(qa_path, "a", encoding="utf-8") as fqa:
+        todo = (ch for ch in chunks_fn() if ch["chunk_id"] not in done)
+        for part in _windows(todo, opts["window"]):
+            # one bulk cache lookup per window; only misses go to the LLM
+            keys = [key(ch) for ch in part]
+            hits = cache.get_many(keys)
+            misses = [ch for ch, h in zip(part, hits) if not h]
+            results = {}
+            for (req, packed), out, e in llm.imap(run, list(_qa_requests(misses, **opts))):
+                st["requests"] += 1
+                st["packed_requests"] += int(packed)
+                for i, ch in enumerate(req):
+                    results[ch["chunk_id"]] = (out[i] if e is None else None, e)
+            for ch, k, hit in zip(part, keys, hits):
+                qa, e = (hit, None) if hit else results[ch["chunk_id"]]
+                if e is not None:
+                    st["failed"] += 1
+                    print("[warn] QA failed for chunk", ch["chunk_id"], e)
+                    continue
+                st["cached" if hit else "generated"] += 1
+                fqa.write(json.dumps({"chunk_id": ch["chunk_id"], "key": qa_hash(k), **qa}, ensure_ascii=False) + "\n")
+            # a finished window survives an interrupt
+            fqa.flush()
+    return st
+
+def _qa_opts(cfg):
+    from modules.extractive_qa import DEFAULT_QA
+    return {**DEFAULT_QA, **cfg.get("llm", {}).get("qa", {})}
+
+def write_report(report, reports_dir, llm=None, cache=None, prof=None):
+    if cache is not None:
+        report["llm_cache"] = cache.stats
+    if llm is not None:
+        report["llm"] = dict(llm.stats)
+    if prof is not None and prof.enabled:
+        report["profile"] = prof.as_dict(report)
+    with open(Path(reports_dir) / "report.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+def _chunk_texts(path, dups=None):
+    """
+    Chunk texts from chunks.jsonl or a Records("chunks") Arrow file (with dedup.npy as `dups`).
+    Dedup-marked duplicates become empty documents, so doc ids still equal chunk ids.
+    """
+    if str(path).endswith(".jsonl"):
+        return ("" if c.get("dup_of") is not None else c["text"] for c in iter_jsonl(path))
+    import numpy as np
+    from modules.records import Records
+    texts = Records.load("chunks", path).iter_column("text")
+    if dups is None:
+        return iter(texts)
+    return ("" if d >= 0 else t for t, d in zip(texts, np.load(dups)))
+
+def build_sparse_index(kind, chunks_path, indices_dir, dups=None, tfidf_opts=None):
+    """
+    Builds and saves one sparse index, "bm25" (indices_dir/bm25/) or "tfidf" (indices_dir/tfidf/,
+    streamed from the chunk file twice). Module-level and path-based so the scheduler can run it
+    in a worker process.
+    """
+    build_bm25, build_tfidf = _import_bm25()
+    if build_bm25 is None:
+        raise RuntimeError("modules.bm25_index unavailable")
+    if kind == "bm25":
+        build_bm25(_chunk_texts(chunks_path, dups)).save(Path(indices_dir) / "bm25")
+    else:
+        return build_tfidf(lambda: _chunk_texts(chunks_path, dups), Path(indices_dir) / "tfidf", **(tfidf_opts or {}))
+
+def run_streaming(cfg, llm, cache, work_dir, indices_dir, reports_dir, prof=None):
+    """
+    Bounded-memory mode: parse -> normalize -> structure -> chunk -> write are chained
+    generators, and later stages re-read chunks.jsonl in windows instead of holding lists.
+    Header/footer detection uses a sampled first pass over the PDF.
+    Chained stages are profiled by their own share of the pull time (Profiler.timed).
+    """
+    import numpy as np
+    from modules.profiling import active
+    prof = prof or active()
+    paths = cfg["paths"]
+    pcfg = cfg.get("pipeline", {})
+    llm_cfg = cfg.get("llm", {})
+    counts = {"pages": 0, "source_chars": 0, "chunks": 0, "chunk_chars": 0}
+    embed_stats, ocr_stats = {}, {}
+
+    def tap(pages):
+        from modules.ocr import tally_ocr
+        for p in pages:
+            counts["pages"] += 1
+            counts["source_chars"] += len(p["text"])
+            tally_ocr(ocr_stats, p)
+            yield p
+
+    # 1-4) Parse -> normalize -> structure -> chunk, one window of pages at a time
+    scfg = _structure_cfg(cfg, llm)
+    fonts = _want_fonts(scfg)
+    pages = prof.timed("parse", tap(iter_pdf_pages(paths["input_pdf"], ocr_if_needed=cfg["parse"]["ocr_if_needed"],
+                                                   workers=cfg["parse"].get("workers", 1),
+                                                   ocr_cfg=cfg["parse"].get("ocr"),
+                                                   window=pcfg.get("window_pages", 64), fonts=fonts)))
+    with prof.stage("sample") as rec:
+        sample = sample_pdf_pages(paths["input_pdf"], n=pcfg.get("header_sample_pages", 64), fonts=fonts)
+        rec["items"] = len(sample)
+    ncfg = _normalize_cfg(cfg)
+    norm_stats = {}
+    pages_norm = prof.timed("normalize", iter_normalize_pages(pages, sample, threshold=ncfg["threshold"],
+                                                              min_repeats=ncfg["min_repeats"], stats=norm_stats),
+                            upstream="parse")
+    struct_stats = {}
+    if scfg["mode"] == "hybrid":
+        from modules.structure_hybrid import body_font_size, iter_hybrid_sections
+        # body font size from the sampled pages
+        docs = iter_hybrid_sections(pages_norm, llm, cache, body_size=body_font_size(sample), stats=struct_stats,
+                                    sectioning=_section_opts(cfg), **scfg)
+    elif scfg["mode"] == "llm":
+        from modules.structure_llm import iter_llm_sections
+        docs = iter_llm_sections(llm, cache, iter_paragraphs(pages_norm), fallback=_regex_sections,
+                                 **_section_opts(cfg))
+    else:
+        docs = iter_headings(pages_norm)
+    docs = prof.timed("structure", docs, upstream="normalize")
+    chunks = prof.timed("chunk", iter_chunks(docs, target_chars=cfg["chunking"]["target_chars"],
+                                             overlap=cfg["chunking"]["overlap"]), upstream="structure")
+    ddcfg, dedup_stats = _dedup_cfg(cfg), {}
+    if ddcfg["enabled"]:
+        from modules.dedup import iter_dedup
+        chunks = prof.timed("dedup", iter_dedup(chunks, stats=dedup_stats, **ddcfg), upstream="chunk")
+
+    # 5) Save dataset (JSONL and Parquet row groups written as chunks arrive)
+    from modules.dataset_writer import DatasetWriter, dataset_options
     out_jsonl = Path(work_dir) / "chunks.jsonl"
-    out_parquet = Path(work_dir) / "chunks.parquet"
-    # write jsonl
-    with open(out_jsonl, "w", encoding="utf-8") as f:
+    with prof.stage("write", exclude="dedup" if ddcfg["enabled"] else "chunk") as rec, \
+            DatasetWriter(work_dir, **dataset_options(cfg.get("dataset"))) as w:
         for row in chunks:
+            counts["chunks"] += 1
+            counts["chunk_chars"] += len(row["text"])
+            w.write(row)
+        rec["items"] = counts["chunks"]
+
+    # dedup mark mode: rows with a dup_of stay in the dataset but skip QA, sparse indexing and embedding
+    def kept():
+        return (c for c in iter_jsonl(out_jsonl) if c.get("dup_of") is None)
+
+    def staged(name, fn, items=None):
+        def run():
+            with prof.stage(name) as rec:
+                out = fn()
+                rec["items"] = items
+            return out
+        return run
+
+    def embed():
+        embed_texts, _ = _import_embeddings()
+        if embed_texts is None:
+            raise RuntimeError("modules.embeddings unavailable")
+        vecs, row = None, 0
+        for part in _windows(iter_jsonl(out_jsonl), pcfg.get("window_chunks", 4096)):
+            # duplicates are not encoded: they copy their (earlier) kept row's vector
+            new = np.fromiter((c.get("dup_of") is None for c in part), dtype=bool, count=len(part))
+            # the first window always has a new row (its first), so vecs exists before v is None
+            v = embed_texts([c["text"] for c, k in zip(part, new) if k], stats=embed_stats,
+                            **_embed_kwargs(cfg, work_dir)) if new.any() else None
+            if vecs is None:
+                vecs = np.lib.format.open_memmap(Path(work_dir) / "embeddings.npy", mode="w+",
+                                                 dtype="float32", shape=(counts["chunks"], v.shape[1]))
+            if v is not None:
+                vecs[row + np.flatnonzero(new)] = v
+            dups = np.flatnonzero(~new)
+            if len(dups):
+                vecs[row + dups] = vecs[[part[i]["dup_of"] for i in dups]]
+            row += len(part)
+        if vecs is None:
+            raise ValueError("no chunks to embed")
+        _print_embed_stats(embed_stats)
+        vecs.flush()
+        _store_embeddings(cfg, vecs, work_dir)
+        return embed_stats
+
+    # 6-7) Post-write stages; independent ones run concurrently (modules.scheduler)
+    from modules.scheduler import StageGraph
+    graph = StageGraph(**_scheduler_cfg(cfg))
+    if llm is not None and llm_cfg.get("qa_pairs", True):
+        def qa():
+            with prof.stage("qa") as rec:
+                st = write_qa(llm, cache, kept, Path(work_dir) / "qa.jsonl", _qa_opts(cfg))
+                rec["items"] = st["chunks"]
+            return st
+        graph.add("qa", qa)
+    if cfg["bm25"]["enabled"]:
+        for kind in ("bm25", "tfidf"):
+            graph.add(kind, staged(kind, lambda kind=kind: graph.cpu(build_sparse_index, kind, str(out_jsonl),
+                                                                     str(indices_dir), None, _tfidf_cfg(cfg)),
+                                   counts["chunks"]), cpu=True)
+    if cfg["embeddings"]["enabled"]:
+        from modules.embed_store import EmbeddingStore
+        graph.add("embed", staged("embed", embed, counts["chunks"]))
+        dcfg = dataset_options(cfg.get("dataset"))
+        if dcfg["parquet"] and dcfg["embeddings"]:
+            graph.add("export", staged("export", lambda: _export_embeddings(cfg, iter_jsonl(out_jsonl),
+                                                                          EmbeddingStore(work_dir), work_dir),
+                                       counts["chunks"]), deps=["embed"])
+        if cfg.get("faiss", {}).get("enabled", False):
+            graph.add("faiss", staged("faiss", lambda: index_faiss(cfg, work_dir, indices_dir,
+                                                                   _kept_ids(iter_jsonl(out_jsonl)))), deps=["embed"])
+        if _want_pinecone(cfg):
+            graph.add("pinecone", staged("pinecone", lambda: push_pinecone(cfg, iter_jsonl(out_jsonl), work_dir,
+                                                                           pcfg.get("window_chunks", 4096))),
+                      deps=["embed"])
+    graph.run()
+    qa_stats = graph.results.get("qa") or {}
+    for name in ("faiss", "pinecone"):
+        if name in graph.results:
+            embed_stats[name] = graph.results[name]
+
+    # 8) QC report
+    report = report_from_counts(counts["pages"], counts["source_chars"], counts["chunks"], counts["chunk_chars"],
+                                dedup_stats)
+    if ocr_stats:
+        report["ocr"] = ocr_stats
+    if norm_stats:
+        report["normalize"] = norm_stats
+    if struct_stats:
+        report["structure"] = struct_stats
+    if qa_stats:
+        report["qa"] = qa_stats
+    if embed_stats:
+        report["embeddings"] = embed_stats
+    if graph.stages:
+        report["scheduler"] = graph.summary()
+    write_report(report, reports_dir, llm, cache, prof)
+    return str(out_jsonl)
+
+def write_jsonl(rows, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
             f.write(json.dumps(row, ensure_ascii=False) + "\n")
-    # parquet if available
-    try:
-        import pyarrow as pa
-        import pyarrow.parquet as pq
-        import pandas as pd
-        df = pd.DataFrame(chunks)
-        table = pa.Table.from_pandas(df, preserve_index=False)
-        pq.write_table(table, out_parquet)
-    except Exception:
-        pass
+    return str(path)
+
+def _normalize_cfg(cfg):
+    from modules.normalize_content import DEFAULT_NORMALIZE
+    return {**DEFAULT_NORMALIZE, **cfg.get("normalize", {})}
+
+def _dedup_cfg(cfg):
+    from modules.dedup import DEFAULT_DEDUP
+    return {**DEFAULT_DEDUP, **cfg.get("dedup", {})}
+
+def _tfidf_cfg(cfg):
+    from modules.bm25_index import DEFAULT_TFIDF
+    return {**DEFAULT_TFIDF, **cfg.get("bm25", {}).get("tfidf", {})}
+
+def _profile_cfg(cfg):
+    from modules.profiling import DEFAULT_PROFILE
+    return {**DEFAULT_PROFILE, **cfg.get("profile", {})}
+
+def _section_opts(cfg):
+    from modules.structure_llm import DEFAULT_SECTIONING
+    return {**DEFAULT_SECTIONING, **cfg.get("llm", {}).get("sectioning", {})}
+
+def _structure_cfg(cfg, llm):
+    """
+    structure block with "mode" resolved: auto -> llm when an LLM is configured with
+    llm.sectionize, else regex; llm without a client -> regex. hybrid runs without an LLM too
+    (local scores decide).
+    """
+    from modules.structure_hybrid import DEFAULT_STRUCTURE
+    scfg = {**DEFAULT_STRUCTURE, **cfg.get("structure", {})}
+    sectionize = llm is not None and cfg.get("llm", {}).get("sectionize", True)
+    if scfg["mode"] == "auto":
+        scfg["mode"] = "llm" if sectionize else "regex"
+    elif scfg["mode"] == "llm" and llm is None:
+        scfg["mode"] = "regex"
+    return scfg
+
+def _want_fonts(scfg):
+    return scfg["mode"] == "hybrid" and bool(scfg["fonts"])
+
+def _parse_slice(parse_cfg, fonts=False):
+    # only settings that change extracted text; worker counts do not
+    ocr = {k: v for k, v in (parse_cfg.get("ocr") or {}).items() if k not in ("workers", "prefetch")}
+    return {"ocr_if_needed": parse_cfg["ocr_if_needed"], "ocr": ocr, "fonts": fonts}
+
+def run_incremental(cfg, llm, cache, work_dir, indices_dir, reports_dir, resume=True, pool=None, prof=None):
+    """
+    Default (in-memory) mode with a stage manifest in work_dir. Each stage is keyed on its
+    upstream key + its config slice + its code version; unchanged stages are loaded from
+    their artifacts instead of recomputed. Pages, blocks and chunks are columnar Records;
+    intermediates live in work_dir/stages/ as Arrow IPC files and are memory-mapped on reload.
+    `pool` is a shared process pool for page extraction and the sparse index builds (batch mode).
+    Stages after chunking run concurrently where independent (modules.scheduler). Each stage
+    build (or reload, marked "skipped") is profiled under its stage name.
+    """
+    from modules.manifest import StageManifest, code_version, file_digest, stage_key
+    from modules.profiling import active
+    from modules.dataset_writer import arrow_available, dataset_options, parquet_slice
+    from modules.records import Records
+    import numpy as np
+    paths = cfg["paths"]
+    llm_cfg = cfg.get("llm", {})
+    manifest = StageManifest(work_dir, enabled=resume)
+    stage_dir = Path(work_dir) / "stages"; stage_dir.mkdir(parents=True, exist_ok=True)
+    memo = {}
+    prof = prof or active()
+
+    def _items(result):
+        return len(result) if isinstance(result, Records) else None
+
+    def run_stage(name, key, outputs, build, load, stats=None, resumable=False, complete=None, items=_items):
+        """
+        resumable: the build validates and extends its own partial outputs, so they are kept.
+        complete(result) False leaves the stage unrecorded, so the next run builds it again.
+        items(result) is the item count for the profile's items/s.
+        """
+        if name in memo:
+            return memo[name]
+        if manifest.fresh(name, key):
+            print(f"[skip] {name}: unchanged")
+            with prof.stage(name) as rec:
+                memo[name] = load()
+                rec["skipped"] = True
+            return memo[name]
+        manifest.invalidate(name)
+        # stale outputs must not count as this build's results if the build fails
+        if not resumable:
+            for o in outputs:
+                Path(o).unlink(missing_ok=True)
+        t0 = time.perf_counter()
+        with prof.stage(name) as rec:
+            memo[name] = build()
+            rec["items"] = items(memo[name])
+        if complete is None or complete(memo[name]):
+            manifest.record(name, key, outputs, time.perf_counter() - t0, stats=stats(memo[name]) if stats else None)
+        return memo[name]
+
+    # 1) Parse
+    scfg = _structure_cfg(cfg, llm)
+    fonts = _want_fonts(scfg)
+    k_parse = stage_key("parse", file_digest(paths["input_pdf"]), _parse_slice(cfg["parse"], fonts),
+                        code_version("modules.parse_pdf", "modules.ocr", "modules.records"))
+    f_pages = stage_dir / "pages.arrow"
+    ocr_stats = {}
+    def pages():
+        def build():
+            from modules.ocr import tally_ocr
+            rows = parse_pdf_to_pages(paths["input_pdf"], ocr_if_needed=cfg["parse"]["ocr_if_needed"],
+                                      workers=cfg["parse"].get("workers", 1), ocr_cfg=cfg["parse"].get("ocr"), pool=pool,
+                                      fonts=fonts)
+            for p in rows:
+                tally_ocr(ocr_stats, p)
+            recs = Records.from_rows("pages", rows)
+            recs.save(f_pages)
+            return recs
+        return run_stage("parse", k_parse, [f_pages], build, lambda: Records.load("pages", f_pages),
+                         stats=lambda recs: {"pages": len(recs), "source_chars": recs.total_chars(),
+                                             **({"ocr": ocr_stats} if ocr_stats else {})})
+
+    # 2) Normalize
+    ncfg = _normalize_cfg(cfg)
+    k_norm = stage_key("normalize", k_parse, {k: ncfg[k] for k in ("threshold", "min_repeats")},
+                       code_version("modules.normalize_content"))
+    f_norm = stage_dir / "pages_norm.arrow"
+    norm_stats = {}
+    def pages_norm():
+        def build():
+            recs = normalize_pages(pages(), workers=ncfg["workers"], threshold=ncfg["threshold"],
+                                   min_repeats=ncfg["min_repeats"], stats=norm_stats)
+            recs.save(f_norm)
+            return recs
+        return run_stage("normalize", k_norm, [f_norm], build, lambda: Records.load("pages", f_norm),
+                         stats=lambda _: norm_stats)
+
+    # 3) Structure
+    use_llm = llm is not None and scfg["mode"] in ("llm", "hybrid")
+    k_struct = stage_key("structure", k_norm, {"llm": use_llm, "model": llm.model if use_llm else None,
+                                               "sectioning": _section_opts(cfg) if use_llm else None,
+                                               "mode": scfg["mode"],
+                                               "hybrid": {k: scfg[k] for k in ("fonts", "min_confidence", "context",
+                                                                               "window")} if scfg["mode"] == "hybrid" else None},
+                         code_version("modules.structure_detect", "modules.structure_llm", "modules.structure_hybrid"))
+    f_blocks = stage_dir / "blocks.arrow"
+    struct_stats = {}
+    def docs():
+        def build():
+            blocks = None
+            if scfg["mode"] == "hybrid":
+                from modules.structure_hybrid import hybrid_sections
+                blocks = hybrid_sections(pages_norm(), llm, cache, stats=struct_stats, sectioning=_section_opts(cfg),
+                                         **scfg)
+                if struct_stats.get("llm_failed"):
+                    # not recorded, so the failed windows are retried next run
+                    return blocks
+            elif use_llm:
+                # Build page paragraphs
+                page_paras = list(iter_paragraphs(pages_norm()))
+                try:
+                    from modules.structure_llm import llm_sections
+                    blocks = Records.from_rows("blocks", llm_sections(llm, cache, page_paras, **_section_opts(cfg)))
+                except Exception as e:
+                    print("[warn] LLM sectionize failed, falling back:", e)
+                    blocks = detect_headings(pages_norm())
+                    # not recorded, so the LLM pass is retried next run
+                    return blocks
+            if blocks is None:
+                blocks = detect_headings(pages_norm())
+            blocks.save(f_blocks)
+            return blocks
+        return run_stage("structure", k_struct, [f_blocks], build, lambda: Records.load("blocks", f_blocks),
+                         stats=lambda _: struct_stats)
+
+    # 4) Chunk (+ near-duplicate detection)
+    dcfg = dataset_options(cfg.get("dataset"))
+    ddcfg = _dedup_cfg(cfg)
+    mark = ddcfg["enabled"] and ddcfg["action"] == "mark"
+    k_chunk = stage_key("chunk", k_struct, cfg["chunking"], ddcfg if ddcfg["enabled"] else None,
+                        code_version("modules.chunking", "modules.dedup"))
+    f_chunks = Path(work_dir) / "chunks.jsonl"
+    f_chunk_recs = stage_dir / "chunks.arrow"
+    f_dups = stage_dir / "dedup.npy"
+    chunk_stats = {}
+    def build_chunks():
+        recs = chunk_documents(docs(), target_chars=cfg["chunking"]["target_chars"], overlap=cfg["chunking"]["overlap"])
+        if ddcfg["enabled"]:
+            from modules.dedup import find_duplicates, dedup_stats, drop_duplicates
+            with prof.span("dedup.minhash", "dedup"):
+                dup_of, nd = find_duplicates(recs.iter_column("text"), **ddcfg)
+            chunk_stats["dedup"] = dedup_stats(nd, dup_of, recs.char_lengths(),
+                                               ddcfg["action"])
+            if mark:
+                np.save(f_dups, dup_of)
+            else:
+                recs = drop_duplicates(recs, dup_of)
+        recs.save(f_chunk_recs)
+        return recs
+    chunks = run_stage("chunk", k_chunk, [f_chunk_recs] + ([f_dups] if mark else []), build_chunks,
+                       lambda: Records.load("chunks", f_chunk_recs), stats=lambda _: chunk_stats)
+    dataset_path = str(f_chunks)
+    # mark mode: duplicates stay in the dataset but skip QA, sparse indexing and embedding
+    dup_of = np.load(f_dups) if mark else None
+    kept = (lambda rows: (r for r, d in zip(rows, dup_of) if d < 0)) if mark else (lambda rows: rows)
+
+    # 5-7) Everything after chunking needs only the chunks (FAISS, Pinecone and the Parquet
+    # embedding column also need the vectors), so independent stages run concurrently
+    from modules.scheduler import StageGraph
+    graph = StageGraph(**_scheduler_cfg(cfg), pool=pool)
+
+    # 5) Save dataset (output edge: dict rows only from here on)
+    f_parquet = [Path(work_dir) / "chunks.parquet"] if dcfg["parquet"] and arrow_available() else []
+    k_dataset = stage_key("dataset", k_chunk, parquet_slice(dcfg), code_version("modules.dataset_writer"))
+    graph.add("dataset", lambda: run_stage("dataset", k_dataset, [f_chunks] + f_parquet,
+                                           lambda: save_dataset(chunks, work_dir, dcfg, dup_of), lambda: None,
+                                           items=lambda _: len(chunks)))
+
+    # 5.1) Optional: LLM extractive QA per chunk
+    if llm is not None and llm_cfg.get("qa_pairs", True):
+        f_qa = Path(work_dir) / "qa.jsonl"
+        qcfg = _qa_opts(cfg)
+        k_qa = stage_key("qa", k_chunk, llm.model, {k: qcfg[k] for k in ("pack_below", "pack_chars", "max_pack")},
+                         code_version("modules.extractive_qa"))
+        # resumable: qa.jsonl is append-only and keyed per chunk; a run with failures stays unrecorded
+        graph.add("qa", lambda: run_stage("qa", k_qa, [f_qa],
+                                          lambda: write_qa(llm, cache, lambda: kept(iter(chunks)), f_qa, qcfg),
+                                          lambda: manifest.stats("qa"), stats=lambda st: st, resumable=True,
+                                          complete=lambda st: not st["failed"], items=lambda st: st["chunks"]))
+
+    # 6) Optional: BM25/TFIDF, built from chunks.arrow in worker processes
+    if cfg["bm25"]["enabled"]:
+        outputs = {"bm25": indices_dir / "bm25" / "meta.json", "tfidf": indices_dir / "tfidf" / "meta.json"}
+        opts = {"bm25": {}, "tfidf": _tfidf_cfg(cfg)}
+        for kind in ("bm25", "tfidf"):
+            k_sparse = stage_key(kind, k_chunk, opts[kind], code_version("modules.bm25_index"))
+            build = lambda kind=kind: graph.cpu(build_sparse_index, kind, str(f_chunk_recs), str(indices_dir),
+                                                str(f_dups) if mark else None, opts[kind])
+            graph.add(kind, lambda kind=kind, k=k_sparse, build=build: run_stage(
+                kind, k, [outputs[kind]], build, lambda: None, items=lambda _: len(chunks)), cpu=True)
+
+    # 7) Optional: Embeddings, then FAISS, Pinecone and the Parquet embedding column from the stored vectors
+    if cfg["embeddings"]["enabled"]:
+        from modules.embed_store import EmbeddingStore
+        ecfg = cfg["embeddings"]
+        # only what changes the stored vectors; batching / workers / cache settings are throughput knobs
+        k_embed = stage_key("embed", k_chunk, ecfg.get("model_name"),
+                            ecfg.get("device", "cpu"), ecfg.get("format", "float32"), ecfg.get("keep_full", True),
+                            code_version("modules.embeddings", "modules.embed_store"))
+        graph.add("embed", lambda: run_stage("embed", k_embed, [Path(work_dir) / "embeddings.json"],
+                                             lambda: embed_chunks(cfg, chunks, work_dir, dup_of), lambda: manifest.stats("embed"),
+                                             stats=lambda st: st, items=lambda _: len(chunks)))
+        if f_parquet and dcfg["embeddings"]:
+            k_export = stage_key("export", k_dataset, k_embed)
+            graph.add("export", lambda: run_stage("export", k_export, f_parquet,
+                                                  lambda: _export_embeddings(cfg, _with_dups(chunks, dup_of),
+                                                                             EmbeddingStore(work_dir), work_dir),
+                                                  lambda: None, items=lambda _: len(chunks)),
+                      deps=["dataset", "embed"])
+        if cfg.get("faiss", {}).get("enabled", False):
+            k_faiss = stage_key("faiss", k_embed, cfg["faiss"], code_version("modules.faiss_index"))
+            ids = np.flatnonzero(dup_of < 0) if mark else None
+            graph.add("faiss", lambda: run_stage("faiss", k_faiss, [indices_dir / "faiss.index"],
+                                                 lambda: index_faiss(cfg, work_dir, indices_dir, ids),
+                                                 lambda: manifest.stats("faiss"), stats=lambda st: st),
+                      deps=["embed"])
+        if _want_pinecone(cfg):
+            k_pine = stage_key("pinecone", k_embed, cfg["vectordb"], code_version("modules.vectordb_pinecone"))
+            n_kept = len(chunks) - (int((dup_of >= 0).sum()) if mark else 0)
+            # the sync state is the output: resumable keeps it for the delta, and a missing state
+            # or a sync that did not cover every kept row makes the stage run again
+            graph.add("pinecone", lambda: run_stage("pinecone", k_pine, [Path(work_dir) / "pinecone_sync.json"],
+                                                    lambda: push_pinecone(cfg, _with_dups(chunks, dup_of), work_dir),
+                                                    lambda: manifest.stats("pinecone"), stats=lambda st: st,
+                                                    resumable=True,
+                                                    complete=lambda st: st["upserted"] + st["unchanged"] == n_kept),
+                      deps=["embed"])
+    graph.run()
+
+    # 8) QC report
+    parse_stats = manifest.stats("parse")
+    if not parse_stats:
+        ps = pages()
+        parse_stats = {"pages": len(ps), "source_chars": ps.total_chars()}
+    report = report_from_counts(parse_stats["pages"], parse_stats["source_chars"], len(chunks), chunks.total_chars(),
+                                manifest.stats("chunk").get("dedup"))
+    if parse_stats.get("ocr"):
+        report["ocr"] = parse_stats["ocr"]
+    if manifest.stats("normalize"):
+        report["normalize"] = manifest.stats("normalize")
+    if manifest.stats("structure"):
+        report["structure"] = manifest.stats("structure")
+    if graph.results.get("qa"):
+        report["qa"] = graph.results["qa"]
+    embed_stats = dict(graph.results.get("embed") or {})
+    for name in ("faiss", "pinecone"):
+        if graph.results.get(name):
+            embed_stats[name] = graph.results[name]
+    if embed_stats:
+        report["embeddings"] = embed_stats
+    if graph.stages:
+        report["scheduler"] = graph.summary()
+    write_report(report, reports_dir, llm, cache, prof)
+    return dataset_path
+
+def _embed_kwargs(cfg, work_dir):
+    ecfg = cfg["embeddings"]
+    return {"model_name": ecfg.get("model_name", None), "device": ecfg.get("device", "cpu"),
+            "cache_dir": str(Path(work_dir) / "emb_cache") if ecfg.get("cache", True) else None,
+            "batching": {k: ecfg[k] for k in ("token_budget", "max_batch", "workers") if k in ecfg}}
+
+def _print_embed_stats(st):
+    if st.get("tokens"):
+        print(f"[embed] {st['encoded']} encoded, {st['cached']} cached, {st['batches']} batches, "
+              f"{st['tokens_per_s']} tokens/s")
+
+def _store_embeddings(cfg, vecs, out_dir):
+    from modules.embed_store import EmbeddingStore, save_embeddings
+    ecfg = cfg["embeddings"]
+    save_embeddings(vecs, out_dir, fmt=ecfg.get("format", "float32"), keep_full=ecfg.get("keep_full", True))
+    return EmbeddingStore(out_dir)
+
+def embed_chunks(cfg, chunks, work_dir, dup_of=None):
+    """
+    chunks: Records("chunks"). Encodes and stores the vectors; returns embed stats
+    (cached/encoded counts) for the manifest and report. dup_of (dedup mark mode): duplicate
+    rows are not encoded; they get their kept row's vector.
+    """
+    import numpy as np
+    embed_texts, _ = _import_embeddings()
+    if embed_texts is None:
+        raise RuntimeError("modules.embeddings unavailable")
+    embed_stats = {}
+    texts = chunks.to_list("text")
+    keep = None if dup_of is None else np.flatnonzero(np.asarray(dup_of) < 0)
+    vecs = embed_texts(texts if keep is None else [texts[i] for i in keep], stats=embed_stats,
+                       **_embed_kwargs(cfg, work_dir))
+    if keep is not None:
+        from modules.dedup import fill_duplicates
+        full = np.zeros((len(texts), vecs.shape[1]), dtype=vecs.dtype)
+        full[keep] = vecs
+        vecs = fill_duplicates(full, dup_of)
+    _print_embed_stats(embed_stats)
+    # Save in the configured storage format; downstream consumers read the stored vectors
+    _store_embeddings(cfg, vecs, work_dir)
+    return embed_stats
+
+def index_faiss(cfg, work_dir, indices_dir, ids=None):
+    """
+    FAISS index over the stored vectors; `ids` (kept rows, dedup mark mode) limits it to those.
+    """
+    from modules.embed_store import EmbeddingStore
+    _, save_faiss_index = _import_embeddings()
+    if save_faiss_index is None:
+        raise RuntimeError("modules.embeddings unavailable")
+    vecs = EmbeddingStore(work_dir).float32()
+    if ids is not None:
+        vecs = vecs[ids]
+    return save_faiss_index(vecs, list(range(len(vecs))) if ids is None else list(ids), Path(indices_dir) / "faiss.index",
+                            metric=cfg["faiss"].get("metric", "ip"), index_cfg=cfg["faiss"])
+
+def push_pinecone(cfg, rows, work_dir, window=4096):
+    """
+    Delta-syncs the stored vectors of `rows` (chunk dicts aligned with them) to Pinecone a
+    window at a time; dedup-marked duplicates are left out.
+    """
+    from modules.embed_store import EmbeddingStore
+    from modules.vectordb_pinecone import PineconeSync
+    store = EmbeddingStore(work_dir)
+    sync = PineconeSync(cfg, state_path=Path(work_dir) / "pinecone_sync.json")
+    row = 0
+    for part in _windows(rows, window):
+        keep = [j for j, c in enumerate(part) if c.get("dup_of") is None]
+        if keep:
+            sync.upsert(store.float32(row, row + len(part))[keep], [part[j] for j in keep])
+        row += len(part)
+    st = sync.finish()
+    print("Pinecone sync complete:", st)
+    return st
+
+def _kept_ids(rows):
+    # row numbers without a dup_of (dedup mark mode); None when no row is marked
+    ids, marked = [], False
+    for i, c in enumerate(rows):
+        if c.get("dup_of") is None:
+            ids.append(i)
+        else:
+            marked = True
+    return ids if marked else None
+
+def _want_pinecone(cfg):
+    vcfg = cfg.get("vectordb", {})
+    return bool(vcfg) and vcfg.get("provider") == "pinecone"
+
+def _scheduler_cfg(cfg):
+    from modules.scheduler import DEFAULT_SCHEDULER
+    return {**DEFAULT_SCHEDULER, **cfg.get("scheduler", {})}
+
+def _batch_inputs(spec):
+    """
+    spec: a directory of PDFs, a .json list of paths, or a text file with one path per line.
+    """
+    p = Path(spec)
+    if p.is_dir():
+        return sorted(p.glob("*.pdf"))
+    if p.suffix == ".json":
+        with open(p, "r", encoding="utf-8") as f:
+            return [Path(x) for x in json.load(f)]
+    with open(p, "r", encoding="utf-8") as f:
+        return [Path(ln.strip()) for ln in f if ln.strip() and not ln.lstrip().startswith("#")]
+
+def _book_names(pdfs):
+    names, seen = [], {}
+    for pdf in pdfs:
+        stem = Path(pdf).stem
+        seen[stem] = seen.get(stem, 0) + 1
+        names.append(stem if seen[stem] == 1 else f"{stem}-{seen[stem]}")
+    return names
+
+def _run_book(cfg, llm, cache, pdf, book_dir, pool, workers, resume):
+    import copy
+    from modules.profiling import Profiler, active
+    bcfg = copy.deepcopy(cfg)
+    bcfg["paths"] = {"input_pdf": str(pdf), "work_dir": str(book_dir / "work"),
+                     "indices_dir": str(book_dir / "indices"), "reports_dir": str(book_dir / "reports")}
+    bcfg["parse"]["workers"] = workers
+    dirs = [Path(bcfg["paths"][k]) for k in ("work_dir", "indices_dir", "reports_dir")]
+    for d in dirs:
+        d.mkdir(parents=True, exist_ok=True)
+    # stages per book in the book's report; hot-loop spans of all books go to the batch profile
+    prof = Profiler(**{**_profile_cfg(cfg), "trace": False})
+    with active().stage(f"book:{Path(book_dir).name}"):
+        if bcfg.get("pipeline", {}).get("streaming", False):
+            run_streaming(bcfg, llm, cache, *dirs, prof=prof)
+        else:
+            run_incremental(bcfg, llm, cache, *dirs, resume=resume, pool=pool, prof=prof)
+    return bcfg["paths"]
+
+def run_batch(cfg, llm, cache, inputs, resume=True):
+    """
+    Ingests many PDFs in one process: books run concurrently on a thread pool (largest first)
+    and shard their pages onto one shared process pool, with one LLM client, one LLM cache and
+    one loaded embedding model. Per-book outputs go to <out_dir>/<book>/; with batch.merge the
+    books are combined into <out_dir>/merged/.
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+    from modules.parse_pdf import _resolve_workers
+    bcfg = cfg.get("batch", {})
+    out_dir = Path(bcfg.get("out_dir", "data/batch"))
+    pdfs = [Path(p) for p in inputs]
+    names = _book_names(pdfs)
+    workers = _resolve_workers(cfg["parse"].get("workers", 0))
+    order = sorted(range(len(pdfs)), key=lambda i: -pdfs[i].stat().st_size)
+    done = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            ThreadPoolExecutor(max_workers=max(1, bcfg.get("books_in_flight", 2))) as ex:
+        futs = {ex.submit(_run_book, cfg, llm, cache, pdfs[i], out_dir / names[i], pool, workers, resume): i
+                for i in order}
+        for fut in as_completed(futs):
+            i = futs[fut]
+            try:
+                done[i] = fut.result()
+                print(f"[batch] {names[i]} done")
+            except Exception as e:
+                print(f"[warn] book {names[i]} failed:", e, file=sys.stderr)
+    books = [(names[i], done[i]) for i in range(len(pdfs)) if i in done]
+    if bcfg.get("merge", True) and books:
+        merge_books(cfg, books, out_dir / "merged")
+    return out_dir
+
+def merge_books(cfg, books, merged_dir):
+    """
+    Concatenates per-book chunks (and embeddings when every book has them, with equal dims)
+    in input order. Chunk IDs are renumbered globally; rows keep book and book_chunk_id.
+    Sparse and FAISS indexes are rebuilt over the merged corpus. With dedup enabled,
+    near-duplicates are found again across books (dup_of / drop as in the per-book runs).
+    """
+    import numpy as np
+    indices_dir = merged_dir / "indices"; indices_dir.mkdir(parents=True, exist_ok=True)
+    out_jsonl = merged_dir / "chunks.jsonl"
+    n, chars, pages, source_chars, per_book = 0, 0, 0, 0, {}
+    # cross-book near-duplicates: per-book passes only see their own book
+    ddcfg = _dedup_cfg(cfg)
+    nd, dup_of, keep, lens = None, [], [], []
+    if ddcfg["enabled"]:
+        from modules.dedup import NearDuplicates, dedup_stats
+        nd = NearDuplicates(**ddcfg)
+    drop = nd is not None and ddcfg["action"] == "drop"
+    from modules.dataset_writer import DatasetWriter, dataset_options
+    with DatasetWriter(merged_dir, **dataset_options(cfg.get("dataset"))) as w:
+        for name, paths in books:
+            start = n
+            for row in iter_jsonl(Path(paths["work_dir"]) / "chunks.jsonl"):
+                out = {**row, "chunk_id": n, "book": name, "book_chunk_id": row["chunk_id"]}
+                if nd is not None:
+                    canon = nd.add(n, row["text"])
+                    dup_of.append(-1 if canon is None else canon)
+                    lens.append(len(row["text"]))
+                    keep.append(canon is None)
+                    if drop and canon is not None:
+                        continue
+                    if not drop:
+                        out["dup_of"] = canon
+                w.write(out)
+                n += 1
+                chars += len(row["text"])
+            with open(Path(paths["reports_dir"]) / "report.json", "r", encoding="utf-8") as rf:
+                per_book[name] = json.load(rf)
+            per_book[name]["chunk_id_range"] = [start, n]
+            pages += per_book[name]["pages"]
+            source_chars += per_book[name]["source_chars"]
+
+    mark = nd is not None and not drop
+    from modules.scheduler import StageGraph
+    graph = StageGraph(**_scheduler_cfg(cfg))
+    if cfg["bm25"]["enabled"]:
+        for kind in ("bm25", "tfidf"):
+            graph.add(kind, lambda kind=kind: graph.cpu(build_sparse_index, kind, str(out_jsonl), str(indices_dir),
+                                                        None, _tfidf_cfg(cfg)), cpu=True)
+
+    def merge_embeddings():
+        mats = [EmbeddingStore(p["work_dir"]) for _, p in books]
+        sel = np.asarray(keep, dtype=bool) if drop else None
+        if len({m.dim for m in mats}) != 1 or sum(len(m) for m in mats) != (len(sel) if drop else n):
+            raise ValueError("dims or row counts differ across books")
+        vecs = np.lib.format.open_memmap(merged_dir / "embeddings.npy", mode="w+", dtype="float32",
+                                         shape=(n, mats[0].dim))
+        row, src = 0, 0
+        for m in mats:
+            block = m.float32()
+            if drop:
+                block = block[sel[src:src + len(m)]]
+                src += len(m)
+            vecs[row:row + len(block)] = block
+            row += len(block)
+        vecs.flush()
+        _store_embeddings(cfg, vecs, merged_dir)
+
+    if cfg["embeddings"]["enabled"]:
+        from modules.embed_store import EmbeddingStore
+        if all(EmbeddingStore.exists(p["work_dir"]) for _, p in books):
+            graph.add("embed", merge_embeddings)
+            dcfg = dataset_options(cfg.get("dataset"))
+            if dcfg["parquet"] and dcfg["embeddings"]:
+                graph.add("export", lambda: _export_embeddings(cfg, iter_jsonl(out_jsonl), EmbeddingStore(merged_dir),
+                                                               merged_dir), deps=["embed"])
+            if cfg.get("faiss", {}).get("enabled", False):
+                ids = np.flatnonzero(np.asarray(keep, dtype=bool)) if mark else None
+                graph.add("faiss", lambda: index_faiss(cfg, merged_dir, indices_dir, ids), deps=["embed"])
+        else:
+            print("[warn] embeddings not merged: some books have no stored embeddings", file=sys.stderr)
+    graph.run()
+    report_faiss = graph.results.get("faiss")
+
+    report = report_from_counts(pages, source_chars, n, chars,
+                                dedup_stats(nd, dup_of, lens, ddcfg["action"]) if nd is not None else None)
+    if report_faiss:
+        report["faiss"] = report_faiss
+    if graph.stages:
+        report["scheduler"] = graph.summary()
+    report["books"] = per_book
+    from modules.profiling import active
+    if active().enabled:
+        report["profile"] = active().as_dict()
+    with open(merged_dir / "report.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
     return str(out_jsonl)
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True, help="Path to config JSON")
+    ap.add_argument("--force", action="store_true", help="Ignore the stage manifest and rebuild every stage")
+    ap.add_argument("--batch", default=None,
+                    help="Directory of PDFs or a manifest (.json list / one path per line); overrides batch.inputs")
     args = ap.parse_args()
 
     with open(args.config, "r", encoding="utf-8") as f:
@@ -64,103 +958,43 @@ def main():
     cache = None
     if llm_enabled:
         from modules.llm_client import LLMClient
-        from modules.cache import DiskCache
-        llm = LLMClient(base_url=llm_cfg.get("base_url"), model=llm_cfg.get("model"))
-        cache = DiskCache(root=str(Path(paths["work_dir"]) / "llm_cache"))
-
-    # 1) Parse
-    pages = parse_pdf_to_pages(paths["input_pdf"], ocr_if_needed=cfg["parse"]["ocr_if_needed"])
+        from modules.cache import open_cache
+        llm = LLMClient(base_url=llm_cfg.get("base_url"), model=llm_cfg.get("model"),
+                        timeout=llm_cfg.get("timeout", 120), max_inflight=llm_cfg.get("max_inflight", 8),
+                        max_retries=llm_cfg.get("max_retries", 5))
+        cache = open_cache(paths["work_dir"], llm_cfg.get("cache"))
 
-    # 2) Normalize
-    pages_norm = normalize_pages(pages)
+    # === Profiling: stage timings in report.json, optional trace / sampled stacks ===
+    from modules.profiling import Profiler, StackSampler, activate
+    pcfg = _profile_cfg(cfg)
+    prof = activate(Profiler(**pcfg))
+    sampler = StackSampler(pcfg["sample_interval_ms"]).start() if pcfg["sample_interval_ms"] else None
 
-    # 3) Structure
-    docs = None
-    if llm_enabled and llm_cfg.get("sectionize", True):
-        # Build page paragraphs
-        import regex as re
-        page_paras = []
-        for p in pages_norm:
-            for para in re.split(r"\n{2,}", p["text"]):
-                t = para.strip()
-                if t:
-                    page_paras.append({"page": p["page_num"], "text": t})
-        try:
-            from modules.structure_llm import llm_sections
-            blocks = llm_sections(llm, cache, page_paras)
-            docs = blocks
-        except Exception as e:
-            print("[warn] LLM sectionize failed, falling back:", e)
-    if docs is None:
-        docs = detect_headings(pages_norm)
-
-    # 4) Chunk
-    chunks = chunk_documents(docs, target_chars=cfg["chunking"]["target_chars"], overlap=cfg["chunking"]["overlap"])
-
-    # 5) Save dataset
-    dataset_path = save_dataset(chunks, work_dir)
-    # 5.1) Optional: LLM extractive QA per chunk
-    if llm_enabled and llm_cfg.get("qa_pairs", True):
-        from modules.extractive_qa import make_qa
-        import json
-        qa_path = Path(work_dir) / "qa.jsonl"
-        with open(qa_path, "w", encoding="utf-8") as fqa:
-            for ch in chunks:
-                try:
-                    qa = make_qa(llm, cache, ch)
-                    fqa.write(json.dumps({"chunk_id": ch["chunk_id"], **qa}, ensure_ascii=False) + "\\n")
-                except Exception as e:
-                    print("[warn] QA failed for chunk", ch["chunk_id"], e)
-
-
-    # 6) Optional: BM25/TFIDF
-    if cfg["bm25"]["enabled"]:
-        build_bm25, build_tfidf, save_sparse_index = _import_bm25()
-        if build_bm25 is not None:
-            try:
-                bm25_obj = build_bm25([c["text"] for c in chunks])
-                save_sparse_index(bm25_obj, indices_dir / "bm25.pkl")
-            except Exception as e:
-                print("[warn] BM25 build failed:", e, file=sys.stderr)
-        if build_tfidf is not None:
-            try:
-                tfidf = build_tfidf([c["text"] for c in chunks])
-                save_sparse_index(tfidf, indices_dir / "tfidf.pkl")
-            except Exception as e:
-                print("[warn] TFIDF build failed:", e, file=sys.stderr)
-
-    # 7) Optional: Embeddings + FAISS
-    if cfg["embeddings"]["enabled"]:
-        embed_texts, save_faiss_index = _import_embeddings()
-        if embed_texts is not None:
-            try:
-                vecs = embed_texts([c["text"] for c in chunks], model_name=cfg["embeddings"].get("model_name", None), device=cfg["embeddings"].get("device", "cpu"))
-                # Save basic .npy for embeddings
-                import numpy as np
-                import json
-                import pathlib
-                np.save(pathlib.Path(work_dir) / "embeddings.npy", vecs)
-                # Optional: push to Pinecone if configured
-                try:
-                    vcfg = cfg.get("vectordb", {})
-                    if vcfg and vcfg.get("provider") == "pinecone":
-                        from modules.vectordb_pinecone import push_to_pinecone
-                        push_to_pinecone(vecs, chunks, cfg)
-                        print("Pinecone upsert complete.")
-                except Exception as e:
-                    print("[warn] Pinecone push failed:", e, file=sys.stderr)
-
-                if cfg.get("faiss", {}).get("enabled", False) and save_faiss_index is not None:
-                    metric = cfg["faiss"].get("metric", "ip")
-                    ids = list(range(len(chunks)))
-                    save_faiss_index(vecs, ids, indices_dir / "faiss.index", metric=metric)
-            except Exception as e:
-                print("[warn] Embeddings/FAISS failed:", e, file=sys.stderr)
+    resume = cfg.get("pipeline", {}).get("resume", True) and not args.force
+    batch_spec = args.batch or cfg.get("batch", {}).get("inputs")
+    streaming = cfg.get("pipeline", {}).get("streaming", False)
+    try:
+        if batch_spec:
+            inputs = batch_spec if isinstance(batch_spec, list) else _batch_inputs(batch_spec)
+            out_dir = run_batch(cfg, llm, cache, inputs, resume=resume)
+            # batch-level profile artifacts go next to the merged output
+            reports_dir = out_dir
+        elif streaming:
+            dataset_path = run_streaming(cfg, llm, cache, work_dir, indices_dir, reports_dir, prof=prof)
+        else:
+            dataset_path = run_incremental(cfg, llm, cache, work_dir, indices_dir, reports_dir, resume=resume,
+                                           prof=prof)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            print("Sampled stacks:", sampler.write(Path(reports_dir) / "profile.folded"))
+        if pcfg["trace"]:
+            print("Trace:", prof.write_trace(Path(reports_dir) / "trace.json"))
 
-    # 8) QC report
-    report = build_report(pages, chunks)
-    with open(Path(reports_dir) / "report.json", "w", encoding="utf-8") as f:
-        json.dump(report, f, ensure_ascii=False, indent=2)
+    if batch_spec:
+        print("DONE")
+        print("Batch output:", out_dir)
+        return
 
     print("DONE")
     print("Dataset:", dataset_path)
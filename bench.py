@@ -0,0 +1,268 @@
+import argparse, json, platform, statistics, subprocess, sys, tempfile, time
+from pathlib import Path
+
+from modules.profiling import Profiler
+from modules.synth_book import DEFAULT_SYNTH, make_book
+
+# Stages in pipeline order -> the earlier stages whose outputs (in `ctx`) they consume.
+DEPS = {
+    "parse": [], "parse_fonts": [], "ocr": [],
+    "normalize": ["parse"],
+    "structure_regex": ["normalize"], "structure_hybrid": ["parse_fonts"], "structure_llm": ["normalize"],
+    "structure_hybrid_llm": ["parse_fonts"],
+    "chunk": ["structure_regex"],
+    "dedup": ["chunk"], "qa": ["chunk"], "sparse": ["chunk"], "embed": ["chunk"],
+}
+STAGES = list(DEPS)
+MIN_SECONDS = 0.005  # stages faster than this in both runs are never flagged (timer noise)
+
+class Skip(Exception):
+    pass
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def _book(work: Path, synth: dict) -> Path:
+    # generated once per option set; the file name is a digest of the options
+    import hashlib
+    digest = hashlib.sha256(json.dumps(synth, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    pdf = work / f"synth-{digest}.pdf"
+    if not pdf.exists():
+        t0 = time.perf_counter()
+        make_book(pdf, **synth)
+        print(f"[bench] generated {pdf.name} ({synth['pages']} pages) in {time.perf_counter() - t0:.1f}s")
+    return pdf
+
+def _llm(args, srv):
+    from modules.llm_client import LLMClient
+    return LLMClient(base_url=srv.base_url, model="stub", max_inflight=args.max_inflight, max_retries=0)
+
+def _fresh_cache(tmp: Path):
+    # a new cache per run so every LLM stage pays for its requests
+    from modules.cache import DiskCache
+    return DiskCache(tempfile.mkdtemp(dir=tmp))
+
+def stage_fns(args, ctx, tmp, srv):
+    """
+    name -> fn() returning (output, item count). Outputs feed later stages through ctx.
+    """
+    from modules.records import Records
+    from modules.parse_pdf import parse_pdf_to_pages
+    from modules.normalize_content import normalize_pages
+    from modules.structure_detect import detect_headings
+    from modules.structure_hybrid import hybrid_sections
+    from modules.structure_llm import iter_llm_sections
+    from modules.chunking import chunk_documents
+    from app import iter_paragraphs, write_qa, _regex_sections
+    pdf = ctx["pdf"]
+
+    def parse():
+        recs = Records.from_rows("pages", parse_pdf_to_pages(str(pdf)))
+        return recs, len(recs)
+
+    def parse_fonts():
+        recs = Records.from_rows("pages", parse_pdf_to_pages(str(pdf), fonts=True))
+        return recs, len(recs)
+
+    def ocr():
+        if not args.scanned:
+            raise Skip("no scanned pages (--scanned)")
+        try:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+        except Exception as e:
+            raise Skip(f"tesseract unavailable: {e}")
+        pages = parse_pdf_to_pages(str(pdf), ocr_if_needed=True)
+        return pages, args.scanned
+
+    def normalize():
+        recs = normalize_pages(ctx["parse"])
+        return recs, len(recs)
+
+    def structure_regex():
+        blocks = detect_headings(ctx["normalize"])
+        return blocks, len(ctx["normalize"])
+
+    def structure_hybrid():
+        norm = normalize_pages(ctx["parse_fonts"])
+        blocks = hybrid_sections(norm)
+        return blocks, len(norm)
+
+    def structure_llm():
+        llm = _llm(args, srv)
+        blocks = list(iter_llm_sections(llm, _fresh_cache(tmp), iter_paragraphs(ctx["normalize"]),
+                                        fallback=_regex_sections))
+        return blocks, len(ctx["normalize"])
+
+    def structure_hybrid_llm():
+        llm = _llm(args, srv)
+        norm = normalize_pages(ctx["parse_fonts"])
+        # min_confidence 1.0 sends every candidate to the LLM: the worst case for this stage
+        blocks = hybrid_sections(norm, llm, _fresh_cache(tmp), min_confidence=1.0)
+        return blocks, len(norm)
+
+    def chunk():
+        recs = chunk_documents(ctx["structure_regex"])
+        return recs, len(recs)
+
+    def dedup():
+        from modules.dedup import find_duplicates
+        texts = ctx["chunk"].to_list("text")
+        find_duplicates(texts)
+        return None, len(texts)
+
+    def qa():
+        llm = _llm(args, srv)
+        rows = list(ctx["chunk"])[:args.qa_chunks]
+        out = Path(tempfile.mkdtemp(dir=tmp)) / "qa.jsonl"
+        st = write_qa(llm, _fresh_cache(tmp), lambda: iter(rows), out)
+        return st, len(rows)
+
+    def sparse():
+        from modules.bm25_index import build_bm25, build_tfidf
+        texts = ctx["chunk"].to_list("text")
+        build_bm25(texts)
+        build_tfidf(lambda: iter(texts), Path(tempfile.mkdtemp(dir=tmp)) / "tfidf")
+        return None, len(texts)
+
+    def embed():
+        from modules.embeddings import embed_texts
+        texts = ctx["chunk"].to_list("text")
+        st = {}
+        embed_texts(texts, stats=st)
+        if "encoded" not in st:
+            raise Skip("sentence-transformers unavailable (hash fallback)")
+        return st, len(texts)
+
+    return {"parse": parse, "parse_fonts": parse_fonts, "ocr": ocr, "normalize": normalize,
+            "structure_regex": structure_regex, "structure_hybrid": structure_hybrid, "structure_llm": structure_llm,
+            "structure_hybrid_llm": structure_hybrid_llm, "chunk": chunk, "dedup": dedup, "qa": qa, "sparse": sparse, "embed": embed}
+
+def _closure(wanted):
+    need, todo = set(), list(wanted)
+    while todo:
+        name = todo.pop()
+        if name not in need:
+            need.add(name)
+            todo.extend(DEPS[name])
+    return need
+
+def run(args) -> dict:
+    from modules.llm_stub import StubLLMServer
+    work = Path(args.work); work.mkdir(parents=True, exist_ok=True)
+    synth = {**DEFAULT_SYNTH, "pages": args.pages, "chapters": args.chapters, "scanned_pages": args.scanned,
+             "hyphenation": args.hyphenation, "running_header": not args.no_headers, "seed": args.seed}
+    ctx = {"pdf": _book(work, synth)}
+    wanted = set(args.stages.split(",")) if args.stages else set(STAGES)
+    unknown = wanted - set(STAGES)
+    if unknown:
+        raise SystemExit(f"unknown stages: {', '.join(sorted(unknown))}")
+    # upstream stages of a selected one run once, untimed in the results
+    needed = _closure(wanted)
+    results = {}
+    with tempfile.TemporaryDirectory(dir=work) as tmp, StubLLMServer(latency_ms=args.latency_ms) as srv:
+        fns = stage_fns(args, ctx, Path(tmp), srv)
+        for name in STAGES:
+            if name not in needed:
+                continue
+            prof, runs = Profiler(), []
+            try:
+                for _ in range(args.repeat if name in wanted else 1):
+                    with prof.stage(name) as rec:
+                        ctx[name], rec["items"] = fns[name]()
+                    runs.append(prof.stages[name])
+            except Skip as e:
+                print(f"[bench] {name:22s} skipped: {e}")
+                results[name] = {"skipped": str(e)}
+                ctx[name] = None
+                continue
+            if name not in wanted:
+                continue
+            secs = [r["wall_s"] for r in runs]
+            med = statistics.median(secs)
+            results[name] = {"seconds": round(med, 4), "min_s": min(secs), "max_s": max(secs),
+                             "cpu_s": statistics.median(r["cpu_s"] for r in runs),
+                             "peak_rss_mb": max(r.get("peak_rss_mb") or 0 for r in runs),
+                             "items": runs[-1].get("items"),
+                             "items_per_s": round(runs[-1]["items"] / med, 1) if med > 0 and runs[-1].get("items") else None,
+                             "runs": secs}
+            print(f"[bench] {name:22s} {med * 1000:10.1f} ms  ({results[name]['items_per_s']} items/s)")
+    return {"meta": {"git": _git_rev(), "python": platform.python_version(), "platform": platform.platform(),
+                     "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": args.repeat,
+                     "llm_latency_ms": args.latency_ms, "max_inflight": args.max_inflight,
+                     "qa_chunks": args.qa_chunks, "synth": synth},
+            "stages": results}
+
+def compare(cur: dict, base: dict, tolerance: float):
+    """
+    Rows of (stage, baseline s, current s, ratio, status); status is "regression" when the
+    median time grew by more than `tolerance` (fraction), "improved" when it shrank by as much.
+    """
+    rows = []
+    for name in STAGES:
+        if name not in cur["stages"]:
+            continue  # not selected this run
+        c, b = cur["stages"][name], base["stages"].get(name, {})
+        if "seconds" not in c or "seconds" not in b:
+            if "seconds" in c or "seconds" in b:
+                rows.append((name, b.get("seconds"), c.get("seconds"), None, "new" if "seconds" in c else "missing"))
+            continue
+        ratio = c["seconds"] / b["seconds"] if b["seconds"] else float("inf")
+        if max(c["seconds"], b["seconds"]) < MIN_SECONDS:
+            status = "ok"
+        elif ratio > 1 + tolerance:
+            status = "regression"
+        elif ratio < 1 - tolerance:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append((name, b["seconds"], c["seconds"], round(ratio, 3), status))
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser(description="Per-stage throughput benchmark on a synthetic book")
+    ap.add_argument("--out", default="data/reports/bench.json", help="Where to write the results JSON")
+    ap.add_argument("--baseline", help="Earlier results JSON; flags regressions and exits 1 if any")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown as a fraction (default 0.15)")
+    ap.add_argument("--stages", help=f"Comma-separated subset of: {','.join(STAGES)}")
+    ap.add_argument("--repeat", type=int, default=3, help="Timed runs per stage; the median is reported")
+    ap.add_argument("--work", default="data/bench", help="Generated PDFs and scratch files")
+    ap.add_argument("--pages", type=int, default=200)
+    ap.add_argument("--chapters", type=int, default=DEFAULT_SYNTH["chapters"])
+    ap.add_argument("--scanned", type=int, default=0, help="Image-only pages (timed by the ocr stage)")
+    ap.add_argument("--hyphenation", type=float, default=DEFAULT_SYNTH["hyphenation"])
+    ap.add_argument("--no-headers", action="store_true", help="No running headers / page numbers")
+    ap.add_argument("--seed", type=int, default=DEFAULT_SYNTH["seed"])
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Stub LLM delay per request")
+    ap.add_argument("--max-inflight", type=int, default=8)
+    ap.add_argument("--qa-chunks", type=int, default=200, help="Chunks sent through the QA stage")
+    args = ap.parse_args()
+
+    results = run(args)
+    out = Path(args.out); out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print("Results:", out)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        if base.get("meta", {}).get("synth") != results["meta"]["synth"]:
+            print("[warn] baseline was run on a different synthetic book; ratios may not be comparable",
+                  file=sys.stderr)
+        rows = compare(results, base, args.tolerance)
+        for name, b, c, ratio, status in rows:
+            print(f"{name:22s} {b if b is not None else '-':>10} {c if c is not None else '-':>10} "
+                  f"{ratio if ratio is not None else '-':>8}  {status}")
+        results["comparison"] = [dict(zip(("stage", "baseline_s", "current_s", "ratio", "status"), r)) for r in rows]
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        if any(r[4] == "regression" for r in rows):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
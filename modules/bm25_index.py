@@ -1,18 +1,364 @@
-import pickle
-from typing import List
+import json, math
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
 
-def build_bm25(texts: List[str]):
-    from rank_bm25 import BM25Okapi
+TOKEN_RE = r"\w+"
+
+def _tokenize(text: str) -> List[str]:
     import re
-    tokenized = [re.findall(r"\w+", t.lower()) for t in texts]
-    return BM25Okapi(tokenized)
-
-def build_tfidf(texts: List[str]):
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    vec = TfidfVectorizer(max_features=100000, ngram_range=(1,2))
-    X = vec.fit_transform(texts)
-    return {"vectorizer": vec, "X": X}
-
-def save_sparse_index(obj, out_path):
-    with open(out_path, "wb") as f:
-        pickle.dump(obj, f)
+    return re.findall(TOKEN_RE, text.lower())
+
+class _Vocab:
+    """
+    Sorted vocabulary stored as one utf-8 blob + offsets, so it memory-maps and is
+    searched by bisection without building a dict.
+    """
+    def __init__(self, blob, offsets):
+        self.blob, self.offsets = blob, offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def find(self, term: str) -> int:
+        from bisect import bisect_left
+        key = term.encode("utf-8")
+        i = bisect_left(self, key)
+        return i if i < len(self) and self[i] == key else -1
+
+class BM25Index:
+    """
+    Inverted index in CSR form: postings of term t are doc_ids/tfs[indptr[t]:indptr[t+1]].
+    Saved as .npy arrays in a directory and loaded with mmap, so opening is near-instant and
+    a query only reads its terms' postings.
+    """
+    FILES = ("indptr", "doc_ids", "tfs", "doc_len", "vocab_blob", "vocab_offsets")
+
+    def __init__(self, indptr, doc_ids, tfs, doc_len, vocab_blob, vocab_offsets, k1=1.5, b=0.75):
+        self.indptr, self.doc_ids, self.tfs, self.doc_len = indptr, doc_ids, tfs, doc_len
+        self.vocab_blob, self.vocab_offsets = vocab_blob, vocab_offsets
+        self.vocab = _Vocab(vocab_blob, vocab_offsets)
+        self.k1, self.b = k1, b
+        self.n_docs = int(len(doc_len))
+        # 1.0 for an empty or all-empty corpus, so length normalization never divides by zero
+        self.avgdl = (float(doc_len.mean()) if self.n_docs else 0.0) or 1.0
+
+    def save(self, out_dir):
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for name in self.FILES:
+            np.save(out_dir / f"{name}.npy", getattr(self, name))
+        # meta last: its presence marks a complete index
+        with open(out_dir / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "n_docs": self.n_docs, "n_terms": len(self.vocab),
+                       "token_re": TOKEN_RE}, f)
+
+    @classmethod
+    def load(cls, index_dir, mmap=True):
+        index_dir = Path(index_dir)
+        with open(index_dir / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrs = [np.load(index_dir / f"{name}.npy", mmap_mode="r" if mmap else None) for name in cls.FILES]
+        return cls(*arrs, k1=meta["k1"], b=meta["b"])
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        BM25 top-k as [(doc_id, score)], best first. Only the query terms' postings are read.
+        """
+        from collections import Counter
+        ids, scores = [], []
+        for term, qtf in Counter(_tokenize(query)).items():
+            t = self.vocab.find(term)
+            if t < 0:
+                continue
+            a, z = int(self.indptr[t]), int(self.indptr[t + 1])
+            d = np.asarray(self.doc_ids[a:z])
+            tf = np.asarray(self.tfs[a:z], dtype=np.float32)
+            df = z - a
+            idf = math.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * np.asarray(self.doc_len[d], dtype=np.float32) / self.avgdl)
+            ids.append(d)
+            scores.append(qtf * idf * tf * (self.k1 + 1.0) / (tf + norm))
+        if not ids:
+            return []
+        docs, inv = np.unique(np.concatenate(ids), return_inverse=True)
+        total = np.bincount(inv, weights=np.concatenate(scores))
+        if len(total) > k:
+            top = np.argpartition(-total, k)[:k]
+        else:
+            top = np.arange(len(total))
+        top = top[np.argsort(-total[top], kind="stable")]
+        return [(int(docs[i]), float(total[i])) for i in top]
+
+    def search_batch(self, queries: Iterable[str], k: int = 10):
+        return [self.search(q, k) for q in queries]
+
+def build_bm25(texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> BM25Index:
+    from array import array
+    from collections import Counter
+    vocab = {}
+    term_ids, doc_ids, tfs, doc_len = array("i"), array("i"), array("i"), array("i")
+    for d, t in enumerate(texts):
+        toks = _tokenize(t)
+        doc_len.append(len(toks))
+        for term, c in Counter(toks).items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            doc_ids.append(d)
+            tfs.append(c)
+    # renumber terms in utf-8 byte order so the vocab can be bisected
+    terms = sorted(vocab, key=lambda w: w.encode("utf-8"))
+    remap = np.empty(len(vocab), dtype=np.int64)
+    remap[[vocab[w] for w in terms]] = np.arange(len(terms))
+    tid = remap[np.frombuffer(term_ids, dtype=np.int32)] if term_ids else np.empty(0, dtype=np.int64)
+    order = np.argsort(tid, kind="stable")
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tid, minlength=len(terms)), out=indptr[1:])
+    encoded = [w.encode("utf-8") for w in terms]
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return BM25Index(indptr,
+                     np.frombuffer(doc_ids, dtype=np.int32)[order].copy(),
+                     np.frombuffer(tfs, dtype=np.int32)[order].copy(),
+                     np.frombuffer(doc_len, dtype=np.int32).copy(),
+                     np.frombuffer(b"".join(encoded), dtype=np.uint8).copy(),
+                     offsets, k1=k1, b=b)
+
+def load_bm25(index_dir) -> BM25Index:
+    return BM25Index.load(index_dir)
+
+DEFAULT_TFIDF = {
+    "max_features": 100000,      # vocabulary size, most frequent n-grams by document frequency
+    "ngram_max": 2,              # word n-grams 1..ngram_max
+    "min_df": 1,
+    "batch_docs": 4096,          # documents tokenized and written per batch
+    "max_count_terms": 2000000,  # pass-1 counter size that triggers pruning of rare n-grams
+}
+
+def _ngrams(toks: List[str], n: int) -> List[str]:
+    out = list(toks)
+    for k in range(2, n + 1):
+        out.extend(" ".join(toks[i:i + k]) for i in range(len(toks) - k + 1))
+    return out
+
+def _doc_freqs(texts: Iterable[str], ngram_max: int, max_count_terms: int):
+    """
+    Pass 1: document frequency per n-gram in bounded memory. Whenever the counter outgrows
+    max_count_terms, n-grams at or below its median count are dropped (lossy counting): frequent
+    n-grams keep (nearly) exact counts, rare ones may be forgotten. Returns (df, n_docs, pruned).
+    """
+    df: Dict[str, int] = {}
+    n, pruned = 0, 0
+    for t in texts:
+        n += 1
+        for g in set(_ngrams(_tokenize(t), ngram_max)):
+            df[g] = df.get(g, 0) + 1
+        if len(df) > max_count_terms:
+            counts = np.fromiter(df.values(), dtype=np.int64, count=len(df))
+            floor = int(np.partition(counts, len(counts) // 2)[len(counts) // 2])
+            before = len(df)
+            df = {g: c for g, c in df.items() if c > floor}
+            pruned += before - len(df)
+    return df, n, pruned
+
+def _npz_mmap(path) -> Dict[str, np.ndarray]:
+    """
+    Members of an uncompressed .npz (as np.savez writes it), memory-mapped in place.
+    """
+    import struct, zipfile
+    out = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: member {name} is compressed and cannot be memory-mapped")
+            f.seek(info.header_offset)
+            name_len, extra_len = struct.unpack("<HH", f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran, dtype = read_header(f)
+            if not shape or 0 in shape:
+                out[name] = np.load(zf.open(info.filename))
+            else:
+                out[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                      order="F" if fortran else "C")
+    return out
+
+class TfidfIndex:
+    """
+    Doc x term TF-IDF matrix (l2-normalized rows, smoothed idf) in CSR form. The matrix is
+    matrix.npz in scipy.sparse.save_npz layout, stored uncompressed so its data / indices /
+    indptr load memory-mapped; the vocabulary is a sorted utf-8 blob + offsets like BM25's,
+    with idf.npy alongside. Queries need neither scikit-learn nor scipy.
+    """
+    FILES = ("idf", "vocab_blob", "vocab_offsets")
+
+    def __init__(self, data, indices, indptr, shape, idf, vocab_blob, vocab_offsets, ngram_max=2):
+        self.data, self.indices, self.indptr = data, indices, indptr
+        self.n_docs, self.n_terms = int(shape[0]), int(shape[1])
+        self.idf, self.vocab_blob, self.vocab_offsets = idf, vocab_blob, vocab_offsets
+        self.vocab = _Vocab(vocab_blob, vocab_offsets)
+        self.ngram_max = ngram_max
+
+    @classmethod
+    def load(cls, index_dir, mmap=True):
+        index_dir = Path(index_dir)
+        with open(index_dir / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        m = _npz_mmap(index_dir / "matrix.npz") if mmap else dict(np.load(index_dir / "matrix.npz"))
+        arrs = [np.load(index_dir / f"{name}.npy", mmap_mode="r" if mmap else None) for name in cls.FILES]
+        return cls(m["data"], m["indices"], m["indptr"], np.asarray(m["shape"]), *arrs, ngram_max=meta["ngram_max"])
+
+    def transform(self, query: str) -> Dict[int, float]:
+        """
+        Query as {term id: weight}, tf * idf over the indexed n-grams, l2-normalized.
+        """
+        from collections import Counter
+        q = {}
+        for g, tf in Counter(_ngrams(_tokenize(query), self.ngram_max)).items():
+            t = self.vocab.find(g)
+            if t >= 0:
+                q[t] = tf * float(self.idf[t])
+        norm = math.sqrt(sum(w * w for w in q.values()))
+        return {t: w / norm for t, w in q.items()} if norm else {}
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries: Iterable[str], k: int = 10, block_nnz: int = 1 << 22) -> List[List[Tuple[int, float]]]:
+        """
+        Cosine top-k per query as [(doc_id, score)], best first. One pass over the matrix, block_nnz
+        stored entries at a time, scores every query of the batch: only entries of the batch's
+        query terms are gathered and each block keeps a running top-k, so memory is bounded.
+        """
+        qs = [self.transform(q) for q in queries]
+        terms = sorted(set().union(*qs)) if qs else []
+        if not terms:
+            return [[] for _ in qs]
+        col = np.full(self.n_terms, -1, dtype=np.int64)
+        col[terms] = np.arange(len(terms))
+        W = np.zeros((len(terms), len(qs)), dtype=np.float32)
+        for j, q in enumerate(qs):
+            for t, w in q.items():
+                W[col[t], j] = w
+        best_ids = np.empty((len(qs), 0), dtype=np.int64)
+        best = np.empty((len(qs), 0), dtype=np.float32)
+        indptr = np.asarray(self.indptr)
+        s = 0
+        while s < self.n_docs:
+            e = max(s + 1, int(np.searchsorted(indptr, indptr[s] + block_nnz, side="right")) - 1)
+            e = min(e, self.n_docs)
+            a, z = int(indptr[s]), int(indptr[e])
+            c = col[np.asarray(self.indices[a:z])]
+            hit = np.flatnonzero(c >= 0)
+            if len(hit):
+                rows = np.searchsorted(indptr[s:e + 1], a + hit, side="right") - 1 + s
+                contrib = W[c[hit]] * np.asarray(self.data[a:z], dtype=np.float32)[hit, None]
+                starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+                docs = rows[starts]
+                scores = np.add.reduceat(contrib, starts, axis=0).T  # (queries, docs)
+                ids = np.concatenate([best_ids, np.broadcast_to(docs, scores.shape)], axis=1)
+                cand = np.concatenate([best, scores], axis=1)
+                if cand.shape[1] > k:
+                    top = np.argpartition(-cand, k, axis=1)[:, :k]
+                    ids, cand = np.take_along_axis(ids, top, 1), np.take_along_axis(cand, top, 1)
+                best_ids, best = ids, cand
+            s = e
+        out = []
+        for ids, sc in zip(best_ids, best):
+            order = np.argsort(-sc, kind="stable")
+            out.append([(int(ids[i]), float(sc[i])) for i in order if sc[i] > 0])
+        return out
+
+def build_tfidf(texts_fn, out_dir, max_features: int = 100000, ngram_max: int = 2, min_df: int = 1,
+                batch_docs: int = 4096, max_count_terms: int = 2000000, **_) -> Dict:
+    """
+    Streaming TF-IDF build into out_dir (see TfidfIndex); texts_fn() returns a fresh iterable of
+    texts for each pass. Pass 1 counts n-gram document frequencies (pruned, see _doc_freqs) and
+    keeps the max_features most frequent; pass 2 writes raw counts batch by batch to disk; a last
+    pass over the stored matrix applies idf = ln((1 + n) / (1 + df)) + 1 with exact df and
+    l2-normalizes rows. Memory is bounded by the counter, the vocabulary and one batch.
+    Returns build stats.
+    """
+    from itertools import islice
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / "meta.json").unlink(missing_ok=True)
+    df, n_docs, pruned = _doc_freqs(texts_fn(), ngram_max, max_count_terms)
+    kept = [g for g, c in df.items() if c >= min_df]
+    kept = sorted(kept, key=lambda g: (-df[g], g))[:max_features]
+    counted = len(df)
+    del df
+    # ids in utf-8 byte order so the vocab can be bisected
+    terms = sorted(kept, key=lambda g: g.encode("utf-8"))
+    vocab = {g: i for i, g in enumerate(terms)}
+    encoded = [g.encode("utf-8") for g in terms]
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(out_dir / "vocab_blob.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(out_dir / "vocab_offsets.npy", offsets)
+    del encoded, kept
+
+    # pass 2: raw counts, appended to flat files one batch at a time
+    tmp = {name: out_dir / f"{name}.tmp" for name in ("data", "indices")}
+    indptr = np.zeros(n_docs + 1, dtype=np.int64)
+    doc_freq = np.zeros(len(terms), dtype=np.int64)
+    it, d, nnz = iter(texts_fn()), 0, 0
+    with open(tmp["data"], "wb") as fd, open(tmp["indices"], "wb") as fi:
+        while True:
+            batch = list(islice(it, batch_docs))
+            if not batch:
+                break
+            ids, counts = [], []
+            for t in batch:
+                g = [vocab[x] for x in _ngrams(_tokenize(t), ngram_max) if x in vocab]
+                u, c = np.unique(np.asarray(g, dtype=np.int32), return_counts=True)
+                ids.append(u)
+                counts.append(c)
+                nnz += len(u)
+                if d < n_docs:
+                    indptr[d + 1] = nnz
+                d += 1
+            cat = np.concatenate(ids) if ids else np.empty(0, dtype=np.int32)
+            doc_freq += np.bincount(cat, minlength=len(terms))
+            cat.astype(np.int32).tofile(fi)
+            np.concatenate(counts).astype(np.float32).tofile(fd)
+    if d != n_docs:
+        raise ValueError(f"texts_fn() yielded {d} texts after {n_docs}; it must return the same texts each time")
+
+    # pass 3: tf * idf and l2 row norms over the stored counts
+    idf = (np.log((1.0 + n_docs) / (1.0 + doc_freq)) + 1.0).astype(np.float32)
+    np.save(out_dir / "idf.npy", idf)
+    data = np.memmap(tmp["data"], dtype=np.float32, mode="r+", shape=(nnz,)) if nnz else np.empty(0, np.float32)
+    indices = np.memmap(tmp["indices"], dtype=np.int32, mode="r", shape=(nnz,)) if nnz else np.empty(0, np.int32)
+    for s in range(0, n_docs, batch_docs):
+        e = min(n_docs, s + batch_docs)
+        a, z = int(indptr[s]), int(indptr[e])
+        if a == z:
+            continue
+        block = data[a:z] * idf[indices[a:z]]
+        lens = np.diff(indptr[s:e + 1])
+        starts = indptr[s:e][lens > 0] - a
+        norms = np.sqrt(np.add.reduceat(block * block, starts))
+        block /= np.repeat(norms, lens[lens > 0])
+        data[a:z] = block
+    if nnz:
+        data.flush()
+    # scipy.sparse.save_npz layout, uncompressed so TfidfIndex.load can memory-map it
+    np.savez(out_dir / "matrix.npz", indices=indices, indptr=indptr, format=np.array(b"csr"),
+             shape=np.array([n_docs, len(terms)]), data=data)
+    del data, indices
+    for path in tmp.values():
+        path.unlink()
+    stats = {"docs": n_docs, "terms": len(terms), "nnz": nnz, "ngrams_counted": counted, "ngrams_pruned": pruned,
+             "ngram_max": ngram_max, "token_re": TOKEN_RE}
+    # meta last: its presence marks a complete index
+    with open(out_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(stats, f)
+    return stats
+
+def load_tfidf(index_dir) -> TfidfIndex:
+    return TfidfIndex.load(index_dir)
@@ -5,6 +5,7 @@ class DiskCache:
     def __init__(self, root="data/work/llm_cache"):
         self.root = Path(root)
         self.root.mkdir(parents=True, exist_ok=True)
+        self.hits = self.misses = 0
 
     def _key(self, obj):
         s = json.dumps(obj, sort_keys=True, ensure_ascii=False)
@@ -13,9 +14,107 @@ class DiskCache:
     def get(self, prompt_obj):
         p = self.root / self._key(prompt_obj)
         if p.exists():
+            self.hits += 1
             return json.loads(p.read_text(encoding="utf-8"))
+        self.misses += 1
         return None
 
     def put(self, prompt_obj, result):
         p = self.root / self._key(prompt_obj)
         p.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    def get_many(self, prompt_objs):
+        return [self.get(o) for o in prompt_objs]
+
+    @property
+    def stats(self):
+        return {"backend": "dir", "hits": self.hits, "misses": self.misses}
+
+def open_cache(work_dir, cache_cfg=None):
+    """
+    cache_cfg: {"backend": "dir" | "sqlite", "path": ..., "max_bytes": ...}; "dir" is the default.
+    """
+    cache_cfg = cache_cfg or {}
+    if cache_cfg.get("backend", "dir") == "sqlite":
+        return SQLiteCache(path=cache_cfg.get("path") or str(Path(work_dir) / "llm_cache.sqlite"),
+                           max_bytes=cache_cfg.get("max_bytes", 1 << 30))
+    return DiskCache(root=cache_cfg.get("path") or str(Path(work_dir) / "llm_cache"))
+
+class SQLiteCache:
+    """
+    Single-file cache with the DiskCache get/put API. Values are stored as zlib-compressed
+    compact JSON; once the stored bytes exceed max_bytes the least recently used entries
+    are evicted down to 90% of the cap. Safe to share across threads.
+    """
+    def __init__(self, path="data/work/llm_cache.sqlite", max_bytes=1 << 30):
+        import sqlite3, threading
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, size INTEGER, atime REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_atime ON cache (atime)")
+        self._db.commit()
+        self.bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        self.hits = self.misses = self.evictions = 0
+
+    def _key(self, obj):
+        s = json.dumps(obj, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+    def get(self, prompt_obj):
+        return self.get_many([prompt_obj])[0]
+
+    def get_many(self, prompt_objs):
+        import time, zlib
+        keys = [self._key(o) for o in prompt_objs]
+        found = {}
+        with self._lock:
+            # stay under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                found.update(self._db.execute(f"SELECT key, value FROM cache WHERE key IN ({marks})", part).fetchall())
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE cache SET atime = ? WHERE key = ?", [(now, k) for k in found])
+                self._db.commit()
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return [json.loads(zlib.decompress(found[k])) if k in found else None for k in keys]
+
+    def put(self, prompt_obj, result):
+        import time, zlib
+        key = self._key(prompt_obj)
+        blob = zlib.compress(json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            old = self._db.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO cache (key, value, size, atime) VALUES (?, ?, ?, ?)",
+                             (key, blob, len(blob), time.time()))
+            self.bytes += len(blob) - (old[0] if old else 0)
+            if self.max_bytes and self.bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+            self._db.commit()
+
+    def _evict(self, target):
+        freed, doomed = 0, []
+        for key, size in self._db.execute("SELECT key, size FROM cache ORDER BY atime"):
+            if self.bytes - freed <= target:
+                break
+            doomed.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM cache WHERE key = ?", doomed)
+        self.bytes -= freed
+        self.evictions += len(doomed)
+
+    @property
+    def stats(self):
+        return {"backend": "sqlite", "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "bytes": self.bytes, "max_bytes": self.max_bytes}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
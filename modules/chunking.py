@@ -1,11 +1,23 @@
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List, Tuple
 
-def chunk_documents(blocks: List[Dict], target_chars: int = 1200, overlap: int = 120) -> List[Dict]:
+from modules.records import KINDS, Records
+
+def iter_chunks(blocks: Iterable[Dict], target_chars: int = 1200, overlap: int = 120) -> Iterator[Dict]:
     """
-    Greedy fixed-size character chunking with overlap across contiguous blocks.
-    Emits rows: {chunk_id, section, page_start, page_end, text}
+    Generator form of chunk_documents; holds only the current chunk buffer.
     """
-    chunks = []
+    for chunk_id, section, page_start, page_end, text in _chunk_rows(
+            ((b["section_path"], b["page"], b["text"]) for b in blocks), target_chars, overlap):
+        yield {
+            "chunk_id": chunk_id,
+            "section": section,
+            "page_start": page_start,
+            "page_end": page_end,
+            "text": text
+        }
+
+def _chunk_rows(blocks: Iterable[Tuple[str, int, str]], target_chars: int, overlap: int) -> Iterator[Tuple]:
+    # (section_path, page, text) -> (chunk_id, section, page_start, page_end, text)
     buf = []
     buf_len = 0
     page_start = None
@@ -14,16 +26,10 @@ def chunk_documents(blocks: List[Dict], target_chars: int = 1200, overlap: int =
 
     def flush():
         nonlocal buf, buf_len, page_start, page_end, chunk_id
-        if buf_len == 0: 
-            return
+        if buf_len == 0:
+            return None
         text = "\n\n".join(buf).strip()
-        chunks.append({
-            "chunk_id": chunk_id,
-            "section": current_section,
-            "page_start": page_start,
-            "page_end": page_end,
-            "text": text
-        })
+        row = (chunk_id, current_section, page_start, page_end, text)
         chunk_id += 1
         # overlap
         if overlap > 0 and len(text) > overlap:
@@ -34,22 +40,39 @@ def chunk_documents(blocks: List[Dict], target_chars: int = 1200, overlap: int =
             buf, buf_len = [], 0
         page_start = None
         page_end = None
+        return row
 
     current_section = None
-    for b in blocks:
-        if current_section != b["section_path"] and buf_len:
-            flush()
-        current_section = b["section_path"]
+    for section_path, page, t in blocks:
+        if current_section != section_path and buf_len:
+            row = flush()
+            if row: yield row
+        current_section = section_path
         if page_start is None:
-            page_start = b["page"]
-        page_end = b["page"]
-        t = b["text"]
+            page_start = page
+        page_end = page
         if buf_len + len(t) + 2 > target_chars:
-            flush()
-            current_section = b["section_path"]
-            page_start = b["page"]
-            page_end = b["page"]
+            row = flush()
+            if row: yield row
+            current_section = section_path
+            page_start = page
+            page_end = page
         buf.append(t)
         buf_len += len(t) + 2
-    flush()
-    return chunks
+    row = flush()
+    if row: yield row
+
+def chunk_documents(blocks: List[Dict], target_chars: int = 1200, overlap: int = 120) -> List[Dict]:
+    """
+    Greedy fixed-size character chunking with overlap across contiguous blocks.
+    Emits rows: {chunk_id, section, page_start, page_end, text}; Records("chunks") for Records blocks.
+    """
+    if isinstance(blocks, Records):
+        names = [name for name, _ in KINDS["chunks"]]
+        cols = {name: [] for name in names}
+        for row in _chunk_rows(blocks.iter_column("section_path", "page", "text"),
+                               target_chars, overlap):
+            for name, v in zip(names, row):
+                cols[name].append(v)
+        return Records.from_columns("chunks", cols)
+    return list(iter_chunks(blocks, target_chars=target_chars, overlap=overlap))
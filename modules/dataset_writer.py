@@ -0,0 +1,192 @@
+import json, os, sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+DEFAULT_DATASET = {
+    "parquet": True,
+    "compression": "zstd",
+    "compression_level": 3,
+    "row_group_rows": 8192,   # rows buffered per Parquet row group
+    "embeddings": False,      # add an "embedding" fixed-size-list column once vectors exist
+}
+
+# Column types of chunk rows, in output order. Every field is a nullable Parquet column; rows
+# may carry any subset, and a field a row lacks is null.
+FIELDS = [
+    ("chunk_id", "int64"),
+    ("section", "string"),
+    ("page_start", "int32"),
+    ("page_end", "int32"),
+    ("text", "string"),
+    ("book", "string"),
+    ("book_chunk_id", "int64"),
+    ("dup_of", "int64"),
+]
+_KNOWN = frozenset(name for name, _ in FIELDS)
+
+def arrow_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+def dataset_options(cfg: Optional[Dict]) -> Dict:
+    return {**DEFAULT_DATASET, **(cfg or {})}
+
+def parquet_slice(cfg: Optional[Dict]) -> Dict:
+    # settings that change chunks.parquet as written with the JSONL (not the embedding column)
+    opts = dataset_options(cfg)
+    return {k: opts[k] for k in ("parquet", "compression", "compression_level", "row_group_rows")}
+
+class DatasetWriter:
+    """
+    Writes chunk rows to <out_dir>/chunks.jsonl and chunks.parquet in one pass. Parquet columns
+    are buffered for row_group_rows rows and flushed as one row group, with an explicit schema
+    (FIELDS, plus "embedding" as fixed_size_list<float32>[dim] when dim is given), so memory
+    is bounded by one row group. The Parquet file is written under a temporary name and
+    renamed on close. Without pyarrow only the JSONL is written.
+    """
+    def __init__(self, out_dir, jsonl: bool = True, parquet: bool = True, dim: Optional[int] = None,
+                 row_group_rows: int = 8192, compression: str = "zstd", compression_level: Optional[int] = 3,
+                 **_):
+        out_dir = Path(out_dir)
+        self.jsonl_path = out_dir / "chunks.jsonl"
+        self.parquet_path = out_dir / "chunks.parquet"
+        self.dim = dim
+        self.row_group_rows = max(1, int(row_group_rows))
+        self.compression = compression
+        self.compression_level = compression_level
+        if parquet and not arrow_available():
+            print("[warn] pyarrow not installed; writing chunks.jsonl only", file=sys.stderr)
+            parquet = False
+        self.parquet = parquet
+        self._f = open(self.jsonl_path, "w", encoding="utf-8") if jsonl else None
+        self._tmp = self.parquet_path.with_suffix(".parquet.tmp")
+        self._pq = None
+        self._fields: Optional[List[tuple]] = None
+        self._cols: Dict[str, list] = {}
+        self._vecs: List[np.ndarray] = []
+        self._buffered = 0
+        self.stats = {"rows": 0, "row_groups": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _start(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        # the full FIELDS schema, so a field first seen in a later row is not left out
+        self._fields = [(name, getattr(pa, typ)()) for name, typ in FIELDS]
+        schema = [pa.field(name, typ) for name, typ in self._fields]
+        if self.dim is not None:
+            schema.append(pa.field("embedding", pa.list_(pa.float32(), int(self.dim))))
+        self._cols = {name: [] for name, _ in self._fields}
+        self._pq = pq.ParquetWriter(str(self._tmp), pa.schema(schema), compression=self.compression,
+                                    compression_level=self.compression_level if self.compression != "none" else None)
+
+    def write(self, row: Dict, vec=None):
+        if self._f is not None:
+            self._f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.stats["rows"] += 1
+        if not self.parquet:
+            return
+        unknown = row.keys() - _KNOWN
+        if unknown:
+            raise ValueError(f"no Parquet type for chunk fields {sorted(unknown)}; add them to dataset_writer.FIELDS")
+        if self._pq is None:
+            self._start()
+        for name, _ in self._fields:
+            self._cols[name].append(row.get(name))
+        if self.dim is not None:
+            self._vecs.append(np.asarray(vec, dtype="float32").reshape(1, -1) if vec is not None
+                              else np.full((1, self.dim), np.nan, dtype="float32"))
+        self._buffered += 1
+        if self._buffered >= self.row_group_rows:
+            self._flush()
+
+    def write_many(self, rows: Iterable[Dict], vecs=None):
+        """
+        vecs: optional (len(rows), dim) array aligned with rows.
+        """
+        if vecs is None:
+            for row in rows:
+                self.write(row)
+            return
+        for row, vec in zip(rows, vecs):
+            self.write(row, vec)
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        import pyarrow as pa
+        arrays = [pa.array(self._cols[name], type=typ) for name, typ in self._fields]
+        names = [name for name, _ in self._fields]
+        if self.dim is not None:
+            flat = np.ascontiguousarray(np.concatenate(self._vecs), dtype="float32").ravel()
+            arrays.append(pa.FixedSizeListArray.from_arrays(pa.array(flat), int(self.dim)))
+            names.append("embedding")
+        self._pq.write_batch(pa.RecordBatch.from_arrays(arrays, names=names))
+        self.stats["row_groups"] += 1
+        self._cols = {name: [] for name, _ in self._fields}
+        self._vecs = []
+        self._buffered = 0
+
+    def close(self) -> Dict:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if self.parquet:
+            if self._pq is None and self.stats["rows"] == 0:
+                # empty dataset: no schema to infer, so no Parquet file either
+                self.parquet_path.unlink(missing_ok=True)
+            else:
+                self._flush()
+                self._pq.close()
+                self._pq = None
+                os.replace(self._tmp, self.parquet_path)
+                self.stats["parquet_bytes"] = self.parquet_path.stat().st_size
+        return dict(self.stats)
+
+    def abort(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if self._pq is not None:
+            self._pq.close()
+            self._pq = None
+        Path(self._tmp).unlink(missing_ok=True)
+
+def write_dataset(rows: Iterable[Dict], out_dir, cfg: Optional[Dict] = None) -> Dict:
+    """
+    chunks.jsonl + chunks.parquet (dataset config: see DEFAULT_DATASET) in one streaming pass.
+    """
+    opts = dataset_options(cfg)
+    with DatasetWriter(out_dir, **opts) as w:
+        w.write_many(rows)
+    return w.stats
+
+def export_with_embeddings(rows: Iterable[Dict], store, out_dir, cfg: Optional[Dict] = None, window: int = 8192) -> Dict:
+    """
+    Rewrites chunks.parquet with an "embedding" column from `store` (an EmbeddingStore whose
+    rows align with `rows`), reading both window rows at a time. chunks.jsonl is not touched.
+    """
+    from itertools import islice
+    opts = dataset_options(cfg)
+    it = iter(rows)
+    row = 0
+    with DatasetWriter(out_dir, **{**opts, "jsonl": False, "dim": store.dim}) as w:
+        while True:
+            part = list(islice(it, window))
+            if not part:
+                break
+            w.write_many(part, store.float32(row, row + len(part)))
+            row += len(part)
+    return w.stats
@@ -0,0 +1,149 @@
+import zlib
+import regex as re
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional
+
+DEFAULT_DEDUP = {
+    "enabled": False,
+    "action": "mark",     # mark: keep rows with "dup_of"; drop: remove them and renumber chunk_id
+    "threshold": 0.85,    # estimated Jaccard similarity of word shingles
+    "num_perm": 128,      # MinHash permutations
+    "shingle": 5,         # words per shingle
+    "seed": 1,
+}
+
+_TOKEN = re.compile(r"\w+")
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32; a * x + b stays below 2**64
+
+def _bands(threshold: float, num_perm: int):
+    """
+    (bands, rows) with bands * rows <= num_perm that minimize the false positive + false
+    negative area of the LSH S-curve 1 - (1 - s^rows)^bands around `threshold`.
+    """
+    xs = np.linspace(0.0, 1.0, 201)
+    best, best_err = (1, num_perm), float("inf")
+    for b in range(1, num_perm + 1):
+        r = num_perm // b
+        p = 1.0 - (1.0 - xs ** r) ** b
+        err = np.mean(np.where(xs < threshold, p, 1.0 - p))
+        if err < best_err:
+            best, best_err = (b, r), err
+    return best
+
+class NearDuplicates:
+    """
+    Incremental MinHash/LSH index. add(key, text) returns the key of an earlier kept text whose
+    estimated Jaccard similarity (over word shingles) is at least `threshold`, or indexes the
+    text as kept and returns None. Only kept texts are indexed, so every duplicate points at a
+    kept one and the first occurrence wins. Candidates come from LSH band buckets, so the cost
+    per text is O(num_perm) plus the few candidates that share a band.
+    """
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle: int = 5, seed: int = 1, **_):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self.threshold, self.shingle = threshold, max(1, shingle)
+        self.bands, self.rows = _bands(threshold, num_perm)
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self.keys: List = []
+        self.sigs: List[np.ndarray] = []
+        self.sizes: Dict = {}   # kept key -> texts in its cluster (itself included)
+        self.candidates = 0
+
+    def signature(self, text: str) -> np.ndarray:
+        toks = _TOKEN.findall(text.lower())
+        k = self.shingle
+        grams = {" ".join(toks[i:i + k]) for i in range(max(1, len(toks) - k + 1))}
+        x = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        return ((np.outer(self.a, x) + self.b[:, None]) % _PRIME).min(axis=1)
+
+    def add(self, key, text: str):
+        sig = self.signature(text)
+        parts = [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+        seen = set()
+        for bucket, part in zip(self.buckets, parts):
+            for j in bucket.get(part, ()):
+                if j in seen:
+                    continue
+                seen.add(j)
+                self.candidates += 1
+                if np.count_nonzero(self.sigs[j] == sig) >= self.threshold * len(sig):
+                    self.sizes[self.keys[j]] += 1
+                    return self.keys[j]
+        j = len(self.keys)
+        self.keys.append(key)
+        self.sigs.append(sig)
+        self.sizes[key] = 1
+        for bucket, part in zip(self.buckets, parts):
+            bucket.setdefault(part, []).append(j)
+        return None
+
+def _opts(opts: Dict) -> Dict:
+    return {**DEFAULT_DEDUP, **opts}
+
+def find_duplicates(texts: Iterable[str], **opts):
+    """
+    dup_of per text (int64 array): index of the kept near-duplicate it repeats, -1 if kept.
+    Returns (dup_of, NearDuplicates).
+    """
+    nd = NearDuplicates(**_opts(opts))
+    dup_of = np.fromiter((-1 if (k := nd.add(i, t)) is None else k for i, t in enumerate(texts)), dtype=np.int64)
+    return dup_of, nd
+
+def dedup_stats(nd: NearDuplicates, dup_of, chars: List[int], action: str, top: int = 10) -> Dict:
+    """
+    Cluster summary plus the work skipped downstream (embedding, sparse indexing and QA all
+    skip duplicate rows).
+    """
+    dup_of = np.asarray(dup_of)
+    dups = np.flatnonzero(dup_of >= 0)
+    dup_chars = int(sum(chars[i] for i in dups))
+    total = int(sum(chars))
+    clusters = {k: n for k, n in nd.sizes.items() if n > 1}
+    return {"action": action, "threshold": nd.threshold, "bands": nd.bands, "rows": nd.rows,
+            "chunks": len(dup_of), "duplicates": len(dups), "clusters": len(clusters),
+            "largest_cluster": max(clusters.values(), default=0), "lsh_candidates": nd.candidates,
+            "top_clusters": [{"chunk_id": k, "size": n} for k, n in
+                             sorted(clusters.items(), key=lambda kv: (-kv[1], kv[0]))[:top]],
+            "saved": {"chunks": len(dups), "chars": dup_chars,
+                      "chars_fraction": round(dup_chars / total, 4) if total else 0.0}}
+
+def drop_duplicates(recs, dup_of):
+    """
+    Records("chunks") without the duplicate rows, chunk_id renumbered 0..n-1.
+    """
+    import pyarrow as pa
+    from modules.records import Records
+    kept = Records(recs.kind, recs.table.filter(pa.array(np.asarray(dup_of) < 0)))
+    return kept.with_column("chunk_id", list(range(len(kept))))
+
+def iter_dedup(rows: Iterable[Dict], stats: Optional[Dict] = None, **opts) -> Iterator[Dict]:
+    """
+    Streaming form: "mark" adds dup_of (None when kept) to every row; "drop" skips duplicates
+    and renumbers chunk_id. `stats` is filled (as dedup_stats) once rows are exhausted.
+    """
+    opts = _opts(opts)
+    nd = NearDuplicates(**opts)
+    drop = opts["action"] == "drop"
+    dup_of, chars, n = [], [], 0
+    for row in rows:
+        canon = nd.add(n if drop else row["chunk_id"], row["text"])
+        dup_of.append(-1 if canon is None else canon)
+        chars.append(len(row["text"]))
+        if not drop:
+            yield {**row, "dup_of": canon}
+        elif canon is None:
+            yield {**row, "chunk_id": n}
+            n += 1
+    if stats is not None:
+        stats.update(dedup_stats(nd, dup_of, chars, opts["action"]))
+
+def fill_duplicates(vecs: np.ndarray, dup_of) -> np.ndarray:
+    """
+    Copies each kept row's vector onto its duplicates (in place); duplicates are never encoded.
+    """
+    dup_of = np.asarray(dup_of)
+    rows = np.flatnonzero(dup_of >= 0)
+    if len(rows):
+        vecs[rows] = vecs[dup_of[rows]]
+    return vecs
@@ -0,0 +1,129 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+FORMATS = ("float32", "float16", "int8", "binary")
+FULL = "embeddings.npy"
+META = "embeddings.json"
+WINDOW = 65536  # rows per pass, keeps conversion and scans in bounded memory
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _files(fmt: str) -> Dict[str, str]:
+    return {"float32": {"data": FULL},
+            "float16": {"data": "embeddings.f16.npy"},
+            "int8": {"data": "embeddings.int8.npy", "scales": "embeddings.int8.scales.npy"},
+            "binary": {"data": "embeddings.bin.npy"}}[fmt]
+
+def save_embeddings(vecs: np.ndarray, out_dir, fmt: str = "float32", keep_full: bool = True) -> Dict:
+    """
+    Writes vecs (array or memmap) in `fmt` plus embeddings.json, converting WINDOW rows at a time.
+    int8 uses a symmetric per-dimension scale; binary packs sign bits (dim/8 bytes per row).
+    With keep_full the float32 embeddings.npy is kept for rescoring; otherwise it is removed.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown embedding format {fmt!r}; expected one of {FORMATS}")
+    out_dir = Path(out_dir)
+    n, dim = vecs.shape
+    files = _files(fmt)
+    full_path = out_dir / FULL
+    is_full_file = isinstance(vecs, np.memmap) and Path(vecs.filename).resolve() == full_path.resolve()
+    if (fmt == "float32" or keep_full) and not is_full_file:
+        np.save(full_path, np.asarray(vecs, dtype="float32"))
+    if fmt == "int8":
+        amax = np.zeros(dim, dtype="float32")
+        for s in range(0, n, WINDOW):
+            np.maximum(amax, np.abs(np.asarray(vecs[s:s + WINDOW], dtype="float32")).max(axis=0), out=amax)
+        scales = np.where(amax > 0, amax / 127.0, 1.0).astype("float32")
+        np.save(out_dir / files["scales"], scales)
+    if fmt != "float32":
+        width = -(-dim // 8) if fmt == "binary" else dim
+        dtype = {"float16": "float16", "int8": "int8", "binary": "uint8"}[fmt]
+        out = np.lib.format.open_memmap(out_dir / files["data"], mode="w+", dtype=dtype, shape=(n, width))
+        for s in range(0, n, WINDOW):
+            part = np.asarray(vecs[s:s + WINDOW], dtype="float32")
+            if fmt == "float16":
+                out[s:s + len(part)] = part.astype("float16")
+            elif fmt == "int8":
+                out[s:s + len(part)] = np.clip(np.rint(part / scales), -127, 127).astype("int8")
+            else:
+                out[s:s + len(part)] = np.packbits(part > 0, axis=1)
+        out.flush()
+        del out
+    if fmt != "float32" and not keep_full:
+        full_path.unlink(missing_ok=True)
+    meta = {"format": fmt, "n": int(n), "dim": int(dim), "files": files,
+            "full": fmt == "float32" or keep_full}
+    with open(out_dir / META, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+class EmbeddingStore:
+    """
+    Memory-mapped reader for save_embeddings output. `float32()` dequantizes rows for
+    consumers that need full vectors (FAISS, Pinecone); `search` scores on the compact
+    codes and, when embeddings.npy was kept, rescores the top candidates exactly.
+    """
+    def __init__(self, out_dir):
+        out_dir = Path(out_dir)
+        with open(out_dir / META, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.format, self.n, self.dim = self.meta["format"], self.meta["n"], self.meta["dim"]
+        files = self.meta["files"]
+        self.data = np.load(out_dir / files["data"], mmap_mode="r")
+        self.scales = np.load(out_dir / files["scales"]) if "scales" in files else None
+        full = out_dir / FULL
+        self.full = np.load(full, mmap_mode="r") if self.meta["full"] and full.exists() else None
+
+    @classmethod
+    def exists(cls, out_dir) -> bool:
+        return (Path(out_dir) / META).exists()
+
+    def __len__(self):
+        return self.n
+
+    def _decode(self, codes) -> np.ndarray:
+        if self.format in ("float32", "float16"):
+            return np.asarray(codes, dtype="float32")
+        if self.format == "int8":
+            return np.asarray(codes, dtype="float32") * self.scales
+        # binary: signs scaled to unit length
+        bits = np.unpackbits(np.asarray(codes), axis=1)[:, :self.dim].astype("float32")
+        return (bits * 2.0 - 1.0) / np.sqrt(self.dim)
+
+    def float32(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        end = self.n if end is None else end
+        if self.full is not None:
+            return np.asarray(self.full[start:end], dtype="float32")
+        return self._decode(self.data[start:end])
+
+    def _approx_scores(self, q: np.ndarray, s: int, e: int) -> np.ndarray:
+        if self.format == "binary":
+            qcode = np.packbits(q > 0)
+            dist = _POPCOUNT[np.bitwise_xor(np.asarray(self.data[s:e]), qcode)].sum(axis=1, dtype=np.int32)
+            return -dist.astype("float32")
+        return self._decode(self.data[s:e]) @ q
+
+    def search(self, q: np.ndarray, k: int = 10, rescore: bool = True, factor: int = 10) -> List[Tuple[int, float]]:
+        """
+        Inner-product top-k as [(row, score)], best first.
+        """
+        q = np.asarray(q, dtype="float32").ravel()
+        exact = rescore and self.full is not None and self.format != "float32"
+        depth = min(self.n, k * factor if exact else k)
+        best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype="float32")
+        for s in range(0, self.n, WINDOW):
+            e = min(s + WINDOW, self.n)
+            sc = self._approx_scores(q, s, e)
+            take = np.argpartition(-sc, depth - 1)[:depth] if len(sc) > depth else np.arange(len(sc))
+            best_rows = np.concatenate([best_rows, take + s])
+            best_scores = np.concatenate([best_scores, sc[take]])
+            if len(best_rows) > depth:
+                keep = np.argpartition(-best_scores, depth - 1)[:depth]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        if exact and len(best_rows):
+            rows = np.sort(best_rows)
+            best_rows, best_scores = rows, np.asarray(self.full[rows], dtype="float32") @ q
+        order = np.argsort(-best_scores, kind="stable")[:k]
+        return [(int(best_rows[i]), float(best_scores[i])) for i in order]
@@ -1,34 +1,242 @@
-from typing import List
+from typing import Dict, List, Optional
+from pathlib import Path
+import hashlib, json, threading
 import numpy as np
+from modules.faiss_index import save_faiss_index  # re-exported; index types live in faiss_index
+from modules.profiling import span
+
+_MODELS = {}
+_CACHES = {}
+_FALLBACK_WARNED = set()
+# guards the model / cache / pool registries when several books embed from threads;
+# encoding itself runs outside it
+_LOCK = threading.Lock()
 
 def _load_st_model(name: str, device: str = "cpu"):
-    from sentence_transformers import SentenceTransformer
-    model = SentenceTransformer(name, device=device)
-    return model
+    # loaded once per process and reused across calls
+    with _LOCK:
+        if (name, device) not in _MODELS:
+            from sentence_transformers import SentenceTransformer
+            _MODELS[(name, device)] = SentenceTransformer(name, device=device)
+        return _MODELS[(name, device)]
+
+def _cache_for(root, model_name: str) -> "EmbeddingCache":
+    # one instance per cache directory, so threads share its row table and lock
+    key = (str(Path(root).resolve()), model_name)
+    with _LOCK:
+        if key not in _CACHES:
+            _CACHES[key] = EmbeddingCache(root, model_name)
+        return _CACHES[key]
+
+def text_hash(text: str) -> str:
+    import unicodedata
+    norm = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(norm.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Append-only vector store per model: <root>/<model>/vectors.f32 (raw float32 rows, read
+    back through np.memmap) and keys.txt (one text hash per row). Vectors are appended
+    before their keys, so a torn write only loses the unkeyed tail. lookup and add are
+    serialized per instance; use _cache_for to share one instance per directory.
+    """
+    def __init__(self, root, model_name: str):
+        self.dir = Path(root) / hashlib.sha256(model_name.encode("utf-8")).hexdigest()[:16]
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.vec_path = self.dir / "vectors.f32"
+        self.key_path = self.dir / "keys.txt"
+        meta_path = self.dir / "meta.json"
+        if not meta_path.exists():
+            meta_path.write_text(json.dumps({"model_name": model_name}), encoding="utf-8")
+        self.dim = json.loads(meta_path.read_text(encoding="utf-8")).get("dim")
+        self.meta_path = meta_path
+        keys = self.key_path.read_text(encoding="utf-8").split() if self.key_path.exists() else []
+        if self.dim:
+            n_rows = self.vec_path.stat().st_size // (4 * self.dim) if self.vec_path.exists() else 0
+            keys = keys[:n_rows]
+            # drop a torn tail so rows and keys line up again
+            with open(self.vec_path, "ab") as f:
+                f.truncate(len(keys) * 4 * self.dim)
+        self.rows: Dict[str, int] = {k: i for i, k in enumerate(keys)}
+        self._lock = threading.Lock()
+
+    def lookup(self, hashes: List[str]):
+        """
+        Returns (vectors for the hits as a dict row_index_in_input -> vector, miss indices).
+        """
+        with self._lock:
+            hit_idx = [i for i, h in enumerate(hashes) if h in self.rows]
+            found = {}
+            if hit_idx:
+                mm = np.memmap(self.vec_path, dtype="float32", mode="r").reshape(-1, self.dim)
+                for i in hit_idx:
+                    found[i] = np.array(mm[self.rows[hashes[i]]])
+            return found, [i for i, h in enumerate(hashes) if h not in self.rows]
+
+    def add(self, hashes: List[str], vecs: np.ndarray):
+        vecs = np.ascontiguousarray(vecs, dtype="float32")
+        with self._lock:
+            self._add(hashes, vecs)
 
-def embed_texts(texts: List[str], model_name: str = "sentence-transformers/all-MiniLM-L6-v2", device: str = "cpu"):
+    def _add(self, hashes: List[str], vecs: np.ndarray):
+        if self.dim is None:
+            self.dim = int(vecs.shape[1])
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            self.meta_path.write_text(json.dumps({**meta, "dim": self.dim}), encoding="utf-8")
+        rows = {}
+        for h, v in zip(hashes, vecs):
+            if h not in self.rows and h not in rows:
+                rows[h] = v
+        if not rows:
+            return
+        with open(self.vec_path, "ab") as f:
+            f.write(np.vstack(list(rows.values())).tobytes())
+        with open(self.key_path, "a", encoding="utf-8") as f:
+            f.write("".join(h + "\n" for h in rows))
+        base = len(self.rows)
+        for i, h in enumerate(rows):
+            self.rows[h] = base + i
+
+DEFAULT_BATCHING = {
+    "token_budget": 16384,  # padded tokens per batch (longest text x batch size)
+    "max_batch": 256,
+    "workers": 1,           # encoder processes; 0 = all cores
+}
+
+def _token_lengths(model, texts: List[str]) -> List[int]:
+    limit = getattr(model, "max_seq_length", None) or 512
     try:
-        model = _load_st_model(model_name, device=device)
-        vecs = model.encode(texts, batch_size=64, normalize_embeddings=True, show_progress_bar=True)
-        return np.array(vecs, dtype="float32")
-    except Exception as e:
-        # Fallback: hashing-based cheap embeddings (not great, but avoids crash offline)
-        import hashlib
-        def hvec(t):
-            h = hashlib.sha256(t.encode("utf-8")).digest()
-            arr = np.frombuffer(h, dtype=np.uint8).astype(np.float32)
-            return arr[:32] / 255.0
-        return np.vstack([hvec(t) for t in texts]).astype("float32")
-
-def save_faiss_index(vecs: np.ndarray, ids: list, out_path, metric: str = "ip"):
+        ids = model.tokenizer(texts, add_special_tokens=True, truncation=True, max_length=limit)["input_ids"]
+        return [len(x) for x in ids]
+    except Exception:
+        # rough chars-per-token estimate when the tokenizer is not reachable
+        return [min(limit, len(t) // 4 + 2) for t in texts]
+
+def plan_batches(lengths: List[int], token_budget: int, max_batch: int) -> List[List[int]]:
+    """
+    Sorts indices by token length (longest first) and cuts batches so that
+    longest-in-batch x batch size stays within token_budget.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches, cur, cur_max = [], [], 0
+    for i in order:
+        longest = max(cur_max, lengths[i])
+        if cur and (longest * (len(cur) + 1) > token_budget or len(cur) >= max_batch):
+            batches.append(cur)
+            cur, longest = [], lengths[i]
+        cur.append(i)
+        cur_max = longest
+    if cur:
+        batches.append(cur)
+    return batches
+
+_POOLS = {}
+
+def _pool_init(name: str, device: str, threads: int):
     try:
-        import faiss
-    except Exception as e:
-        raise RuntimeError("faiss not installed")
-    dim = vecs.shape[1]
-    if metric == "ip":
-        index = faiss.IndexFlatIP(dim)
+        import torch
+        torch.set_num_threads(max(1, threads))
+    except Exception:
+        pass
+    _load_st_model(name, device=device)
+
+def _pool_encode(args):
+    name, device, texts = args
+    model = _load_st_model(name, device=device)
+    return np.asarray(model.encode(texts, batch_size=len(texts), normalize_embeddings=True,
+                                   show_progress_bar=False), dtype="float32")
+
+def _encoder_pool(name: str, device: str, workers: int):
+    # one pool per (model, device, workers), kept for the life of the process
+    key = (name, device, workers)
+    with _LOCK:
+        if key not in _POOLS:
+            import os
+            from concurrent.futures import ProcessPoolExecutor
+            threads = (os.cpu_count() or 1) // workers
+            _POOLS[key] = ProcessPoolExecutor(max_workers=workers, initializer=_pool_init,
+                                              initargs=(name, device, threads))
+        return _POOLS[key]
+
+def encode_bucketed(model, model_name: str, device: str, texts: List[str], batching: Optional[Dict] = None,
+                    stats: Optional[Dict] = None) -> np.ndarray:
+    """
+    Encodes texts in length-sorted batches under a padded-token budget and returns rows in
+    input order. With batching["workers"] > 1 the batches run on a CPU process pool.
+    """
+    import os, time
+    cfg = {**DEFAULT_BATCHING, **(batching or {})}
+    workers = cfg["workers"] or os.cpu_count() or 1
+    lengths = _token_lengths(model, texts)
+    batches = plan_batches(lengths, cfg["token_budget"], cfg["max_batch"])
+    out = np.empty((len(texts), model.get_sentence_embedding_dimension()), dtype="float32")
+    t0 = time.perf_counter()
+    if workers > 1 and device == "cpu" and len(batches) > 1:
+        pool = _encoder_pool(model_name, device, workers)
+        jobs = [(model_name, device, [texts[i] for i in b]) for b in batches]
+        with span("embed.pool", "embed", batches=len(batches), rows=len(texts)):
+            for b, v in zip(batches, pool.map(_pool_encode, jobs)):
+                out[b] = v
     else:
-        index = faiss.IndexFlatL2(dim)
-    index.add_with_ids(vecs, np.array(ids, dtype=np.int64))
-    faiss.write_index(index, str(out_path))
+        for b in batches:
+            with span("embed.batch", "embed", rows=len(b)):
+                out[b] = model.encode([texts[i] for i in b], batch_size=len(b), normalize_embeddings=True,
+                                      show_progress_bar=False)
+    secs = time.perf_counter() - t0
+    if stats is not None:
+        stats["tokens"] = stats.get("tokens", 0) + sum(lengths)
+        stats["padded_tokens"] = stats.get("padded_tokens", 0) + sum(max(lengths[i] for i in b) * len(b) for b in batches)
+        stats["batches"] = stats.get("batches", 0) + len(batches)
+        stats["encode_s"] = round(stats.get("encode_s", 0.0) + secs, 3)
+        stats["tokens_per_s"] = round(stats["tokens"] / stats["encode_s"], 1) if stats["encode_s"] else 0.0
+    return out
+
+def _hash_embed(texts: List[str]):
+    # Fallback: hashing-based cheap embeddings (not great, but avoids crash offline)
+    def hvec(t):
+        h = hashlib.sha256(t.encode("utf-8")).digest()
+        arr = np.frombuffer(h, dtype=np.uint8).astype(np.float32)
+        return arr[:32] / 255.0
+    return np.vstack([hvec(t) for t in texts]).astype("float32")
+
+def embed_texts(texts: List[str], model_name: str = "sentence-transformers/all-MiniLM-L6-v2", device: str = "cpu",
+                cache_dir=None, stats: Optional[Dict] = None, batching: Optional[Dict] = None):
+    """
+    With cache_dir, vectors are looked up by (model_name, normalized text hash) and only
+    new or changed texts are encoded. Encoding is length-bucketed (see DEFAULT_BATCHING).
+    `stats`, if given, receives cached/encoded counts and token throughput.
+    Only a model that cannot be imported or loaded falls back to hash vectors; that is logged
+    once per model and recorded as stats["fallback"]. Any other error propagates.
+    """
+    import sys
+    texts = list(texts)
+    try:
+        model = _load_st_model(model_name, device=device)
+    except Exception as e:
+        if (model_name, device) not in _FALLBACK_WARNED:
+            _FALLBACK_WARNED.add((model_name, device))
+            print(f"[warn] embedding model {model_name} unavailable, using hash vectors:", e, file=sys.stderr)
+        if stats is not None:
+            stats["fallback"] = f"hash: {type(e).__name__}: {e}"
+        return _hash_embed(texts)
+    return _embed_cached(model, texts, model_name, device, cache_dir, stats, batching)
+
+def _embed_cached(model, texts, model_name, device, cache_dir, stats, batching):
+    cache = _cache_for(cache_dir, model_name) if cache_dir else None
+    hashes = [text_hash(t) for t in texts] if cache else None
+    found, todo = cache.lookup(hashes) if cache else ({}, list(range(len(texts))))
+    fresh = None
+    if todo:
+        fresh = encode_bucketed(model, model_name, device, [texts[i] for i in todo], batching, stats)
+        if cache:
+            cache.add([hashes[i] for i in todo], fresh)
+    if stats is not None:
+        stats["cached"] = stats.get("cached", 0) + len(found)
+        stats["encoded"] = stats.get("encoded", 0) + len(todo)
+    dim = fresh.shape[1] if fresh is not None else (cache.dim if cache else model.get_sentence_embedding_dimension())
+    out = np.empty((len(texts), dim), dtype="float32")
+    for i, v in found.items():
+        out[i] = v
+    if fresh is not None:
+        out[todo] = fresh
+    return out
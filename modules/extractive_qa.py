@@ -1,5 +1,12 @@
 import json
 
+DEFAULT_QA = {
+    "window": 256,       # chunks per bulk cache lookup / append batch
+    "pack_below": 0,     # chunks shorter than this many chars share a request; 0 = never pack
+    "pack_chars": 6000,  # context chars per packed request
+    "max_pack": 8,       # chunks per packed request
+}
+
 QA_SCHEMA = {
   "type":"object",
   "properties":{
@@ -37,20 +44,92 @@ Context:
 {text}
 """
 
-def make_qa(llm, cache, chunk):
-    p0, p1 = chunk.get("page_start"), chunk.get("page_end")
-    ctx = chunk["text"]
-    prompt = PROMPT.format(p0=p0, p1=p1, text=ctx[:8000])
-    key = {"task":"qa","chunk_id":chunk["chunk_id"]}
-    cached = cache.get(key)
-    if cached: return cached
-    out = llm.chat_json(SYSTEM, prompt, temperature=0.0, top_p=0.1, seed=7, schema=QA_SCHEMA)
+PACKED_SCHEMA = {
+  "type":"object",
+  "properties":{
+    "items":{"type":"array","items":{
+      "type":"object",
+      "properties":{
+        "context":{"type":"integer"},
+        **QA_SCHEMA["properties"]["items"]["items"]["properties"]
+      },
+      "required":["context","question","answer","quotes"]
+    }}
+  },
+  "required":["items"]
+}
+
+PACKED_PROMPT = """Create 3-7 useful Q/A pairs for study/retrieval from EACH context below.
+Rules:
+- Extractive only: answers should be paraphrases strictly supported by quotes.
+- Provide 1-3 quotes per item with (page_start, page_end, text), all from one context.
+- Set "context" to the id of the context the item comes from.
+Contexts:
+{contexts}
+"""
+
+# bump when SYSTEM / PROMPT / PACKED_PROMPT change so cached answers are not reused
+PROMPT_VERSION = 2
+MAX_CONTEXT_CHARS = 8000
+SAMPLING = {"temperature": 0.0, "top_p": 0.1, "seed": 7}
+
+def qa_key(chunk, packed=False, model=None):
+    """
+    Cache key from what the request actually contains (text hash, page span, prompt version,
+    model and sampling settings), so answers survive re-numbering and go stale when a chunk's
+    text, the prompt or the model changes.
+    """
+    import hashlib
+    text = chunk["text"][:MAX_CONTEXT_CHARS]
+    return {"task": "qa", "v": PROMPT_VERSION, "packed": packed, "model": model, "sampling": SAMPLING,
+            "pages": [chunk.get("page_start"), chunk.get("page_end")],
+            "text": hashlib.sha256(text.encode("utf-8")).hexdigest()}
+
+def qa_hash(key) -> str:
+    import hashlib
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+def _verify(items, ctx):
     # minimal verifier: ensure quotes appear in ctx
-    items = []
-    for it in out.get("items", []):
+    out = []
+    for it in items:
         quotes = [q for q in it.get("quotes", []) if q.get("text","") and q["text"][:200] in ctx]
         if quotes:
-            items.append({"question": it.get("question",""), "answer": it.get("answer",""), "quotes": quotes})
-    result = {"items": items, "count": len(items)}
+            out.append({"question": it.get("question",""), "answer": it.get("answer",""), "quotes": quotes})
+    return {"items": out, "count": len(out)}
+
+def make_qa(llm, cache, chunk, lookup=True):
+    p0, p1 = chunk.get("page_start"), chunk.get("page_end")
+    ctx = chunk["text"]
+    prompt = PROMPT.format(p0=p0, p1=p1, text=ctx[:MAX_CONTEXT_CHARS])
+    key = qa_key(chunk, model=llm.model)
+    # lookup=False when the caller already bulk-checked the cache
+    cached = cache.get(key) if lookup else None
+    if cached: return cached
+    out = llm.chat_json(SYSTEM, prompt, schema=QA_SCHEMA, **SAMPLING)
+    result = _verify(out.get("items", []), ctx)
     cache.put(key, result)
     return result
+
+def make_qa_packed(llm, cache, chunks):
+    """
+    One request for several short chunks; items are routed back by context id, verified
+    against their own chunk and cached per chunk. Returns one result per chunk, in order.
+    """
+    contexts = "\n\n".join(f"[id {i}] [pages {c.get('page_start')}-{c.get('page_end')}]\n{c['text'][:MAX_CONTEXT_CHARS]}"
+                            for i, c in enumerate(chunks))
+    out = llm.chat_json(SYSTEM, PACKED_PROMPT.format(contexts=contexts), schema=PACKED_SCHEMA, **SAMPLING)
+    per = [[] for _ in chunks]
+    for it in out.get("items", []):
+        try:
+            i = int(it.get("context"))
+        except (TypeError, ValueError):
+            continue
+        if 0 <= i < len(chunks):
+            per[i].append(it)
+    results = []
+    for ch, items in zip(chunks, per):
+        result = _verify(items, ch["text"])
+        cache.put(qa_key(ch, packed=True, model=llm.model), result)
+        results.append(result)
+    return results
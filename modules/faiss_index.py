@@ -0,0 +1,120 @@
+import time
+from pathlib import Path
+from typing import Dict, Optional
+import numpy as np
+
+DEFAULT_INDEX = {
+    "type": "flat",         # flat | ivf | hnsw | pq | ivfpq
+    "nlist": 0,             # IVF lists; 0 = 4 * sqrt(n), capped so each list gets ~39 training points
+    "nprobe": 16,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "pq_m": 16,             # sub-quantizers; lowered to a divisor of the dimension
+    "pq_bits": 8,
+    "train_size": 100_000,  # vectors sampled for training
+    "benchmark": False,
+    "bench_queries": 1000,
+    "bench_k": 10,
+}
+
+def _metric(faiss, metric: str):
+    return faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+
+def _nlist(n: int, requested: int) -> int:
+    nlist = requested or int(4 * n ** 0.5)
+    return max(1, min(nlist, n // 39 or 1))
+
+def _pq_m(dim: int, requested: int) -> int:
+    return max(m for m in range(1, min(dim, requested) + 1) if dim % m == 0)
+
+def _pq_bits(n: int, requested: int) -> int:
+    # faiss wants ~39 training points per centroid, i.e. 39 * 2**bits per sub-quantizer
+    return max(1, min(requested, int(np.log2(max(2, n // 39)))))
+
+def build_index(vecs: np.ndarray, ids: np.ndarray, metric: str = "ip", index_cfg: Optional[Dict] = None):
+    """
+    Builds (trains on a sample if needed) and fills a FAISS index keyed by `ids`.
+    Returns (index, build_stats).
+    """
+    import faiss
+    cfg = {**DEFAULT_INDEX, **(index_cfg or {})}
+    n, dim = vecs.shape
+    mt = _metric(faiss, metric)
+    kind = cfg["type"]
+    n_train = min(n, cfg["train_size"])  # points the k-means steps below are trained on
+    if kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim))
+    elif kind == "hnsw":
+        base = faiss.IndexHNSWFlat(dim, cfg["hnsw_m"], mt)
+        base.hnsw.efConstruction = cfg["ef_construction"]
+        base.hnsw.efSearch = cfg["ef_search"]
+        index = faiss.IndexIDMap2(base)
+    elif kind == "pq":
+        index = faiss.IndexIDMap2(faiss.IndexPQ(dim, _pq_m(dim, cfg["pq_m"]), _pq_bits(n_train, cfg["pq_bits"]), mt))
+    elif kind in ("ivf", "ivfpq"):
+        nlist = _nlist(n_train, cfg["nlist"])
+        quantizer = faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, mt)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim, cfg["pq_m"]), _pq_bits(n_train, cfg["pq_bits"]), mt)
+        index.nprobe = min(cfg["nprobe"], nlist)
+    else:
+        raise ValueError(f"unknown faiss index type {kind!r}")
+
+    stats = {"type": kind, "ntotal": int(n), "dim": int(dim), "train_s": 0.0}
+    if not index.is_trained:
+        t0 = time.perf_counter()
+        rng = np.random.default_rng(0)
+        sample = vecs if n <= cfg["train_size"] else vecs[np.sort(rng.choice(n, cfg["train_size"], replace=False))]
+        index.train(np.ascontiguousarray(sample, dtype="float32"))
+        stats["train_s"] = round(time.perf_counter() - t0, 3)
+    t0 = time.perf_counter()
+    index.add_with_ids(np.ascontiguousarray(vecs, dtype="float32"), np.asarray(ids, dtype=np.int64))
+    stats["add_s"] = round(time.perf_counter() - t0, 3)
+    return index, stats
+
+def benchmark_index(index, vecs: np.ndarray, ids: np.ndarray, metric: str = "ip", n_queries: int = 1000,
+                    k: int = 10) -> Dict:
+    """
+    recall@k and QPS of `index` against an exact flat search over the same vectors.
+    Queries are perturbed copies of sampled rows so self-matches do not dominate.
+    """
+    n, dim = vecs.shape
+    rng = np.random.default_rng(1)
+    q = np.asarray(vecs[rng.choice(n, min(n_queries, n), replace=False)], dtype="float32")
+    q = q + rng.normal(0, 0.01, q.shape).astype("float32")
+    if metric == "ip":
+        q /= np.linalg.norm(q, axis=1, keepdims=True) + 1e-12
+    flat, _ = build_index(vecs, ids, metric, {"type": "flat"})
+
+    def timed(idx):
+        t0 = time.perf_counter()
+        _, found = idx.search(q, k)
+        return found, time.perf_counter() - t0
+
+    truth, flat_s = timed(flat)
+    found, ann_s = timed(index)
+    hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return {"queries": int(len(q)), "k": k, f"recall@{k}": round(hits / float(len(q) * k), 4),
+            "qps": round(len(q) / ann_s, 1) if ann_s else 0.0,
+            "flat_qps": round(len(q) / flat_s, 1) if flat_s else 0.0}
+
+def save_faiss_index(vecs: np.ndarray, ids: list, out_path, metric: str = "ip", index_cfg: Optional[Dict] = None) -> Dict:
+    """
+    Builds the configured index (see DEFAULT_INDEX), writes it to out_path and returns
+    build stats (plus a recall/QPS benchmark when index_cfg["benchmark"] is set).
+    """
+    try:
+        import faiss
+    except Exception as e:
+        raise RuntimeError("faiss not installed")
+    cfg = {**DEFAULT_INDEX, **(index_cfg or {})}
+    ids = np.asarray(ids, dtype=np.int64)
+    index, stats = build_index(vecs, ids, metric, cfg)
+    faiss.write_index(index, str(out_path))
+    stats["bytes"] = Path(out_path).stat().st_size
+    if cfg["benchmark"]:
+        stats["benchmark"] = benchmark_index(index, vecs, ids, metric, cfg["bench_queries"], cfg["bench_k"])
+    return stats
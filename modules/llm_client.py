@@ -1,4 +1,9 @@
-import os, json, requests
+import os, json, time, random, threading, requests
+from requests.adapters import HTTPAdapter
+
+from modules.profiling import span
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
 
 class LLMClient:
     """
@@ -7,31 +12,109 @@ class LLMClient:
       - LLM_BASE_URL (e.g., http://127.0.0.1:8000/v1)
       - LLM_API_KEY
       - LLM_MODEL
+    One pooled HTTP session is shared by all threads; `imap` keeps up to `max_inflight`
+    requests in flight so the server can batch them, and that cap holds across concurrent
+    imap callers. 429/5xx and connection errors are retried with exponential backoff
+    (honouring Retry-After).
     """
-    def __init__(self, base_url=None, api_key=None, model=None, timeout=120):
+    def __init__(self, base_url=None, api_key=None, model=None, timeout=120,
+                 max_inflight=8, max_retries=5, backoff=0.5, max_backoff=30.0):
         self.base_url = base_url or os.getenv("LLM_BASE_URL", "http://127.0.0.1:8000/v1")
         self.api_key = api_key or os.getenv("LLM_API_KEY", "local")
         self.model = model or os.getenv("LLM_MODEL", "meta-llama/Meta-Llama-3-8B-Instruct")
         self.timeout = timeout
+        self.max_inflight = max(1, int(max_inflight or 1))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_inflight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"})
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_inflight)
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _delay(self, attempt, resp=None):
+        if resp is not None:
+            try:
+                return min(self.max_backoff, float(resp.headers.get("Retry-After", "")))
+            except ValueError:
+                pass
+        return min(self.max_backoff, self.backoff * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+    def _post(self, body):
+        url = f"{self.base_url}/chat/completions"
+        for attempt in range(self.max_retries + 1):
+            self._count("requests")
+            try:
+                with self._slots:
+                    r = self.session.post(url, json=body, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                time.sleep(self._delay(attempt))
+                continue
+            if r.status_code in RETRY_STATUS and attempt < self.max_retries:
+                self._count("retries")
+                time.sleep(self._delay(attempt, r))
+                continue
+            if not r.ok:
+                self._count("failures")
+            r.raise_for_status()
+            return r.json()
 
     def chat_json(self, system, user, temperature=0.0, top_p=0.1, seed=7, schema=None):
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
         body = {
             "model": self.model,
             "messages": [{"role": "system", "content": system}, {"role": "user", "content": user}],
-            "temperature": temperature, "top_p": top_p
+            "temperature": temperature, "top_p": top_p,
+            # Many providers ignore seed, but include it for determinism where supported
+            "seed": seed,
         }
-        # Many providers ignore seed, but include it for determinism where supported
-        try:
-            body["seed"] = seed
-        except Exception:
-            pass
         if schema:
             body["response_format"] = {"type": "json_schema", "json_schema": {"name": "out", "schema": schema}}
         else:
             body["response_format"] = {"type": "json_object"}
-        r = requests.post(f"{self.base_url}/chat/completions", json=body, headers=headers, timeout=self.timeout)
-        r.raise_for_status()
-        data = r.json()
+        with span("llm.chat", "llm") as ev:
+            data = self._post(body)
+            usage = data.get("usage") or {}
+            ev["prompt_tokens"] = int(usage.get("prompt_tokens") or 0)
+            ev["completion_tokens"] = int(usage.get("completion_tokens") or 0)
+        self._count("prompt_tokens", ev["prompt_tokens"])
+        self._count("completion_tokens", ev["completion_tokens"])
         content = data["choices"][0]["message"]["content"]
         return json.loads(content)
+
+    def imap(self, fn, items):
+        """
+        Applies fn(item) on a thread pool with at most max_inflight calls outstanding.
+        Yields (item, result, error) in input order; `items` may be a lazy iterable.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from collections import deque
+
+        def _done(item, fut):
+            try:
+                return item, fut.result(), None
+            except Exception as e:
+                return item, None, e
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_inflight) as ex:
+            for item in items:
+                pending.append((item, ex.submit(fn, item)))
+                if len(pending) >= self.max_inflight:
+                    yield _done(*pending.popleft())
+            while pending:
+                yield _done(*pending.popleft())
+
+    def close(self):
+        self.session.close()
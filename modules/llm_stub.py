@@ -0,0 +1,108 @@
+import json, re, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# Deterministic stand-in for an OpenAI-compatible /v1/chat/completions endpoint, for benchmarks
+# and offline runs. Answers are shaped by the request's json_schema (section boundaries, QA
+# items, packed QA items) from the prompt text alone, so results are repeatable.
+
+_HEADING = re.compile(r"^(?:chapter\s+\d+|part\s+\w+|\d+(?:\.\d+)*\s+\S)", re.I)
+_PARA_LINE = re.compile(r'^\{"id": \d+.*\}$')
+_CONTEXT = re.compile(r"\[(?:id (\d+)\] \[)?pages [^\]]*\]\n(.*?)(?=\n\n\[id \d+\] \[pages |\Z)", re.S)
+
+def _boundaries(user: str) -> Dict:
+    out = []
+    for line in user.splitlines():
+        if not _PARA_LINE.match(line):
+            continue
+        p = json.loads(line)
+        text = p["text"].strip()
+        if _HEADING.match(text):
+            title = text.split("\n", 1)[0][:80]
+            out.append({"id": p["id"], "section_path": "Root / " + title, "heading": "\n" not in text})
+    return {"boundaries": out}
+
+def _qa_item(text: str) -> Optional[Dict]:
+    sentence = text.strip().split(".")[0][:160].strip()
+    if not sentence:
+        return None
+    return {"question": f"What does the text say about {' '.join(sentence.split()[:3]).lower()}?",
+            "answer": sentence, "quotes": [{"page_start": 0, "page_end": 0, "text": sentence}]}
+
+def _qa(user: str, packed: bool) -> Dict:
+    items = []
+    for cid, text in _CONTEXT.findall(user.split("Context:", 1)[-1] if not packed else user):
+        it = _qa_item(text)
+        if it:
+            items.append({**it, "context": int(cid or 0)} if packed else it)
+    return {"items": items}
+
+def respond(body: Dict) -> Dict:
+    """
+    Chat-completion response for a request body; usage estimates ~4 chars per token.
+    """
+    user = body["messages"][-1]["content"]
+    fmt = body.get("response_format") or {}
+    props = ((fmt.get("json_schema") or {}).get("schema") or {}).get("properties", {})
+    if "boundaries" in props:
+        out = _boundaries(user)
+    elif "items" in props:
+        packed = "context" in props["items"]["items"]["properties"]
+        out = _qa(user, packed)
+    else:
+        out = {}
+    content = json.dumps(out, ensure_ascii=False)
+    prompt = sum(len(m["content"]) for m in body["messages"])
+    return {"id": "stub", "object": "chat.completion", "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt // 4, "completion_tokens": len(content) // 4}}
+
+class StubLLMServer:
+    """
+    Runs the stub on a background thread: `with StubLLMServer(latency_ms=20) as srv:` and
+    point LLMClient at srv.base_url. `latency_ms` adds a fixed delay per request to mimic
+    model time; requests are served concurrently.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        import time
+        delay = latency_ms / 1000.0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                n = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(n) or b"{}")
+                if delay:
+                    time.sleep(delay)
+                data = json.dumps(respond(body)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="llm-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
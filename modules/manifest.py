@@ -0,0 +1,82 @@
+import hashlib, json, os, threading, time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+_CODE_VERSIONS: Dict[str, str] = {}
+
+def file_digest(path, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for part in iter(lambda: f.read(block), b""):
+            h.update(part)
+    return h.hexdigest()
+
+def code_version(*module_names: str) -> str:
+    """
+    Hash of the source of the given modules (located without importing them),
+    so editing a stage's code invalidates its artifacts.
+    """
+    from importlib.util import find_spec
+    h = hashlib.sha256()
+    for name in module_names:
+        if name not in _CODE_VERSIONS:
+            spec = find_spec(name)
+            origin = spec.origin if spec is not None else None
+            _CODE_VERSIONS[name] = file_digest(origin) if origin and os.path.exists(origin) else "missing"
+        h.update(f"{name}={_CODE_VERSIONS[name]};".encode("utf-8"))
+    return h.hexdigest()
+
+def stage_key(*parts) -> str:
+    s = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+class StageManifest:
+    """
+    work_dir/manifest.json: stage -> {key, outputs, seconds, stats, finished_at}.
+    A stage is fresh when its key matches and every recorded output still exists.
+    Entries are dropped before a stage rebuilds and written only once it finished,
+    so a crashed run resumes at the stage that failed. Safe to update from concurrent stages.
+    """
+    def __init__(self, work_dir, enabled: bool = True):
+        self.path = Path(work_dir) / "manifest.json"
+        self.enabled = enabled
+        self.stages: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            try:
+                self.stages = json.loads(self.path.read_text(encoding="utf-8")).get("stages", {})
+            except Exception:
+                self.stages = {}
+
+    def fresh(self, stage: str, key: str) -> bool:
+        entry = self.stages.get(stage)
+        if not self.enabled or not entry or entry.get("key") != key:
+            return False
+        return all(Path(o).exists() for o in entry.get("outputs", []))
+
+    def stats(self, stage: str) -> Dict:
+        return self.stages.get(stage, {}).get("stats", {})
+
+    def invalidate(self, stage: str):
+        with self._lock:
+            if self.stages.pop(stage, None) is not None:
+                self._save()
+
+    def record(self, stage: str, key: str, outputs: Iterable, seconds: float,
+               stats: Optional[Dict] = None) -> bool:
+        """
+        Marks the stage done; returns False (and records nothing) if an output is missing.
+        """
+        outputs = [str(o) for o in outputs]
+        if not all(Path(o).exists() for o in outputs):
+            return False
+        with self._lock:
+            self.stages[stage] = {"key": key, "outputs": outputs, "seconds": round(seconds, 3),
+                                  "stats": stats or {}, "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            self._save()
+        return True
+
+    def _save(self):
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"stages": self.stages}, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
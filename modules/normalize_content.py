@@ -1,55 +1,203 @@
+import time
 import regex as re
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-def _strip_headers_footers(pages, threshold=0.6):
+from modules.records import Records
+
+DEFAULT_NORMALIZE = {
+    "workers": 1,        # processes for page cleaning; 0 = all cores
+    "threshold": 0.6,    # edge signature frequency relative to the most common one
+    "min_repeats": 2,    # pages an edge signature must appear on to count as header/footer
+}
+
+_DIGITS = re.compile(r"\d+")
+# One pass per page: hyphenated line breaks, space/tab runs, 3+ line breaks, bare \r.
+# Single spaces never match, so the callback only runs where text changes.
+_CLEAN = re.compile(r"(?<=\w)-[\r\n](?=\w)|[ \t]{2,}|\t|[\r\n]{3,}|\r")
+
+def _clean_sub(m) -> str:
+    s = m.group()
+    c = s[0]
+    if c == "-":
+        return ""           # "informa-\ntion" -> "information"
+    if c == " " or c == "\t":
+        return " "
+    return "\n\n" if len(s) >= 3 else "\n"
+
+def _clean_text(txt: str) -> str:
+    return _CLEAN.sub(_clean_sub, txt).strip()
+
+def _signature(line: str) -> str:
+    # digit runs masked, so "Chapter 3 · 41" and "Chapter 3 · 42" share one signature
+    return _DIGITS.sub("#", line.strip())
+
+def _edge_lines(text: str) -> Tuple[str, str]:
+    # first and last non-empty lines without splitting the whole page
+    body = text.strip()
+    if not body:
+        return "", ""
+    i, j = body.find("\n"), body.rfind("\n")
+    return (body if i < 0 else body[:i]), (body if j < 0 else body[j + 1:])
+
+def _common_edges(texts: Iterable[str], threshold=0.6, min_repeats=2) -> Tuple[Set[str], Set[str]]:
+    first, last = Counter(), Counter()
+    for text in texts:
+        head, tail = _edge_lines(text)
+        first[_signature(head)] += 1
+        last[_signature(tail)] += 1
+
+    def common(cnt):
+        cnt.pop("", None)
+        if not cnt:
+            return set()
+        max_freq = max(cnt.values())
+        return {sig for sig, c in cnt.items() if c >= max_freq * threshold and c >= min_repeats}
+    return common(first), common(last)
+
+def detect_headers_footers(pages, threshold=0.6, min_repeats=2) -> Tuple[Set[str], Set[str]]:
     """
-    Heuristic: find repeated first/last lines across pages and remove them.
+    Heuristic: digit-masked signatures of first/last lines that repeat across pages (or a
+    sample of them), collected in one scan.
     """
-    first_lines, last_lines = [], []
-    for p in pages:
-        lines = [ln.strip() for ln in p["text"].splitlines() if ln.strip()]
-        if not lines: 
-            first_lines.append("")
-            last_lines.append("")
-            continue
-        first_lines.append(lines[0])
-        last_lines.append(lines[-1])
-    def common(items):
-        from collections import Counter
-        cnt = Counter(items)
-        if not cnt: return set()
-        max_freq = max(cnt.values())
-        return {it for it, c in cnt.items() if c >= max_freq * threshold and it}
-    common_first = common(first_lines)
-    common_last = common(last_lines)
+    texts = pages.iter_column("text") if isinstance(pages, Records) else (p["text"] for p in pages)
+    return _common_edges(texts, threshold, min_repeats)
 
-    new_pages = []
-    for p in pages:
-        lines = [ln for ln in p["text"].splitlines()]
-        pruned = []
-        for idx, ln in enumerate(lines):
-            if idx == 0 and ln.strip() in common_first: 
-                continue
-            if idx == len(lines)-1 and ln.strip() in common_last:
-                continue
-            pruned.append(ln)
-        txt = "\n".join(pruned)
-        new_pages.append({**p, "text": txt})
-    return new_pages
-
-def _fix_hyphenation(text: str) -> str:
-    # join hyphenated line-breaks: e.g., "informa-\ntion" -> "information"
-    return re.sub(r"(\w+)-\n(\w+)", r"\1\2", text)
-
-def normalize_pages(pages):
+def _strip_text(text: str, common_first: Set[str], common_last: Set[str]) -> str:
+    body = text.strip()
+    if common_first and body:
+        i = body.find("\n")
+        if _signature(body if i < 0 else body[:i]) in common_first:
+            body = "" if i < 0 else body[i + 1:].lstrip()
+    if common_last and body:
+        j = body.rfind("\n")
+        if _signature(body if j < 0 else body[j + 1:]) in common_last:
+            body = "" if j < 0 else body[:j].rstrip()
+    return body
+
+def _normalize_one(text: str, common_first: Set[str], common_last: Set[str]) -> str:
+    return _clean_text(_strip_text(text, common_first, common_last))
+
+def _normalize_batch(args) -> List[Tuple[str, float]]:
+    """
+    Worker: (texts, common_first, common_last) -> [(clean text, seconds)].
+    """
+    texts, common_first, common_last = args
     out = []
-    pages = _strip_headers_footers(pages)
-    for p in pages:
-        txt = p["text"]
-        txt = txt.replace("\r", "\n")
-        txt = _fix_hyphenation(txt)
-        # collapse extra spaces
-        txt = re.sub(r"[ \t]+", " ", txt)
-        # collapse excessive newlines
-        txt = re.sub(r"\n{3,}", "\n\n", txt)
-        out.append({**p, "text": txt.strip()})
+    for t in texts:
+        t0 = time.perf_counter()
+        out.append((_normalize_one(t, common_first, common_last), time.perf_counter() - t0))
     return out
+
+def _resolve_workers(workers) -> int:
+    import os
+    if workers == 0:
+        return os.cpu_count() or 1
+    return workers or 1
+
+class NormalizeStats:
+    """
+    Per-page throughput of the cleaning pass: chars/sec per page (p50 and the slowest page)
+    and totals, as a dict for the report.
+    """
+    def __init__(self):
+        self.pages, self.chars_in, self.chars_out, self.seconds = 0, 0, 0, 0.0
+        self.rates: List[float] = []
+        self.slowest = None
+
+    def add(self, page_num, chars_in: int, chars_out: int, seconds: float):
+        self.pages += 1
+        self.chars_in += chars_in
+        self.chars_out += chars_out
+        self.seconds += seconds
+        rate = chars_in / seconds if seconds > 0 else 0.0
+        if chars_in and seconds > 0:
+            self.rates.append(rate)
+            if self.slowest is None or rate < self.slowest[1]:
+                self.slowest = (page_num, rate)
+
+    def as_dict(self) -> Dict:
+        import numpy as np
+        out = {"pages": self.pages, "chars_in": self.chars_in, "chars_out": self.chars_out,
+               "seconds": round(self.seconds, 4),
+               "chars_per_s": round(self.chars_in / self.seconds, 1) if self.seconds else 0.0}
+        if self.rates:
+            out["page_chars_per_s_p50"] = round(float(np.percentile(self.rates, 50)), 1)
+            out["slowest_page"] = {"page_num": self.slowest[0], "chars_per_s": round(self.slowest[1], 1)}
+        return out
+
+def _clean_texts(parts: Iterable[Tuple[List[str], List]], n_parts: int, common_first, common_last, workers: int,
+                 stats: NormalizeStats) -> Iterator[List[str]]:
+    """
+    parts: (texts, page_nums) batches in page order; yields the cleaned texts per batch, in
+    order. With a pool, at most two batches per worker are in flight.
+    """
+    workers = _resolve_workers(workers)
+
+    def done(texts, page_nums, results):
+        for page_num, src, (clean, secs) in zip(page_nums, texts, results):
+            stats.add(page_num, len(src), len(clean), secs)
+        return [clean for clean, _ in results]
+
+    if workers <= 1 or n_parts < 2:
+        for texts, page_nums in parts:
+            yield done(texts, page_nums, _normalize_batch((texts, common_first, common_last)))
+        return
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=min(workers, n_parts)) as ex:
+        for texts, page_nums in parts:
+            pending.append((texts, page_nums, ex.submit(_normalize_batch, (texts, common_first, common_last))))
+            if len(pending) >= 2 * workers:
+                texts, page_nums, fut = pending.popleft()
+                yield done(texts, page_nums, fut.result())
+        while pending:
+            texts, page_nums, fut = pending.popleft()
+            yield done(texts, page_nums, fut.result())
+
+def normalize_pages(pages, workers: int = 1, threshold: float = 0.6, min_repeats: int = 2,
+                    stats: Optional[Dict] = None):
+    """
+    Header/footer removal + text cleanup, one pass per page, optionally on a process pool
+    (workers > 1; 0 = all cores). Records in, Records out (only the text column is rebuilt);
+    lists of dicts are also accepted. `stats`, if given, is filled with NormalizeStats output.
+    """
+    # several batches per worker so uneven pages still balance out
+    step = max(1, -(-len(pages) // (_resolve_workers(workers) * 4)))
+    n_parts = -(-len(pages) // step)
+    st = NormalizeStats()
+    if isinstance(pages, Records):
+        # the text column is read a record batch at a time and rebuilt as Arrow chunks
+        import pyarrow as pa
+        common_first, common_last = _common_edges(pages.iter_column("text"), threshold, min_repeats)
+        parts = pages.iter_batches("text", "page_num", rows=step)
+        clean = [pa.array(part, type=pa.large_string())
+                 for part in _clean_texts(parts, n_parts, common_first, common_last, workers, st)]
+        out = pages.with_column("text", pa.chunked_array(clean, type=pa.large_string()))
+    else:
+        texts, page_nums = [p["text"] for p in pages], [p.get("page_num") for p in pages]
+        common_first, common_last = _common_edges(texts, threshold, min_repeats)
+        parts = ((texts[s:s + step], page_nums[s:s + step]) for s in range(0, len(texts), step))
+        clean = [t for part in _clean_texts(parts, n_parts, common_first, common_last, workers, st) for t in part]
+        out = [{**p, "text": t} for p, t in zip(pages, clean)]
+    if stats is not None:
+        stats.update(st.as_dict())
+    return out
+
+def iter_normalize_pages(pages: Iterable[Dict], sample: List[Dict], threshold=0.6, min_repeats=2,
+                         stats: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    Streaming variant of normalize_pages. Header/footer signatures are learned from `sample`
+    (a sampled first pass over the book) so pages can be cleaned one at a time.
+    `stats` is filled once the pages are exhausted.
+    """
+    common_first, common_last = detect_headers_footers(sample, threshold, min_repeats)
+    st = NormalizeStats()
+    for p in pages:
+        t0 = time.perf_counter()
+        clean = _normalize_one(p["text"], common_first, common_last)
+        st.add(p.get("page_num"), len(p["text"]), len(clean), time.perf_counter() - t0)
+        yield {**p, "text": clean}
+    if stats is not None:
+        stats.update(st.as_dict())
@@ -0,0 +1,146 @@
+import os, subprocess, sys, time
+from typing import List, Dict, Optional
+
+DEFAULT_OCR = {
+    "workers": 0,          # tesseract processes in flight; 0 = all cores
+    "prefetch": 4,         # rendered pages queued per worker ahead of recognition
+    "dpi": 200,            # full-page scans
+    "sparse_dpi": 150,     # pages where images cover only part of the page
+    "scan_coverage": 0.5,  # image area / page area above which a page counts as a scan
+    "max_pixels": 16_000_000,
+    "lang": "eng",
+}
+
+def _image_coverage(page) -> float:
+    area = page.rect.width * page.rect.height
+    if not area:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        covered += max(0.0, x1 - x0) * max(0.0, y1 - y0)
+    return min(1.0, covered / area)
+
+def choose_dpi(page, ocr_cfg: Dict) -> int:
+    """
+    Per-page DPI policy. Returns 0 when the page has nothing worth recognizing.
+    """
+    coverage = _image_coverage(page)
+    if coverage == 0.0 and not page.get_drawings():
+        return 0
+    dpi = ocr_cfg["dpi"] if coverage >= ocr_cfg["scan_coverage"] else ocr_cfg["sparse_dpi"]
+    # cap pixel count for oversized pages
+    w_in, h_in = page.rect.width / 72.0, page.rect.height / 72.0
+    if w_in > 0 and h_in > 0:
+        cap = int((ocr_cfg["max_pixels"] / (w_in * h_in)) ** 0.5)
+        dpi = min(dpi, max(72, cap))
+    return dpi
+
+def _render_gray(page, dpi: int):
+    import fitz  # PyMuPDF
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    return pix.width, pix.height, pix.stride, bytes(pix.samples)
+
+def _tesseract_cmd() -> str:
+    # honours a path set through pytesseract.pytesseract.tesseract_cmd
+    try:
+        import pytesseract
+        return pytesseract.pytesseract.tesseract_cmd
+    except ImportError:
+        return "tesseract"
+
+def _recognize(width: int, height: int, stride: int, samples: bytes, lang: str):
+    """
+    One tesseract subprocess reading the page as a binary PGM on stdin. OMP_THREAD_LIMIT=1 is
+    set in that subprocess's environment only (parallelism comes from the pool), so numpy /
+    torch in this process keep their thread settings. Raises on failure.
+    """
+    t0 = time.perf_counter()
+    if stride != width:
+        samples = b"".join(samples[r * stride:r * stride + width] for r in range(height))
+    pgm = b"P5\n%d %d\n255\n" % (width, height) + samples
+    proc = subprocess.run([_tesseract_cmd(), "stdin", "stdout", "-l", lang], input=pgm, capture_output=True,
+                          env={**os.environ, "OMP_THREAD_LIMIT": "1"})
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode("utf-8", "replace").strip() or f"tesseract exited {proc.returncode}")
+    return proc.stdout.decode("utf-8", "replace"), (time.perf_counter() - t0) * 1000.0
+
+def ocr_pages(pdf_path: str, pages: List[Dict], ocr_cfg: Optional[Dict] = None) -> List[Dict]:
+    """
+    OCR the given page records in place (located in the PDF by page_num).
+    Rendering runs ahead on the calling thread into raw grayscale buffers while a bounded
+    pool of tesseract workers recognizes them. Per-page timing goes to meta["ocr"]; pages that
+    fail to render or recognize keep their text, get meta["ocr"]["error"] and are logged.
+    """
+    if not pages:
+        return pages
+    import fitz  # PyMuPDF
+    from concurrent.futures import ThreadPoolExecutor
+    from collections import deque
+
+    cfg = {**DEFAULT_OCR, **(ocr_cfg or {})}
+    workers = cfg["workers"] or os.cpu_count() or 1
+    max_pending = max(1, workers * cfg["prefetch"])
+    counts = {"pages": len(pages), "blank": 0, "failed": 0}
+
+    def _failed(p, dpi, stage, e):
+        counts["failed"] += 1
+        p["meta"]["ocr"] = {"dpi": dpi, "error": f"{stage}: {type(e).__name__}: {e}"}
+        print(f"[warn] OCR page {p['page_num']} failed ({stage}):", e, file=sys.stderr)
+
+    def _finish(item):
+        p, dpi, render_ms, fut = item
+        try:
+            text, ocr_ms = fut.result()
+        except Exception as e:
+            _failed(p, dpi, "recognize", e)
+            return
+        if text.strip():
+            p["text"] = text
+        p["meta"]["ocr"] = {"dpi": dpi, "render_ms": round(render_ms, 2), "ocr_ms": round(ocr_ms, 2)}
+
+    doc = fitz.open(pdf_path)
+    pending = deque()
+    try:
+        # tesseract runs as a subprocess, so threads are enough to keep cores busy
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            for p in pages:
+                page = doc[p["page_num"] - 1]
+                dpi = choose_dpi(page, cfg)
+                if dpi == 0:
+                    counts["blank"] += 1
+                    p["meta"]["ocr"] = {"dpi": 0, "render_ms": 0.0, "ocr_ms": 0.0}
+                    continue
+                t0 = time.perf_counter()
+                try:
+                    w, h, stride, samples = _render_gray(page, dpi)
+                except Exception as e:
+                    _failed(p, dpi, "render", e)
+                    continue
+                render_ms = (time.perf_counter() - t0) * 1000.0
+                pending.append((p, dpi, render_ms, ex.submit(_recognize, w, h, stride, samples, cfg["lang"])))
+                while len(pending) >= max_pending:
+                    _finish(pending.popleft())
+            while pending:
+                _finish(pending.popleft())
+    finally:
+        doc.close()
+    if counts["failed"]:
+        print(f"[warn] OCR failed on {counts['failed']} of {counts['pages']} pages", file=sys.stderr)
+    return pages
+
+def tally_ocr(tally: Dict, page: Dict) -> Dict:
+    """
+    Adds one parsed page to an OCR summary for report.json: pages sent to OCR, blank pages
+    skipped, and failed pages with their page numbers.
+    """
+    info = (page.get("meta") or {}).get("ocr")
+    if info is not None:
+        tally["pages"] = tally.get("pages", 0) + 1
+        tally["blank"] = tally.get("blank", 0) + (info.get("dpi") == 0)
+        tally.setdefault("failed", 0)
+        tally.setdefault("failed_pages", [])
+        if "error" in info:
+            tally["failed"] += 1
+            tally["failed_pages"].append(page["page_num"])
+    return tally
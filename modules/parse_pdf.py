@@ -1,35 +1,154 @@
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional
 
-def _ocr_image_pil(pil_img):
+from modules.profiling import span
+
+OCR_MIN_CHARS = 20
+FONT_LINE_CHARS = 120  # lines longer than this are never heading candidates
+
+def _font_info(page) -> Dict:
+    """
+    Font data for heading scoring: chars per font size (rounded to 0.5pt) and the short
+    lines with their dominant size and bold flag.
+    """
+    sizes, lines = {}, []
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            spans = [sp for sp in line["spans"] if sp["text"].strip()]
+            if not spans:
+                continue
+            n = sum(len(sp["text"]) for sp in spans)
+            size = round(max(spans, key=lambda sp: len(sp["text"]))["size"] * 2) / 2
+            sizes[size] = sizes.get(size, 0) + n
+            text = " ".join("".join(sp["text"] for sp in spans).split())
+            if len(text) <= FONT_LINE_CHARS:
+                bold = all(sp["flags"] & 16 or "Bold" in sp["font"] for sp in spans)
+                lines.append([text, size, bool(bold)])
+    return {"sizes": {str(k): v for k, v in sizes.items()}, "lines": lines}
+
+def _page_record(page, i: int, fonts: bool = False) -> Dict:
+    # timed only in-process; pages extracted in pool workers are not traced
+    with span("parse.page", "parse", page=i + 1):
+        text = page.get_text("text") or ""
+        meta = {"width": page.rect.width, "height": page.rect.height}
+        if fonts:
+            meta["fonts"] = _font_info(page)
+    return {"page_num": i + 1, "text": text, "meta": meta}
+
+def _extract_range(args) -> List[Dict]:
+    """
+    Worker: opens its own fitz handle and extracts pages [start, end).
+    """
+    import fitz  # PyMuPDF
+    pdf_path, start, end, fonts = args
+    doc = fitz.open(pdf_path)
     try:
-        import pytesseract
-        return pytesseract.image_to_string(pil_img)
-    except Exception:
-        return ""
+        return [_page_record(doc[i], i, fonts) for i in range(start, end)]
+    finally:
+        doc.close()
 
-def parse_pdf_to_pages(pdf_path: str, ocr_if_needed: bool = False) -> List[Dict]:
+def _shard_ranges(n_pages: int, workers: int, shards_per_worker: int = 4):
+    # several contiguous shards per worker so uneven pages still balance out
+    n_shards = max(1, min(n_pages, workers * shards_per_worker))
+    step = -(-n_pages // n_shards)
+    return [(s, min(s + step, n_pages)) for s in range(0, n_pages, step)]
+
+def _resolve_workers(workers) -> int:
+    import os
+    if workers == 0:
+        return os.cpu_count() or 1
+    return workers or 1
+
+def _ocr_low_text(pdf_path: str, pages: List[Dict], ocr_cfg: Optional[Dict]):
+    # If page is mostly image and OCR requested
+    from modules.ocr import ocr_pages
+    ocr_pages(str(pdf_path), [p for p in pages if len(p["text"].strip()) < OCR_MIN_CHARS], ocr_cfg)
+
+def parse_pdf_to_pages(pdf_path: str, ocr_if_needed: bool = False, workers: int = 1,
+                       ocr_cfg: Optional[Dict] = None, pool=None, fonts: bool = False) -> List[Dict]:
     """
     Returns: list of dicts: {page_num, text, meta}
     Attempts text extraction with PyMuPDF, falls back to OCR if page has very low text and OCR enabled.
+    With workers > 1 the page range is sharded across a process pool; pages come back in order.
+    workers=0 uses all cores. `pool` is an existing executor to shard onto (shared across books
+    in batch mode) instead of a fresh one. OCR settings: see modules.ocr.DEFAULT_OCR.
+    fonts=True adds meta["fonts"] (see _font_info) for hybrid structuring.
     """
     import fitz  # PyMuPDF
-    from PIL import Image
-    import io
 
-    pages = []
+    workers = _resolve_workers(workers)
     doc = fitz.open(pdf_path)
-    for i, page in enumerate(doc):
-        text = page.get_text("text") or ""
-        meta = {"width": page.rect.width, "height": page.rect.height}
-        # If page is mostly image and OCR requested
-        if ocr_if_needed and len(text.strip()) < 20:
-            try:
-                pix = page.get_pixmap(dpi=200)
-                img = Image.open(io.BytesIO(pix.tobytes("png")))
-                text = _ocr_image_pil(img) or text
-            except Exception:
-                pass
-        pages.append({"page_num": i + 1, "text": text, "meta": meta})
-    doc.close()
+    n_pages = doc.page_count
+    if workers <= 1 or n_pages < 2:
+        try:
+            pages = [_page_record(page, i, fonts) for i, page in enumerate(doc)]
+        finally:
+            doc.close()
+    else:
+        doc.close()
+        from concurrent.futures import ProcessPoolExecutor
+        ranges = _shard_ranges(n_pages, workers)
+        pages = []
+        ex = pool or ProcessPoolExecutor(max_workers=min(workers, len(ranges)))
+        try:
+            for part in ex.map(_extract_range, [(str(pdf_path), s, e, fonts) for s, e in ranges]):
+                pages.extend(part)
+        finally:
+            if pool is None:
+                ex.shutdown()
+
+    if ocr_if_needed:
+        _ocr_low_text(pdf_path, pages, ocr_cfg)
     return pages
+
+def iter_pdf_pages(pdf_path: str, ocr_if_needed: bool = False, workers: int = 1,
+                   ocr_cfg: Optional[Dict] = None, window: int = 64, fonts: bool = False) -> Iterator[Dict]:
+    """
+    Streaming variant of parse_pdf_to_pages: yields page records in order, holding at most
+    `window` pages at a time. Each window is sharded across the pool when workers > 1.
+    """
+    import fitz  # PyMuPDF
+
+    workers = _resolve_workers(workers)
+    doc = fitz.open(pdf_path)
+    n_pages = doc.page_count
+    ex = None
+    if workers > 1:
+        doc.close()
+        from concurrent.futures import ProcessPoolExecutor
+        ex = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for s in range(0, n_pages, window):
+            e = min(s + window, n_pages)
+            if ex is None:
+                pages = [_page_record(doc[i], i, fonts) for i in range(s, e)]
+            else:
+                pages = []
+                ranges = [(s + a, s + b) for a, b in _shard_ranges(e - s, workers, shards_per_worker=1)]
+                for part in ex.map(_extract_range, [(str(pdf_path), a, b, fonts) for a, b in ranges]):
+                    pages.extend(part)
+            if ocr_if_needed:
+                _ocr_low_text(pdf_path, pages, ocr_cfg)
+            yield from pages
+    finally:
+        if ex is None:
+            doc.close()
+        else:
+            ex.shutdown()
+
+def sample_pdf_pages(pdf_path: str, n: int = 64, fonts: bool = False) -> List[Dict]:
+    """
+    Text of up to n evenly spaced pages (no OCR); used for sampled first passes.
+    """
+    import fitz  # PyMuPDF
+    doc = fitz.open(pdf_path)
+    try:
+        import numpy as np
+        total = doc.page_count
+        if total == 0 or n <= 0:
+            return []
+        # spread over the whole book, first and last page included
+        idx = np.unique(np.linspace(0, total - 1, min(n, total)).astype(int))
+        return [_page_record(doc[int(i)], int(i), fonts) for i in idx]
+    finally:
+        doc.close()
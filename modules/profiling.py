@@ -0,0 +1,248 @@
+import json, os, sys, threading, time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+DEFAULT_PROFILE = {
+    "enabled": True,           # stage timings + hot-loop span totals under "profile" in report.json
+    "trace": False,            # also write reports/trace.json (Chrome trace events: chrome://tracing, Perfetto)
+    "max_events": 200000,      # trace events kept; later spans still count in the totals
+    "sample_interval_ms": 0,   # > 0: stack sampler writing reports/profile.folded (flamegraph input)
+}
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+class Profiler:
+    """
+    Per-stage wall / CPU time, peak RSS and items/s, plus count/total/max per span name for hot
+    loops (pages, LLM calls, embedding batches), optionally kept as Chrome trace events.
+    Thread-safe. CPU time is process-wide, so stages overlapping other threads include their
+    work. A disabled Profiler only checks a flag.
+    """
+    def __init__(self, enabled=True, trace=False, max_events=200000, **_):
+        self.enabled = enabled
+        self.stages: Dict[str, Dict] = {}
+        self.spans: Dict[str, Dict] = {}
+        self.events = [] if enabled and trace else None
+        self.max_events = max_events
+        self.dropped = 0
+        self._incl: Dict[str, list] = {}  # timed(): inclusive [wall, cpu] per lazy stage
+        self._local = threading.local()   # stage(): per-thread stack of open stages' child time
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _event(self, name, cat, start, dur, args=None):
+        if self.events is None:
+            return
+        with self._lock:
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            self.events.append({"name": name, "cat": cat, "ph": "X", "ts": round((start - self._t0) * 1e6, 1),
+                                "dur": round(dur * 1e6, 1), "pid": os.getpid(), "tid": threading.get_ident(),
+                                "args": args or {}})
+
+    def _record(self, name, start, wall, cpu, rss, growth, rec):
+        out = {"wall_s": round(wall, 4), "cpu_s": round(cpu, 4)}
+        if rss is not None:
+            out["peak_rss_mb"] = rss
+            out["peak_rss_growth_mb"] = round(growth, 1)
+        n = rec.pop("items", None)
+        if n is not None:
+            out["items"] = n
+            out["items_per_s"] = round(n / wall, 1) if wall > 0 else 0.0
+        out.update(rec)
+        with self._lock:
+            self.stages[name] = out
+        self._event(name, "stage", start, time.perf_counter() - start, out)
+
+    @contextmanager
+    def stage(self, name: str, exclude: Optional[str] = None):
+        """
+        Times one pipeline stage. The yielded dict takes "items" (for items/s) and any extra
+        keys to keep. Stages opened inside it on the same thread (an upstream stage built on
+        demand) are subtracted, as is time inside `exclude`, a timed() stage it pulls from.
+        """
+        rec: Dict = {}
+        if not self.enabled:
+            yield rec
+            return
+        stack = self._local.__dict__.setdefault("stack", [])
+        child = [0.0, 0.0, 0.0]  # wall, cpu, peak RSS growth of nested stages
+        stack.append(child)
+        w0, c0, r0 = time.perf_counter(), time.process_time(), _peak_rss_mb()
+        x0 = list(self._incl.get(exclude, (0.0, 0.0)))
+        try:
+            yield rec
+        finally:
+            rss = _peak_rss_mb()
+            total = [time.perf_counter() - w0, time.process_time() - c0, (rss or 0.0) - (r0 or 0.0)]
+            stack.pop()
+            if stack:
+                for i in range(3):
+                    stack[-1][i] += total[i]
+            wall, cpu, growth = (t - c for t, c in zip(total, child))
+            if exclude:
+                x1 = self._incl.get(exclude, (0.0, 0.0))
+                wall, cpu = wall - (x1[0] - x0[0]), cpu - (x1[1] - x0[1])
+            self._record(name, w0, wall, cpu, rss, growth, rec)
+
+    def timed(self, name: str, it: Iterable, upstream: Optional[str] = None) -> Iterator:
+        """
+        Wraps a lazy stage of a generator chain. Time spent in its next() minus the time spent
+        in `upstream` (the timed stage it pulls from) is recorded as stage `name`, with the
+        items it yielded, once it is exhausted.
+        """
+        if not self.enabled:
+            yield from it
+            return
+        incl = self._incl.setdefault(name, [0.0, 0.0])
+        it = iter(it)
+        n, start, r0 = 0, time.perf_counter(), _peak_rss_mb()
+        while True:
+            w0, c0 = time.perf_counter(), time.process_time()
+            try:
+                item = next(it)
+            except StopIteration:
+                break
+            finally:
+                incl[0] += time.perf_counter() - w0
+                incl[1] += time.process_time() - c0
+            n += 1
+            yield item
+        up = self._incl.get(upstream, (0.0, 0.0))
+        rss = _peak_rss_mb()
+        # RSS growth here spans the whole chain up to this stage's last item
+        self._record(name, start, incl[0] - up[0], incl[1] - up[1], rss, (rss or 0.0) - (r0 or 0.0), {"items": n})
+
+    @contextmanager
+    def span(self, name: str, cat: str = "span", **args):
+        """
+        Hot-loop timing: adds to the count/total/max of `name`. The yielded dict becomes the
+        trace event's args, so callers can attach results (e.g. token counts).
+        """
+        if not self.enabled:
+            yield args
+            return
+        t0 = time.perf_counter()
+        try:
+            yield args
+        finally:
+            dur = time.perf_counter() - t0
+            with self._lock:
+                s = self.spans.get(name)
+                if s is None:
+                    s = self.spans[name] = {"count": 0, "total_s": 0.0, "max_s": 0.0}
+                s["count"] += 1
+                s["total_s"] += dur
+                s["max_s"] = max(s["max_s"], dur)
+            self._event(name, cat, t0, dur, args)
+
+    def as_dict(self, report: Optional[Dict] = None) -> Dict:
+        """
+        Stages, span totals and, from the other report sections, cache hit rates and LLM tokens.
+        """
+        with self._lock:
+            out = {"stages": dict(self.stages)}
+            if self.spans:
+                out["spans"] = {k: {"count": s["count"], "total_s": round(s["total_s"], 4),
+                                    "mean_ms": round(1000 * s["total_s"] / s["count"], 3),
+                                    "max_ms": round(1000 * s["max_s"], 3)} for k, s in self.spans.items()}
+        rates = _rates(report or {})
+        if rates:
+            out.update(rates)
+        if self.dropped:
+            out["trace_events_dropped"] = self.dropped
+        return out
+
+    def write_trace(self, path) -> Optional[str]:
+        if self.events is None:
+            return None
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return str(path)
+
+def _rate(hits, misses) -> Optional[float]:
+    total = (hits or 0) + (misses or 0)
+    return round((hits or 0) / total, 4) if total else None
+
+def _rates(report: Dict) -> Dict:
+    out, hit_rates = {}, {}
+    if "llm_cache" in report:
+        hit_rates["llm"] = _rate(report["llm_cache"].get("hits"), report["llm_cache"].get("misses"))
+    if "embeddings" in report:
+        hit_rates["embeddings"] = _rate(report["embeddings"].get("cached"), report["embeddings"].get("encoded"))
+    if "qa" in report:
+        hit_rates["qa"] = _rate(report["qa"].get("cached"), report["qa"].get("generated"))
+    hit_rates = {k: v for k, v in hit_rates.items() if v is not None}
+    if hit_rates:
+        out["cache_hit_rates"] = hit_rates
+    if "llm" in report:
+        out["llm_tokens"] = {k: report["llm"].get(f"{k}_tokens", 0) for k in ("prompt", "completion")}
+    return out
+
+class StackSampler:
+    """
+    Opt-in sampling profiler: a daemon thread snapshots every other thread's Python stack each
+    `interval_ms` and counts collapsed stacks. write() emits "frame;frame;frame count" lines
+    (flamegraph.pl / speedscope input). Process-pool workers are not sampled.
+    """
+    def __init__(self, interval_ms: float = 5):
+        self.interval = interval_ms / 1000.0
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    co = frame.f_code
+                    stack.append(f"{co.co_name} ({os.path.basename(co.co_filename)}:{co.co_firstlineno})")
+                    frame = frame.f_back
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self) -> "StackSampler":
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self, path) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.counts.most_common():
+                f.write(f"{stack} {n}\n")
+        return str(path)
+
+# Process-wide profiler for hot loops deep in the modules; main() activates a real one.
+_ACTIVE = Profiler(enabled=False)
+
+def active() -> Profiler:
+    return _ACTIVE
+
+def activate(prof: Profiler) -> Profiler:
+    global _ACTIVE
+    _ACTIVE = prof
+    return prof
+
+def span(name: str, cat: str = "span", **args):
+    return _ACTIVE.span(name, cat, **args)
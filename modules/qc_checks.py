@@ -1,11 +1,20 @@
-def build_report(pages, chunks):
-    total_chars_source = sum(len(p["text"]) for p in pages)
-    total_chars_chunks = sum(len(c["text"]) for c in chunks)
-    coverage = (total_chars_chunks / total_chars_source) if total_chars_source else 0.0
-    return {
-        "pages": len(pages),
-        "chunks": len(chunks),
-        "source_chars": total_chars_source,
-        "chunk_chars": total_chars_chunks,
+def report_from_counts(n_pages, source_chars, n_chunks, chunk_chars, dedup=None):
+    """
+    dedup: modules.dedup.dedup_stats output (duplicate clusters and the work saved), if run.
+    """
+    coverage = (chunk_chars / source_chars) if source_chars else 0.0
+    report = {
+        "pages": n_pages,
+        "chunks": n_chunks,
+        "source_chars": source_chars,
+        "chunk_chars": chunk_chars,
         "coverage_ratio": round(coverage, 3)
     }
+    if dedup:
+        report["dedup"] = dedup
+    return report
+
+def build_report(pages, chunks, dedup=None):
+    total_chars_source = sum(len(p["text"]) for p in pages)
+    total_chars_chunks = sum(len(c["text"]) for c in chunks)
+    return report_from_counts(len(pages), total_chars_source, len(chunks), total_chars_chunks, dedup)
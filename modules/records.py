@@ -0,0 +1,131 @@
+import json, os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List
+
+# Column layout per record kind. Pages keep meta as flat width/height columns, plus the
+# optional font data (meta["fonts"]) as JSON.
+KINDS = {
+    "pages": [("page_num", "int32"), ("text", "large_string"), ("width", "float32"), ("height", "float32"),
+              ("fonts", "large_string")],
+    "blocks": [("section_path", "string"), ("page", "int32"), ("text", "large_string")],
+    "chunks": [("chunk_id", "int64"), ("section", "string"), ("page_start", "int32"), ("page_end", "int32"),
+               ("text", "large_string")],
+}
+ITER_ROWS = 4096  # rows converted to dicts per record batch while iterating
+
+def _schema(kind: str):
+    import pyarrow as pa
+    return pa.schema([(name, getattr(pa, typ)()) for name, typ in KINDS[kind]])
+
+def _flat(kind: str, row: Dict) -> Dict:
+    if kind == "pages":
+        meta = row.get("meta") or {}
+        fonts = meta.get("fonts")
+        return {**row, "width": meta.get("width"), "height": meta.get("height"),
+                "fonts": json.dumps(fonts, separators=(",", ":")) if fonts is not None else None}
+    return row
+
+def _nested(kind: str, row: Dict) -> Dict:
+    if kind == "pages":
+        meta = {"width": row["width"], "height": row["height"]}
+        if row.get("fonts") is not None:
+            meta["fonts"] = json.loads(row["fonts"])
+        return {"page_num": row["page_num"], "text": row["text"], "meta": meta}
+    return row
+
+class Records:
+    """
+    Columnar pages / blocks / chunks backed by a pyarrow Table (layouts in KINDS). Stages read
+    and replace whole columns without per-row dicts: `column` is the Arrow column itself (no
+    copy), `iter_column` / `iter_batches` convert one record batch at a time, `to_list` is for
+    small callers that need a Python list, and `with_column` takes lists or Arrow arrays.
+    Untouched columns share their buffers. `save` writes an Arrow IPC file and `load`
+    memory-maps it, so reloading a stage costs no parse or copy. Iterating yields the usual dict
+    rows, one record batch at a time, for code at the output edge.
+    """
+    __slots__ = ("kind", "table")
+
+    def __init__(self, kind: str, table):
+        self.kind = kind
+        self.table = table
+
+    @classmethod
+    def from_rows(cls, kind: str, rows: Iterable[Dict]) -> "Records":
+        names = [name for name, _ in KINDS[kind]]
+        cols: Dict[str, list] = {name: [] for name in names}
+        for row in rows:
+            row = _flat(kind, row)
+            for name in names:
+                cols[name].append(row.get(name))
+        return cls.from_columns(kind, cols)
+
+    @classmethod
+    def from_columns(cls, kind: str, cols: Dict[str, list]) -> "Records":
+        import pyarrow as pa
+        return cls(kind, pa.Table.from_pydict(cols, schema=_schema(kind)))
+
+    @classmethod
+    def load(cls, kind: str, path) -> "Records":
+        import pyarrow as pa
+        # buffers point into the mapping, which stays open while the table is referenced
+        return cls(kind, pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all())
+
+    def save(self, path) -> str:
+        import pyarrow as pa
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, self.table.schema) as writer:
+            writer.write_table(self.table)
+        os.replace(tmp, path)
+        return str(path)
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def column(self, name: str):
+        """
+        The pyarrow ChunkedArray; for a loaded file its buffers are the memory mapping.
+        """
+        return self.table.column(name)
+
+    def iter_batches(self, *names: str, rows: int = ITER_ROWS) -> Iterator[tuple]:
+        """
+        Per record batch of at most `rows` rows, a tuple with one Python list per named column.
+        """
+        for batch in self.table.select(list(names)).to_batches(max_chunksize=max(1, rows)):
+            yield tuple(col.to_pylist() for col in batch.columns)
+
+    def iter_column(self, *names: str, rows: int = ITER_ROWS) -> Iterator:
+        """
+        Values of one column (or tuples over several), converted a record batch at a time.
+        """
+        for cols in self.iter_batches(*names, rows=rows):
+            yield from (cols[0] if len(names) == 1 else zip(*cols))
+
+    def to_list(self, name: str) -> List:
+        return self.table.column(name).to_pylist()
+
+    def char_lengths(self, name: str = "text") -> List[int]:
+        import pyarrow.compute as pc
+        return pc.utf8_length(self.table.column(name)).to_pylist()
+
+    def total_chars(self, name: str = "text") -> int:
+        import pyarrow.compute as pc
+        return int(pc.sum(pc.utf8_length(self.table.column(name))).as_py() or 0)
+
+    def with_column(self, name: str, values) -> "Records":
+        import pyarrow as pa
+        i = self.table.schema.get_field_index(name)
+        field = self.table.schema.field(i)
+        if isinstance(values, (pa.Array, pa.ChunkedArray)):
+            col = values.cast(field.type)
+        else:
+            col = pa.array(values, type=field.type)
+        return Records(self.kind, self.table.set_column(i, field, col))
+
+    def __iter__(self) -> Iterator[Dict]:
+        for batch in self.table.to_batches(max_chunksize=ITER_ROWS):
+            cols = batch.to_pydict()
+            names = list(cols)
+            for vals in zip(*(cols[n] for n in names)):
+                yield _nested(self.kind, dict(zip(names, vals)))
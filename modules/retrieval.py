@@ -0,0 +1,224 @@
+import json, sys, threading, time
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+
+RRF_K = 60
+
+class ChunkStore:
+    """
+    Random access to chunks.jsonl by chunk_id through a byte-offset table
+    (chunks.offsets.npy, rebuilt when the JSONL is newer). Rows are read on demand.
+    """
+    def __init__(self, jsonl_path):
+        self.path = Path(jsonl_path)
+        off_path = self.path.with_suffix(".offsets.npy")
+        if not off_path.exists() or off_path.stat().st_mtime < self.path.stat().st_mtime:
+            offsets = []
+            with open(self.path, "rb") as f:
+                pos = 0
+                for line in f:
+                    if line.strip():
+                        offsets.append(pos)
+                    pos += len(line)
+            np.save(off_path, np.asarray(offsets, dtype=np.int64))
+        self.offsets = np.load(off_path, mmap_mode="r")
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _fh(self):
+        if not hasattr(self._local, "f"):
+            self._local.f = open(self.path, "rb")
+        return self._local.f
+
+    def get(self, chunk_id: int) -> Optional[Dict]:
+        # chunk_id is the row position in chunks.jsonl in every pipeline mode
+        if not 0 <= chunk_id < len(self.offsets):
+            return None
+        f = self._fh()
+        f.seek(int(self.offsets[chunk_id]))
+        return json.loads(f.readline())
+
+    def get_many(self, ids: List[int]) -> List[Optional[Dict]]:
+        return [self.get(i) for i in ids]
+
+def _percentiles(ms: List[float]) -> Dict:
+    ms = np.asarray(ms, dtype=np.float64)
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {"queries": int(len(ms)), "p50_ms": round(float(p50), 3), "p90_ms": round(float(p90), 3),
+            "p99_ms": round(float(p99), 3), "max_ms": round(float(ms.max()), 3)}
+
+class LatencyStats:
+    """
+    Single-query calls are measured per query ("per_query"). A batch call is one measurement;
+    its wall time split evenly over its queries is reported apart as "batch_amortized", since
+    those figures are not per-query latencies.
+    """
+    def __init__(self):
+        self._single: List[float] = []
+        self._batches: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def add(self, ms: float, n: int = 1):
+        with self._lock:
+            if n == 1:
+                self._single.append(ms)
+            else:
+                self._batches.append((ms, n))
+
+    def summary(self) -> Dict:
+        with self._lock:
+            single, batches = list(self._single), list(self._batches)
+        out = {"queries": len(single) + sum(n for _, n in batches)}
+        if single:
+            out["per_query"] = _percentiles(single)
+        if batches:
+            out["batch_amortized"] = {"batches": len(batches),
+                                      **_percentiles([ms / n for ms, n in batches for _ in range(n)])}
+        return out
+
+def rrf(rankings: List[List[int]], k: int = RRF_K) -> List[tuple]:
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda x: -x[1])
+
+class Retriever:
+    """
+    Loads the built artifacts once: BM25 (indices/bm25), TF-IDF (indices/tfidf), dense vectors
+    (indices/faiss.index, else a scan over the memory-mapped embedding store, rescored when full
+    vectors were kept) and chunks.jsonl.
+    Modes: "bm25", "tfidf" (cosine), "dense", "hybrid" (reciprocal-rank fusion of BM25 and dense).
+    """
+    def __init__(self, chunks_path, indices_dir, embeddings_dir=None, embed_cfg: Optional[Dict] = None):
+        indices_dir = Path(indices_dir)
+        self.store = ChunkStore(chunks_path)
+        self.embed_cfg = embed_cfg or {}
+        self.latency = LatencyStats()
+        self.bm25 = None
+        if (indices_dir / "bm25" / "meta.json").exists():
+            from modules.bm25_index import load_bm25
+            self.bm25 = load_bm25(indices_dir / "bm25")
+        self.tfidf = None
+        if (indices_dir / "tfidf" / "meta.json").exists():
+            from modules.bm25_index import load_tfidf
+            self.tfidf = load_tfidf(indices_dir / "tfidf")
+        self.faiss_index = None
+        if (indices_dir / "faiss.index").exists():
+            try:
+                import faiss
+                self.faiss_index = faiss.read_index(str(indices_dir / "faiss.index"))
+            except Exception as e:
+                print("[warn] FAISS index not loaded:", e, file=sys.stderr)
+        self.vecs = None
+        if self.faiss_index is None and embeddings_dir:
+            from modules.embed_store import EmbeddingStore, FULL, save_embeddings
+            if not EmbeddingStore.exists(embeddings_dir) and (Path(embeddings_dir) / FULL).exists():
+                # outputs from before the embedding store: describe the plain float32 matrix
+                save_embeddings(np.load(Path(embeddings_dir) / FULL, mmap_mode="r"), embeddings_dir)
+            if EmbeddingStore.exists(embeddings_dir):
+                self.vecs = EmbeddingStore(embeddings_dir)
+
+    @property
+    def modes(self) -> List[str]:
+        dense = self.faiss_index is not None or self.vecs is not None
+        return [m for m, ok in (("bm25", self.bm25 is not None), ("tfidf", self.tfidf is not None), ("dense", dense),
+                                ("hybrid", self.bm25 is not None and dense)) if ok]
+
+    def _dense(self, queries: List[str], k: int) -> List[List[tuple]]:
+        from modules.embeddings import embed_texts
+        q = embed_texts(queries, model_name=self.embed_cfg.get("model_name", "sentence-transformers/all-MiniLM-L6-v2"),
+                        device=self.embed_cfg.get("device", "cpu"))
+        if self.faiss_index is not None:
+            scores, ids = self.faiss_index.search(np.ascontiguousarray(q, dtype="float32"), k)
+            return [[(int(i), float(s)) for i, s in zip(ir, sr) if i >= 0] for ir, sr in zip(ids, scores)]
+        return [self.vecs.search(row, k) for row in q]
+
+    def search_batch(self, queries: List[str], k: int = 10, mode: str = "hybrid", with_rows: bool = True) -> List[List[Dict]]:
+        if mode not in self.modes:
+            raise ValueError(f"mode {mode!r} unavailable; built indexes support {self.modes}")
+        t0 = time.perf_counter()
+        # fetch deeper candidate lists for fusion
+        depth = k * 4 if mode == "hybrid" else k
+        sparse = [self.bm25.search(q, depth) for q in queries] if mode in ("bm25", "hybrid") else None
+        if mode == "tfidf":
+            sparse = self.tfidf.search_batch(queries, k)
+        dense = self._dense(queries, depth) if mode in ("dense", "hybrid") else None
+        results = []
+        for i in range(len(queries)):
+            if mode in ("bm25", "tfidf"):
+                hits = sparse[i][:k]
+            elif mode == "dense":
+                hits = dense[i][:k]
+            else:
+                hits = rrf([[d for d, _ in sparse[i]], [d for d, _ in dense[i]]])[:k]
+            rows = self.store.get_many([d for d, _ in hits]) if with_rows else [None] * len(hits)
+            results.append([{"chunk_id": d, "score": s, **({"chunk": r} if with_rows else {})}
+                            for (d, s), r in zip(hits, rows)])
+        self.latency.add((time.perf_counter() - t0) * 1000.0, max(1, len(queries)))
+        return results
+
+    def search(self, query: str, k: int = 10, mode: str = "hybrid", with_rows: bool = True) -> List[Dict]:
+        return self.search_batch([query], k, mode, with_rows)[0]
+
+def serve(retriever: Retriever, host: str = "127.0.0.1", port: int = 8765):
+    """
+    GET  /search?q=...&k=10&mode=hybrid
+    POST /search  {"queries": [...], "k": 10, "mode": "hybrid"}
+    GET  /chunk/<id>
+    GET  /stats   latency percentiles and available modes
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, obj):
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                if url.path == "/search":
+                    qs = parse_qs(url.query)
+                    res = retriever.search(qs["q"][0], int(qs.get("k", ["10"])[0]), qs.get("mode", ["hybrid"])[0])
+                    self._send(200, {"results": res})
+                elif url.path.startswith("/chunk/"):
+                    row = retriever.store.get(int(url.path.rsplit("/", 1)[1]))
+                    self._send(200 if row else 404, row or {"error": "not found"})
+                elif url.path == "/stats":
+                    self._send(200, {"latency": retriever.latency.summary(), "modes": retriever.modes,
+                                     "chunks": len(retriever.store)})
+                else:
+                    self._send(404, {"error": "not found"})
+            except (KeyError, ValueError) as e:
+                self._send(400, {"error": str(e)})
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/search":
+                return self._send(404, {"error": "not found"})
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                res = retriever.search_batch(req["queries"], int(req.get("k", 10)), req.get("mode", "hybrid"))
+                self._send(200, {"results": res})
+            except (KeyError, ValueError) as e:
+                self._send(400, {"error": str(e)})
+
+        def log_message(self, fmt, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving {retriever.modes} on http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
@@ -0,0 +1,115 @@
+import sys, threading, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable
+
+DEFAULT_SCHEDULER = {
+    "parallel": True,   # false: post-chunking stages run one at a time, in declaration order
+    "threads": 4,       # stages running at once (LLM QA, embedding, Pinecone, FAISS, ...)
+    "processes": 2,     # worker processes for CPU-bound pure-Python stages (BM25, TF-IDF); 0 = in-thread
+}
+
+class StageGraph:
+    """
+    Post-chunking stages as a small dependency graph. add(name, fn, deps) declares a stage
+    that needs the stages in `deps` (declared earlier); run() starts every stage whose deps
+    have finished, up to `threads` at a time, so independent stages overlap and wall time
+    approaches the longest dependency chain instead of the sum.
+
+    Every stage is driven from a thread (I/O-bound work such as LLM calls runs there as is).
+    Stages added with cpu=True hand their GIL-bound work to cpu(fn, *args), which runs it in a
+    worker process; `pool` reuses an existing process pool (batch mode), otherwise one with
+    `processes` workers is started before the first stage. A stage that raises is recorded as
+    failed and its dependents as skipped; the other stages still run.
+    """
+    def __init__(self, parallel: bool = True, threads: int = 4, processes: int = 2, pool=None, **_):
+        self.threads = max(1, int(threads)) if parallel else 1
+        self.processes = max(0, int(processes)) if parallel else 0
+        self.parallel = parallel
+        self.stages: Dict[str, tuple] = {}
+        self.results: Dict[str, object] = {}
+        self.status: Dict[str, Dict] = {}
+        self._pool = pool if parallel else None
+        self._own_pool = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str, fn: Callable, deps: Iterable[str] = (), cpu: bool = False) -> "StageGraph":
+        deps = tuple(deps)
+        unknown = [d for d in deps if d not in self.stages]
+        if unknown:
+            raise ValueError(f"stage {name} depends on undeclared stages {unknown}")
+        self.stages[name] = (fn, deps, cpu)
+        return self
+
+    def cpu(self, fn: Callable, *args):
+        """
+        fn(*args) in a worker process (fn must be a module-level function; args must pickle),
+        or in the calling thread without processes.
+        """
+        if self._pool is None and self.processes <= 0:
+            return fn(*args)
+        return self._process_pool().submit(fn, *args).result()
+
+    def _process_pool(self):
+        with self._lock:
+            if self._pool is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._pool = self._own_pool = ProcessPoolExecutor(max_workers=self.processes)
+            return self._pool
+
+    def _run_one(self, name: str, fn: Callable, t0: float):
+        start = time.perf_counter()
+        try:
+            self.results[name] = fn()
+            st = {"status": "ok"}
+        except Exception as e:
+            print(f"[warn] {name} failed:", e, file=sys.stderr)
+            st = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+        end = time.perf_counter()
+        st.update(start_s=round(start - t0, 3), seconds=round(end - start, 3))
+        self.status[name] = st
+
+    def run(self) -> Dict[str, object]:
+        """
+        Runs every stage; returns name -> result of the stages that finished.
+        """
+        t0 = time.perf_counter()
+        if any(cpu for _, _, cpu in self.stages.values()) and (self._pool is not None or self.processes > 0):
+            # start the workers before any stage thread exists (fork with live threads can deadlock)
+            self._process_pool().submit(int).result()
+        pending, running = dict(self.stages), {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="stage") as ex:
+                while pending or running:
+                    for name in list(pending):
+                        fn, deps, _ = pending[name]
+                        bad = [d for d in deps if self.status.get(d, {}).get("status") in ("failed", "skipped")]
+                        if bad:
+                            del pending[name]
+                            self.status[name] = {"status": "skipped", "error": f"needs {', '.join(bad)}"}
+                            print(f"[warn] {name} skipped: needs {', '.join(bad)}", file=sys.stderr)
+                        elif len(running) < self.threads and all(self.status.get(d, {}).get("status") == "ok"
+                                                                 for d in deps):
+                            del pending[name]
+                            running[ex.submit(self._run_one, name, fn, t0)] = name
+                    if running:
+                        done, _ = wait(running, return_when=FIRST_COMPLETED)
+                        for f in done:
+                            running.pop(f)
+        finally:
+            if self._own_pool is not None:
+                self._own_pool.shutdown()
+                self._pool = self._own_pool = None
+        self.wall_s = time.perf_counter() - t0
+        return self.results
+
+    def summary(self) -> Dict:
+        """
+        For report.json: per-stage status, start offset and duration, plus the graph's wall time
+        next to the sum of its stages (the sequential cost).
+        """
+        serial = sum(s.get("seconds", 0.0) for s in self.status.values())
+        wall = getattr(self, "wall_s", 0.0)
+        return {"parallel": self.parallel, "threads": self.threads, "processes": self.processes,
+                "wall_s": round(wall, 3), "serial_s": round(serial, 3),
+                "speedup": round(serial / wall, 2) if wall > 0 else None,
+                "stages": {name: self.status[name] for name in self.stages if name in self.status}}
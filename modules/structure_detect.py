@@ -1,26 +1,40 @@
 import regex as re
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from modules.records import Records
 
 HEADING_RE = re.compile(r"^(?:[A-Z][A-Z0-9 ,;:'\"()/-]{3,}|[0-9]+(?:\.[0-9]+)*[^\S\r\n].{3,})$")
 
-def detect_headings(pages: List[Dict]):
-    """
-    Splits pages into sections with simple heading heuristics.
-    Output: list of blocks: {section_path, page, text}
-    """
-    blocks = []
+def _heading_blocks(pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[str, int, str]]:
+    # (page_num, text) -> (section_path, page, text)
     current_section = ["Root"]
-    for p in pages:
-        for para in re.split(r"\n{2,}", p["text"]):
+    for page_num, text in pages:
+        for para in re.split(r"\n{2,}", text):
             line0 = para.strip().split("\n", 1)[0] if para.strip() else ""
             if line0 and HEADING_RE.match(line0):
                 # new section
                 current_section = ["Root", line0.strip()[:120]]
                 continue
             if para.strip():
-                blocks.append({
-                    "section_path": " / ".join(current_section),
-                    "page": p["page_num"],
-                    "text": para.strip()
-                })
-    return blocks
+                yield " / ".join(current_section), page_num, para.strip()
+
+def iter_headings(pages: Iterable[Dict]) -> Iterator[Dict]:
+    """
+    Generator form of detect_headings; consumes pages one at a time.
+    """
+    for section_path, page, text in _heading_blocks((p["page_num"], p["text"]) for p in pages):
+        yield {"section_path": section_path, "page": page, "text": text}
+
+def detect_headings(pages: List[Dict]):
+    """
+    Splits pages into sections with simple heading heuristics.
+    Output: list of blocks: {section_path, page, text}; Records("blocks") for Records pages.
+    """
+    if isinstance(pages, Records):
+        cols = {"section_path": [], "page": [], "text": []}
+        for section_path, page, text in _heading_blocks(pages.iter_column("page_num", "text")):
+            cols["section_path"].append(section_path)
+            cols["page"].append(page)
+            cols["text"].append(text)
+        return Records.from_columns("blocks", cols)
+    return list(iter_headings(pages))
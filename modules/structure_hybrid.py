@@ -0,0 +1,252 @@
+import json, regex as re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from modules.records import Records
+from modules.structure_detect import HEADING_RE
+from modules.structure_llm import DEFAULT_SECTIONING, _section_batch
+
+DEFAULT_STRUCTURE = {
+    "mode": "auto",          # auto (llm if llm.sectionize, else regex) | regex | llm | hybrid
+    "fonts": True,           # hybrid: read font size/bold per line at parse time
+    "min_confidence": 0.5,   # hybrid: heading candidates below this go to the LLM
+    "context": 2,            # hybrid: neighbouring paragraphs sent with each ambiguous one
+    "window": 2000,          # hybrid: paragraphs scored and dispatched together
+}
+
+CANDIDATE_CHARS = 120
+NUMBER_RE = re.compile(r"^(?:(?:chapter|part|section|appendix)\s+)?(\d+(?:\.\d+)*|[IVXLC]+)(?=[\s.:)]|$)", re.I)
+KEYWORD_RE = re.compile(r"^(?:chapter|part|book|appendix|preface|introduction|conclusion|epilogue|prologue)\b", re.I)
+_ROMAN = {"I": 1, "V": 5, "X": 10, "L": 50, "C": 100}
+
+def _roman(s: str) -> Optional[int]:
+    vals = [_ROMAN.get(c) for c in s.upper()]
+    if None in vals:
+        return None
+    return sum(-v if i + 1 < len(vals) and v < vals[i + 1] else v for i, v in enumerate(vals))
+
+def _number(line: str) -> Optional[Tuple[int, ...]]:
+    m = NUMBER_RE.match(line)
+    if not m:
+        return None
+    tok = m.group(1)
+    if tok[0].isdigit():
+        return tuple(int(x) for x in tok.split("."))
+    # roman numerals only count with a chapter-like keyword or a trailing dot ("IV. Methods")
+    if not (KEYWORD_RE.match(line) or line[len(m.group(0)):].startswith(".")):
+        return None
+    n = _roman(tok)
+    return (n,) if n else None
+
+def _continues(prev: Optional[Tuple[int, ...]], cur: Tuple[int, ...]) -> bool:
+    # 3.2 -> 3.3, 3.2 -> 3.2.1, 3.2.4 -> 4 / 3.3
+    if prev is None:
+        return cur[-1] == 1
+    for depth in range(1, len(prev) + 2):
+        if len(cur) != depth:
+            continue
+        if depth <= len(prev) and cur[:-1] == prev[:depth - 1] and cur[-1] == prev[depth - 1] + 1:
+            return True
+        if depth == len(prev) + 1 and cur[:-1] == prev and cur[-1] == 1:
+            return True
+    return False
+
+def body_font_size(pages) -> Optional[float]:
+    """
+    Font size holding the most characters over pages with meta["fonts"] (the body text size).
+    """
+    totals: Dict[str, int] = {}
+    if isinstance(pages, Records):
+        fonts = (json.loads(f) for f in pages.iter_column("fonts") if f)
+    else:
+        fonts = ((p.get("meta") or {}).get("fonts") for p in pages)
+    for f in fonts:
+        for size, n in (f or {}).get("sizes", {}).items():
+            totals[size] = totals.get(size, 0) + n
+    return float(max(totals, key=totals.get)) if totals else None
+
+class _Para:
+    __slots__ = ("page", "text", "first", "rest", "font", "number", "score", "level", "heading", "ambiguous",
+                 "path")
+
+    def __init__(self, page, text, font_lines):
+        self.page, self.text = page, text
+        first, _, rest = text.partition("\n")
+        self.first, self.rest = first.strip(), rest.strip()
+        self.font = font_lines.get(" ".join(self.first.split())) if font_lines else None
+        self.number, self.score, self.level, self.heading, self.ambiguous = None, 0.0, 1, False, False
+        self.path = None  # section titles below Root, from a non-heading LLM boundary
+
+def _distinct(font, body: Optional[float]) -> bool:
+    return bool(font) and bool(body) and (font[0] >= body * 1.05 or font[1])
+
+def _paragraphs(pages: Iterable[Dict], body: Optional[float]) -> Iterator[_Para]:
+    """
+    Blank-line paragraphs; with font data, a line set larger or bolder than the body is also
+    split out as its own paragraph, since PDF text often has no blank line after a heading.
+    """
+    for p in pages:
+        fonts = (p.get("meta") or {}).get("fonts")
+        lines = {t: (size, bold) for t, size, bold in fonts["lines"]} if fonts else None
+        for para in re.split(r"\n{2,}", p["text"]):
+            para = para.strip()
+            if not para:
+                continue
+            if not (lines and body):
+                yield _Para(p["page_num"], para, lines)
+                continue
+            buf = []
+            for ln in para.split("\n"):
+                if _distinct(lines.get(" ".join(ln.split())), body):
+                    if buf:
+                        yield _Para(p["page_num"], "\n".join(buf), lines)
+                        buf = []
+                    yield _Para(p["page_num"], ln.strip(), lines)
+                elif ln.strip():
+                    buf.append(ln)
+            if buf:
+                yield _Para(p["page_num"], "\n".join(buf), lines)
+
+def _score(x: _Para, body: Optional[float], last_number) -> float:
+    """
+    Heading likelihood in [0, 1] from regex shape, keywords, numbering continuity and font.
+    """
+    line = x.first
+    s = 0.0
+    if HEADING_RE.match(line):
+        s += 0.35
+    if KEYWORD_RE.match(line):
+        s += 0.25
+    x.number = _number(line)
+    if x.number:
+        s += 0.3 if _continues(last_number, x.number) else 0.1
+    if x.font and body:
+        size, bold = x.font
+        ratio = size / body
+        if ratio >= 1.15:
+            s += 0.35
+        elif ratio >= 1.05:
+            s += 0.15
+        elif ratio < 0.95:
+            s -= 0.25
+        if bold:
+            s += 0.2
+    if line.endswith((".", ",", ";")) and not x.number:
+        s -= 0.25
+    if len(line.split()) > 12:
+        s -= 0.3
+    if x.rest:
+        s -= 0.1
+    return max(0.0, min(1.0, s))
+
+def _level(x: _Para, body: Optional[float]) -> int:
+    if x.number:
+        return len(x.number)
+    if KEYWORD_RE.match(x.first):
+        return 1
+    if x.font and body:
+        ratio = x.font[0] / body
+        return 1 if ratio >= 1.6 else 2 if ratio >= 1.3 else 3
+    return 1
+
+def _groups(idx: List[int], n: int, context: int, max_paras: int) -> List[Tuple[int, int]]:
+    # [start, end) paragraph windows around ambiguous indices, merged when they overlap
+    out: List[List[int]] = []
+    for i in idx:
+        s, e = max(0, i - context), min(n, i + context + 1)
+        if out and s <= out[-1][1] and e - out[-1][0] <= max_paras:
+            out[-1][1] = e
+        else:
+            out.append([s, e])
+    return [(s, e) for s, e in out]
+
+def iter_hybrid_sections(pages: Iterable[Dict], llm=None, cache=None, body_size: Optional[float] = None,
+                         stats: Optional[Dict] = None, min_confidence: float = 0.5, context: int = 2,
+                         window: int = 2000, sectioning: Optional[Dict] = None, **_) -> Iterator[Dict]:
+    """
+    Yields blocks {section_path, page, text} like iter_headings. Short paragraphs are scored as
+    heading candidates locally (_score); candidates whose confidence |2*score - 1| is below
+    min_confidence are sent to the LLM in small windows with `context` neighbours, using the
+    boundary protocol of modules.structure_llm. A "heading" boundary on a candidate makes it a
+    heading at the depth of the returned path; any other boundary starts that path at the
+    paragraph, which stays body text. Without an LLM (or when a window fails) the local
+    score decides. Headings from both sources feed one section stack, so the hierarchy stays
+    consistent. A heading's first line is the title; any lines after it stay as body text.
+    """
+    from itertools import islice
+    opts = {**DEFAULT_SECTIONING, **(sectioning or {})}
+    st = {"paragraphs": 0, "candidates": 0, "headings": 0, "ambiguous": 0, "llm_windows": 0,
+          "llm_paragraphs": 0, "llm_failed": 0}
+    stack: List[str] = []
+    last_number = None
+    it = _paragraphs(pages, body_size)
+    while True:
+        part = list(islice(it, window))
+        if not part:
+            break
+        st["paragraphs"] += len(part)
+        for x in part:
+            if len(x.first) > CANDIDATE_CHARS or not any(c.isalpha() for c in x.first):
+                continue
+            # multi-line body-font paragraphs only count when the first line looks like a heading
+            if x.rest and not _distinct(x.font, body_size) and not (HEADING_RE.match(x.first) or _number(x.first)):
+                continue
+            st["candidates"] += 1
+            x.score = _score(x, body_size, last_number)
+            x.heading = x.score >= 0.5
+            x.level = _level(x, body_size)
+            x.ambiguous = abs(2 * x.score - 1) < min_confidence
+            if x.heading and x.number:
+                last_number = x.number
+        amb = [i for i, x in enumerate(part) if x.ambiguous]
+        st["ambiguous"] += len(amb)
+        if llm is not None and amb:
+            groups = _groups(amb, len(part), context, opts["max_paras"])
+            batches = [[{"page": x.page, "text": x.text} for x in part[s:e]] for s, e in groups]
+            for (s, e), (_, bounds, err) in zip(groups, llm.imap(
+                    lambda b: _section_batch(llm, cache, b, opts["preview_chars"]), batches)):
+                st["llm_windows"] += 1
+                st["llm_paragraphs"] += e - s
+                if err is not None:
+                    st["llm_failed"] += 1
+                    print("[warn] LLM sectionize window failed, using local scores:", err)
+                    continue
+                starts = {}
+                for b in bounds or []:
+                    try:
+                        path = [t.strip() for t in str(b["section_path"]).split("/") if t.strip()]
+                        starts[int(b["id"])] = (path, bool(b.get("heading")))
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                for i in range(s, e):
+                    x = part[i]
+                    if not x.ambiguous:
+                        continue
+                    path, heading = starts.get(i - s, ([], False))
+                    x.heading = heading and bool(path)
+                    titles = path[1:] if path and path[0] == "Root" else path
+                    if x.heading:
+                        x.level = max(1, len(titles))
+                    elif path:
+                        x.path = titles
+        for x in part:
+            if x.heading:
+                st["headings"] += 1
+                stack = stack[:x.level - 1] + [x.first[:CANDIDATE_CHARS]]
+                if not x.rest:
+                    continue
+                text = x.rest
+            else:
+                if x.path is not None:
+                    stack = x.path
+                text = x.text
+            yield {"section_path": " / ".join(["Root"] + stack), "page": x.page, "text": text}
+    if stats is not None:
+        stats.update(st)
+
+def hybrid_sections(pages, llm=None, cache=None, **opts) -> Records:
+    """
+    Records("blocks") over all pages; the body font size is measured on the pages themselves.
+    """
+    if opts.get("body_size") is None:
+        opts["body_size"] = body_font_size(pages)
+    return Records.from_rows("blocks", iter_hybrid_sections(pages, llm, cache, **opts))
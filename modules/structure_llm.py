@@ -1,49 +1,126 @@
-import json, regex as re
+import json, hashlib, regex as re
 
-SECTION_SCHEMA = {
+DEFAULT_SECTIONING = {
+    "token_budget": 3000,   # estimated prompt tokens of paragraph lines per request
+    "max_paras": 200,       # paragraphs per request
+    "preview_chars": 160,   # paragraph text sent to the model; the rest stays local
+}
+
+HEADING_CHARS = 120  # a "heading" boundary's first line is only stripped up to this length
+# bump when SYSTEM / PROMPT_TMPL / _line change so cached boundaries are not reused
+PROMPT_VERSION = 1
+SAMPLING = {"temperature": 0.0, "top_p": 0.1, "seed": 7}
+
+BOUNDARY_SCHEMA = {
   "type":"object",
   "properties":{
-    "blocks":{"type":"array","items":{
+    "boundaries":{"type":"array","items":{
       "type":"object",
       "properties":{
+        "id":{"type":"integer"},
         "section_path":{"type":"string"},
-        "page":{"type":"integer"},
-        "text":{"type":"string"}
+        "heading":{"type":"boolean"}
       },
-      "required":["section_path","page","text"]
-    }},
-    "dropped_count":{"type":"integer"}
+      "required":["id","section_path"]
+    }}
   },
-  "required":["blocks"]
+  "required":["boundaries"]
 }
 
-SYSTEM = """You segment book paragraphs into a hierarchy.
+SYSTEM = """You find section boundaries in book paragraphs.
 Rules:
-- Use only the given paragraphs; do not invent or drop text.
-- Keep section_path compact like 'Root / Chapter 1 / 1.1 Overview'.
-- Preserve paragraph order. Return strictly JSON in the provided schema."""
+- Input lines are {"id", "page", "text"}; text is a preview and may be cut off with "…".
+- Return only paragraphs that start a new section, as {"id", "section_path"}; every later
+  paragraph belongs to that section until the next boundary.
+- Use full paths from the root, compact like 'Root / Chapter 1 / 1.1 Overview'.
+- Set "heading": true when the paragraph is only the heading line itself.
+- Never repeat paragraph text. Return strictly JSON in the provided schema."""
 
-PROMPT_TMPL = """You receive page-numbered paragraphs.
-Goal: assign each paragraph to a section_path like "Root / Chapter 1 / 1.1 Overview".
-Do not invent text. Do not drop paragraphs.
-
-Input (JSON lines):
+PROMPT_TMPL = """Paragraphs (JSON lines, in reading order):
 {payload}
 """
 
-def llm_sections(llm, cache, page_paras):
-    out_blocks = []
-    # batch by 40 paragraphs to keep prompts small
-    for i in range(0, len(page_paras), 40):
-        batch = page_paras[i:i+40]
-        payload = "\n".join(json.dumps(x, ensure_ascii=False) for x in batch)
-        prompt = PROMPT_TMPL.format(payload=payload)
-        key = {"task":"sections","batch": batch}
-        cached = cache.get(key)
-        if cached:
-            out = cached
+def _preview(text: str, n: int) -> str:
+    return text if len(text) <= n else text[:n].rstrip() + "…"
+
+def _line(i: int, para, preview_chars: int) -> str:
+    return json.dumps({"id": i, "page": para["page"], "text": _preview(para["text"], preview_chars)},
+                      ensure_ascii=False)
+
+def _token_batches(items, token_budget: int, max_paras: int, preview_chars: int):
+    # ~4 chars per token; a batch always holds at least one paragraph
+    batch, tokens = [], 0
+    for para in items:
+        t = (min(len(para["text"]), preview_chars) + 32) // 4
+        if batch and (tokens + t > token_budget or len(batch) >= max_paras):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(para)
+        tokens += t
+    if batch:
+        yield batch
+
+def _section_batch(llm, cache, batch, preview_chars):
+    payload = "\n".join(_line(i, x, preview_chars) for i, x in enumerate(batch))
+    # keyed on the exact prompt payload, hashed here so the key stays small
+    key = {"task": "section_boundaries", "v": PROMPT_VERSION, "model": llm.model, "sampling": SAMPLING,
+           "payload": hashlib.sha256(payload.encode("utf-8")).hexdigest()}
+    cached = cache.get(key)
+    if cached:
+        return cached["boundaries"]
+    out = llm.chat_json(SYSTEM, PROMPT_TMPL.format(payload=payload), schema=BOUNDARY_SCHEMA, **SAMPLING)
+    cache.put(key, out)
+    return out["boundaries"]
+
+def _apply_boundaries(batch, boundaries, current: str):
+    """
+    Rebuilds full blocks locally from (id -> section_path) boundaries. Unknown or repeated ids
+    are ignored; paragraphs before the first boundary keep `current`. No paragraph is dropped:
+    for a "heading" boundary only a short first line is taken as the title (the model saw a
+    preview only), and any lines after it stay as body text. Returns (blocks, section).
+    """
+    starts = {}
+    for b in boundaries or []:
+        try:
+            i = int(b["id"])
+            path = " / ".join(s.strip() for s in str(b["section_path"]).split("/") if s.strip())
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= i < len(batch) and path:
+            starts[i] = (path if path.split(" / ", 1)[0] == "Root" else "Root / " + path, bool(b.get("heading")))
+    blocks = []
+    for i, para in enumerate(batch):
+        if i in starts:
+            current, heading = starts[i]
+            first, _, rest = para["text"].strip().partition("\n")
+            if heading and len(first.strip()) <= HEADING_CHARS:
+                if rest.strip():
+                    blocks.append({"section_path": current, "page": para["page"], "text": rest.strip()})
+                continue
+        blocks.append({"section_path": current, "page": para["page"], "text": para["text"]})
+    return blocks, current
+
+def iter_llm_sections(llm, cache, page_paras, fallback=None, token_budget=3000, max_paras=200, preview_chars=160):
+    """
+    Generator form of llm_sections; page_paras may be any iterable.
+    Paragraphs go out as {id, page, preview} lines in token-budgeted batches; the model returns
+    only section boundaries and blocks are rebuilt here, so every paragraph is kept verbatim.
+    Batches run concurrently; a batch's leading paragraphs inherit the previous batch's section.
+    If `fallback` is given, a failed batch is handed to fallback(batch) instead of raising.
+    """
+    current = "Root"
+    batches = _token_batches(page_paras, token_budget, max_paras, preview_chars)
+    for batch, bounds, e in llm.imap(lambda b: _section_batch(llm, cache, b, preview_chars), batches):
+        if e is not None:
+            if fallback is None:
+                raise e
+            print("[warn] LLM sectionize batch failed, falling back:", e)
+            blocks = fallback(batch)
+            if blocks:
+                current = blocks[-1]["section_path"]
         else:
-            out = llm.chat_json(SYSTEM, prompt, temperature=0.0, top_p=0.1, seed=7, schema=SECTION_SCHEMA)
-            cache.put(key, out)
-        out_blocks.extend(out["blocks"])
-    return out_blocks
+            blocks, current = _apply_boundaries(batch, bounds, current)
+        yield from blocks
+
+def llm_sections(llm, cache, page_paras, **opts):
+    return list(iter_llm_sections(llm, cache, page_paras, **opts))
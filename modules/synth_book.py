@@ -0,0 +1,147 @@
+import random
+from pathlib import Path
+from typing import Dict, List
+
+DEFAULT_SYNTH = {
+    "pages": 200,
+    "chapters": 10,
+    "sections_per_chapter": 3,  # numbered "N.M" headings spread over each chapter
+    "running_header": True,     # "<title> · Chapter N" on top, page number at the bottom
+    "hyphenation": 0.05,        # chance a line ends in a word split with "-"
+    "scanned_pages": 0,         # pages rendered to an image without a text layer (OCR path)
+    "title": "A Synthetic Book",
+    "seed": 7,
+}
+
+PAGE_W, PAGE_H, MARGIN = 595, 842, 64
+BODY_SIZE, LINE_H, LINE_CHARS = 10.5, 14, 92
+
+_WORDS = ("the of and to in is that for it as with was on be by this are from at an which or have "
+          "not had but were their all can one been has its more will would there when who also "
+          "system model data process structure analysis method result value function between "
+          "through during within without however therefore because example chapter section "
+          "information development important different general particular following "
+          "understanding relationship distribution performance representation "
+          "approximately characteristics implementation consideration").split()
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(3, 7)))
+
+def _wrap(text: str, rng: random.Random, hyphenation: float) -> List[str]:
+    lines, cur = [], ""
+    words = text.split()
+    i = 0
+    while i < len(words):
+        w = words[i]
+        if not cur:
+            cur = w
+        elif len(cur) + 1 + len(w) <= LINE_CHARS:
+            cur += " " + w
+        else:
+            room = LINE_CHARS - len(cur) - 2
+            if len(w) >= 8 and room >= 3 and rng.random() < hyphenation:
+                k = min(room, len(w) - 3)
+                lines.append(cur + " " + w[:k] + "-")
+                words[i] = w[k:]
+                cur = ""
+                continue
+            lines.append(cur)
+            cur = w
+        i += 1
+    if cur:
+        lines.append(cur)
+    return lines
+
+def _plan(opts: Dict) -> Dict[int, List[tuple]]:
+    # page -> headings starting there: ("h1", "Chapter 3: ...") / ("h2", "3.2 ...")
+    rng = random.Random(opts["seed"] + 1)
+    n, chapters, per = opts["pages"], max(1, opts["chapters"]), max(0, opts["sections_per_chapter"])
+    plan: Dict[int, List[tuple]] = {}
+    for c in range(chapters):
+        start, end = c * n // chapters, (c + 1) * n // chapters
+        if start >= n:
+            break
+        title = " ".join(rng.choice(_WORDS) for _ in range(3)).title()
+        plan.setdefault(start, []).append(("h1", f"Chapter {c + 1}: {title}"))
+        for s in range(per):
+            page = start + s * max(1, end - start) // per
+            title = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(2, 4))).title()
+            plan.setdefault(min(page, n - 1), []).append(("h2", f"{c + 1}.{s + 1} {title}"))
+    return plan
+
+def _draw(page, items, header, footer):
+    y = MARGIN
+    if header:
+        page.insert_text((MARGIN, MARGIN - 24), header, fontsize=8, fontname="helv")
+    for kind, text in items:
+        if kind == "h1":
+            y += 12
+            page.insert_text((MARGIN, y), text, fontsize=18, fontname="hebo")
+            y += 30
+        elif kind == "h2":
+            y += 6
+            page.insert_text((MARGIN, y), text, fontsize=13, fontname="hebo")
+            y += 22
+        elif kind == "gap":
+            y += LINE_H
+        else:
+            page.insert_text((MARGIN, y), text, fontsize=BODY_SIZE, fontname="helv")
+            y += LINE_H
+    if footer:
+        page.insert_text((PAGE_W / 2, PAGE_H - MARGIN + 30), footer, fontsize=8, fontname="helv")
+
+def make_book(path, **opts) -> Dict:
+    """
+    Writes a deterministic synthetic PDF (same options -> same file content) with PyMuPDF, offline:
+    chapter and numbered section headings in larger bold type, blank-line paragraphs, optional
+    running headers / page numbers, hyphenated line breaks and image-only (scanned) pages.
+    Returns a summary of what was generated.
+    """
+    import fitz  # PyMuPDF
+    opts = {**DEFAULT_SYNTH, **opts}
+    rng = random.Random(opts["seed"])
+    plan = _plan(opts)
+    n = opts["pages"]
+    scanned = set(rng.sample(range(n), min(n, opts["scanned_pages"]))) if opts["scanned_pages"] else set()
+    body_lines = (PAGE_H - 2 * MARGIN) // LINE_H
+    doc, scratch = fitz.open(), fitz.open()
+    pending: List[str] = []
+    chapter, headings, chars = 0, 0, 0
+    for pno in range(n):
+        items, used = [], 0
+        for kind, text in plan.get(pno, []):
+            if kind == "h1":
+                chapter += 1
+                pending = []  # chapters start on a fresh page
+            items.append((kind, text))
+            used += 3 if kind == "h1" else 2
+            headings += 1
+        while used < body_lines:
+            if not pending:
+                if items and items[-1][0] == "line":
+                    items.append(("gap", ""))
+                    used += 1
+                pending = _wrap(_paragraph(rng), rng, opts["hyphenation"])
+            take = min(len(pending), body_lines - used)
+            items.extend(("line", ln) for ln in pending[:take])
+            chars += sum(len(ln) for ln in pending[:take])
+            pending = pending[take:]
+            used += take
+        header = f"{opts['title']} · Chapter {max(chapter, 1)}" if opts["running_header"] else None
+        footer = str(pno + 1) if opts["running_header"] else None
+        page = doc.new_page(width=PAGE_W, height=PAGE_H)
+        if pno in scanned:
+            src = scratch.new_page(width=PAGE_W, height=PAGE_H)
+            _draw(src, items, header, footer)
+            page.insert_image(page.rect, pixmap=src.get_pixmap(dpi=100))
+        else:
+            _draw(page, items, header, footer)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    doc.save(str(path), garbage=3, deflate=True)
+    doc.close(); scratch.close()
+    return {"path": str(path), "pages": n, "scanned_pages": len(scanned), "headings": headings, "body_chars": chars,
+            "options": opts}
@@ -1,5 +1,30 @@
-import os, math
-from typing import List, Dict
+import os, sys, math, json, time, random, hashlib, threading
+from pathlib import Path
+from typing import List, Dict, Optional
+
+DEFAULT_SYNC = {
+    "workers": 4,                  # concurrent upsert/delete requests
+    "max_request_bytes": 1_800_000,  # under Pinecone's 2 MB request cap
+    "max_batch": 1000,             # vectors per upsert request
+    "max_retries": 5,
+    "backoff": 0.5,
+    "save_every_s": 30.0,          # state file rewrite interval during upserts; always saved by finish()
+}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def _transient(e: Exception) -> bool:
+    """
+    429 / 5xx responses and connection or timeout errors (builtin, requests, urllib3 or the
+    Pinecone client's). 4xx, validation and other errors are not retried.
+    """
+    status = getattr(e, "status", None) or getattr(e, "status_code", None) \
+        or getattr(getattr(e, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in RETRY_STATUS or status >= 500
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return True
+    return any(n in c.__name__ for c in type(e).__mro__ for n in ("Connection", "Timeout", "Protocol"))
 
 def _resolve_env(value: str) -> str:
     if isinstance(value, str) and value.startswith("${") and value.endswith("}"):
@@ -13,8 +38,7 @@ def _get_cfg(cfg: Dict, key: str, default=None):
         return _resolve_env(v)
     return v
 
-def push_to_pinecone(vecs, chunks: List[Dict], cfg: Dict):
-    import numpy as np
+def open_pinecone_index(cfg: Dict, dim: int):
     try:
         from pinecone import Pinecone, ServerlessSpec
     except Exception as e:
@@ -30,35 +54,230 @@ def push_to_pinecone(vecs, chunks: List[Dict], cfg: Dict):
 
     metric = _get_cfg(cfg, "metric", "cosine")
     region = _get_cfg(cfg, "environment", "us-east-1")
-    namespace = _get_cfg(cfg, "namespace", None)
 
     pc = Pinecone(api_key=api_key)
 
     # Create index if missing
     names = set([i.name for i in pc.list_indexes()])
-    dim = int(vecs.shape[1])
     if index_name not in names:
         spec = ServerlessSpec(cloud="aws", region=region)
-        pc.create_index(name=index_name, dimension=dim, metric=metric, spec=spec)
-
-    index = pc.Index(index_name)
-
-    # Upsert in batches
-    N = vecs.shape[0]
-    batch = 200
-    for i in range(0, N, batch):
-        end = min(i+batch, N)
-        payload = []
-        for j in range(i, end):
-            ch = chunks[j]
-            meta = {
-                "section": ch.get("section", ""),
-                "page_start": int(ch.get("page_start", 0) or 0),
-                "page_end": int(ch.get("page_end", 0) or 0),
-                "text": ch.get("text", "")
-            }
-            payload.append((str(ch["chunk_id"]), vecs[j].tolist(), meta))
-        if namespace:
-            index.upsert(vectors=payload, namespace=namespace)
+        pc.create_index(name=index_name, dimension=int(dim), metric=metric, spec=spec)
+
+    return pc.Index(index_name)
+
+class FakeIndex:
+    """
+    In-process stand-in for a Pinecone Index (upsert / delete / fetch / describe_index_stats)
+    for offline runs and tests. fail_rate makes calls raise at random to exercise retries.
+    """
+    def __init__(self, fail_rate: float = 0.0, seed: int = 0):
+        self.namespaces: Dict[str, Dict[str, tuple]] = {}
+        self.calls = {"upsert": 0, "delete": 0}
+        self.fail_rate = fail_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _maybe_fail(self):
+        if self.fail_rate and self._rng.random() < self.fail_rate:
+            raise ConnectionError("injected failure")
+
+    def upsert(self, vectors, namespace=None):
+        with self._lock:
+            self._maybe_fail()
+            self.calls["upsert"] += 1
+            ns = self.namespaces.setdefault(namespace or "", {})
+            for vid, values, meta in vectors:
+                ns[vid] = (list(values), dict(meta))
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids, namespace=None):
+        with self._lock:
+            self._maybe_fail()
+            self.calls["delete"] += 1
+            ns = self.namespaces.setdefault(namespace or "", {})
+            for vid in ids:
+                ns.pop(vid, None)
+        return {}
+
+    def fetch(self, ids, namespace=None):
+        ns = self.namespaces.get(namespace or "", {})
+        return {"vectors": {i: {"id": i, "values": ns[i][0], "metadata": ns[i][1]} for i in ids if i in ns}}
+
+    def describe_index_stats(self):
+        return {"namespaces": {k: {"vector_count": len(v)} for k, v in self.namespaces.items()},
+                "total_vector_count": sum(len(v) for v in self.namespaces.values())}
+
+def _meta(ch: Dict) -> Dict:
+    return {
+        "section": ch.get("section", "") or "",
+        "page_start": int(ch.get("page_start", 0) or 0),
+        "page_end": int(ch.get("page_end", 0) or 0),
+        "text": ch.get("text", "")
+    }
+
+def _content_hash(meta: Dict, vec) -> str:
+    h = hashlib.sha256(json.dumps(meta, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    h.update(vec.astype("float32").tobytes())
+    return h.hexdigest()[:32]
+
+class PineconeSync:
+    """
+    Delta sync of chunk vectors into one index/namespace. A state file maps vector id ->
+    content hash (metadata + vector bytes) of what the index holds. upsert() sends only new
+    or changed rows, in byte-sized batches on a bounded thread pool, retrying transient errors;
+    finish() deletes ids that were not seen this run and saves the state. upsert() may be
+    called once per window; it rewrites the state file at most every save_every_s seconds
+    (and when a window fails), so a crash only re-sends the rows of the last interval. If the
+    index holds fewer vectors than the state lists (deleted or recreated remotely), the state
+    is dropped and every row is sent again.
+    """
+    def __init__(self, cfg: Dict, index=None, state_path=None):
+        self.cfg = {**DEFAULT_SYNC, **{k: v for k, v in cfg.get("vectordb", {}).items() if k in DEFAULT_SYNC}}
+        self.full_cfg = cfg
+        self.index = index
+        self.namespace = _get_cfg(cfg, "namespace", None)
+        self.state_path = Path(state_path) if state_path else None
+        self.state_key = f"{_get_cfg(cfg, 'index_name', '')}/{self.namespace or ''}"
+        self.known: Dict[str, str] = {}
+        if self.state_path and self.state_path.exists():
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.known = json.load(f).get(self.state_key, {})
+        self.seen = set()
+        self.stats = {"upserted": 0, "unchanged": 0, "deleted": 0, "requests": 0, "retries": 0}
+        self._lock = threading.Lock()
+        self._saved_at = time.monotonic()
+        self._checked = False
+
+    def _remote_count(self) -> Optional[int]:
+        # vector count of our namespace; None when the index cannot tell
+        try:
+            st = self.index.describe_index_stats()
+            namespaces = st["namespaces"] if isinstance(st, dict) else st.namespaces
+            ns = namespaces.get(self.namespace or "")
+            if ns is None:
+                return 0
+            return int(ns["vector_count"] if isinstance(ns, dict) else ns.vector_count)
+        except Exception:
+            return None
+
+    def _check_remote(self):
+        self._checked = True
+        if not self.known:
+            return
+        n = self._remote_count()
+        if n is not None and n < len(self.known):
+            print(f"[warn] Pinecone {self.state_key} holds {n} vectors but the sync state lists "
+                  f"{len(self.known)}; re-sending all", file=sys.stderr)
+            self.known = {}
+            self.stats["resync"] = True
+
+    def _call(self, fn, *args, **kwargs):
+        for attempt in range(self.cfg["max_retries"] + 1):
+            try:
+                with self._lock:
+                    self.stats["requests"] += 1
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.cfg["max_retries"] or not _transient(e):
+                    raise
+                with self._lock:
+                    self.stats["retries"] += 1
+                time.sleep(self.cfg["backoff"] * (2 ** attempt) * (0.5 + random.random() / 2))
+
+    def _ns_kwargs(self):
+        return {"namespace": self.namespace} if self.namespace else {}
+
+    def _batches(self, rows, dim):
+        # JSON size estimate: ~12 bytes per float plus metadata and framing
+        limit, cap = self.cfg["max_request_bytes"], self.cfg["max_batch"]
+        batch, size = [], 0
+        for r in rows:
+            b = 12 * dim + len(r[2]["text"].encode("utf-8")) + 200
+            if batch and (size + b > limit or len(batch) >= cap):
+                yield batch
+                batch, size = [], 0
+            batch.append(r)
+            size += b
+        if batch:
+            yield batch
+
+    def _run(self, jobs):
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=max(1, self.cfg["workers"])) as ex:
+            for fut in [ex.submit(*job) for job in jobs]:
+                fut.result()
+
+    def upsert(self, vecs, chunks: List[Dict]):
+        import numpy as np
+        vecs = np.asarray(vecs, dtype="float32")
+        if self.index is None:
+            self.index = open_pinecone_index(self.full_cfg, vecs.shape[1])
+        if not self._checked:
+            self._check_remote()
+        todo = []
+        for j, ch in enumerate(chunks):
+            vid = str(ch["chunk_id"])
+            meta = _meta(ch)
+            h = _content_hash(meta, vecs[j])
+            self.seen.add(vid)
+            if self.known.get(vid) == h:
+                self.stats["unchanged"] += 1
+                continue
+            todo.append((j, vid, meta, h))
+
+        def send(batch):
+            values = vecs[[j for j, _, _, _ in batch]].tolist()
+            payload = [(vid, v, meta) for (_, vid, meta, _), v in zip(batch, values)]
+            self._call(self.index.upsert, vectors=payload, **self._ns_kwargs())
+            with self._lock:
+                for _, vid, _, h in batch:
+                    self.known[vid] = h
+                self.stats["upserted"] += len(batch)
+
+        try:
+            self._run([(send, b) for b in self._batches(todo, vecs.shape[1])])
+        except BaseException:
+            self._save()
+            raise
+        if time.monotonic() - self._saved_at >= self.cfg["save_every_s"]:
+            self._save()
+
+    def finish(self) -> Dict:
+        stale = sorted(set(self.known) - self.seen)
+        if stale and self.index is not None:
+            def drop(ids):
+                self._call(self.index.delete, ids=ids, **self._ns_kwargs())
+                with self._lock:
+                    for vid in ids:
+                        self.known.pop(vid, None)
+                    self.stats["deleted"] += len(ids)
+            try:
+                self._run([(drop, stale[i:i + 1000]) for i in range(0, len(stale), 1000)])
+            finally:
+                self._save()
         else:
-            index.upsert(vectors=payload)
+            self._save()
+        return dict(self.stats)
+
+    def _save(self):
+        self._saved_at = time.monotonic()
+        if not self.state_path:
+            return
+        state = {}
+        if self.state_path.exists():
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        state[self.state_key] = self.known
+        tmp = self.state_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+def push_to_pinecone(vecs, chunks: List[Dict], cfg: Dict, index=None, state_path=None) -> Dict:
+    """
+    One-shot delta sync of all chunks: upserts new/changed vectors and deletes removed ones.
+    Without state_path every vector is sent and nothing is deleted.
+    """
+    sync = PineconeSync(cfg, index=index, state_path=state_path)
+    sync.upsert(vecs, chunks)
+    return sync.finish()
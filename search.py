@@ -0,0 +1,46 @@
+import argparse, json, sys
+from pathlib import Path
+
+from modules.retrieval import Retriever, serve
+
+def main():
+    ap = argparse.ArgumentParser(description="Query the indexes built by app.py")
+    ap.add_argument("--config", required=True, help="Path to config JSON (same as app.py)")
+    ap.add_argument("query", nargs="*", help="Query text (omit with --queries-file or --serve)")
+    ap.add_argument("--mode", default="hybrid", choices=["bm25", "tfidf", "dense", "hybrid"])
+    ap.add_argument("-k", type=int, default=10)
+    ap.add_argument("--queries-file", help="One query per line; answered as one batch")
+    ap.add_argument("--dir", help="Read chunks.jsonl, embeddings and indices/ from this directory "
+                                  "(e.g. a batch merged/ output) instead of the config paths")
+    ap.add_argument("--serve", action="store_true", help="Run the local HTTP service")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    if args.dir:
+        work_dir = Path(args.dir); indices_dir = work_dir / "indices"
+    else:
+        work_dir = Path(cfg["paths"]["work_dir"]); indices_dir = Path(cfg["paths"]["indices_dir"])
+    retriever = Retriever(work_dir / "chunks.jsonl", indices_dir, embeddings_dir=work_dir,
+                          embed_cfg=cfg.get("embeddings", {}))
+
+    if args.serve:
+        serve(retriever, args.host, args.port)
+        return
+
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [ln.strip() for ln in f if ln.strip()]
+    else:
+        queries = [" ".join(args.query)] if args.query else []
+    if not queries:
+        ap.error("give a query, --queries-file or --serve")
+
+    for q, hits in zip(queries, retriever.search_batch(queries, args.k, args.mode)):
+        print(json.dumps({"query": q, "results": hits}, ensure_ascii=False))
+    print("Latency:", json.dumps(retriever.latency.summary()), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()